@@ -0,0 +1,341 @@
+import numpy as np
+
+from rules import DEFAULT_RULES
+from strategies.compiled import HIT, STAND, DOUBLE, SPLIT
+
+# Hand statuses
+ACTIVE, STOOD, BUST, BLACKJACK = 0, 1, 2, 3
+# Card values (A = 11) of one deck
+DECK_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11] * 4, dtype=np.int8)
+# Count tags by card value (index 0 and 1 unused)
+HIGH_LOW_TAGS = np.array([0, 0, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1], dtype=np.int64)
+FIVE_ACES_TAGS = np.array([0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, -1], dtype=np.int64)
+
+
+class BatchedTables:
+    """
+    num_tables independent tables, each with one seat and its own shoe, played in lockstep
+    so a policy can be rolled out with array operations instead of a Python call per decision.
+
+    A round starts with deal(bets) and is played with step(actions), one decision for every
+    table still in its round per call. Both return (observation, rewards, done): the
+    observation (see observation()), each table's winnings for rounds that finished in the
+    call (0 elsewhere), and which tables have finished their round. deal only deals at tables
+    that are done, so tables can be restarted as they finish or all together.
+
+    The game is BlackjackRound's: cards are dealt in the same order, the dealer peeks, a two
+    card 21 after a split wins even money, the dealer plays out the hand even when every
+    hand busted and the shoe is reshuffled after the round the cut card comes out in.
+    No insurance is taken. Legal actions follow Player.get_action's double and split rules.
+    """
+    def __init__(self, num_tables, num_decks=6, rules=DEFAULT_RULES, seed=None, shoes=None, cut_indices=None):
+        """
+        :param rules: The table's Rules; surrender and no peek are not supported.
+        :param seed: Seed of the generator that shuffles every shoe.
+        :param shoes: Optional first shoe of each table, an array (num_tables, num_decks * 52) of card
+            values 2..11 (see kernel.card_values), with cut_indices. Later shoes are shuffled.
+        """
+        if rules.surrender is not None or not rules.dealer_peek:
+            raise ValueError("Batched tables do not support surrender or play without peek")
+        self.num_tables = num_tables
+        self.num_decks = num_decks
+        self.rules = rules
+        self.rng = np.random.default_rng(seed)
+        self.shoe_size = num_decks * 52
+        self.shoes = np.zeros((num_tables, self.shoe_size), dtype=np.int8)
+        self.cut_index = np.zeros(num_tables, dtype=np.int64)
+        self.deal_index = np.zeros(num_tables, dtype=np.int64)
+        # Cards the seat has seen this shoe, by value, and the running counts
+        self.seen = np.zeros((num_tables, 12), dtype=np.int64)
+        self.high_low_count = np.zeros(num_tables, dtype=np.int64)
+        self.five_aces_count = np.zeros(num_tables, dtype=np.int64)
+        self.reshuffles = 0
+        if shoes is None:
+            self._new_shoes(np.arange(num_tables))
+        else:
+            self.shoes[:] = shoes
+            self.cut_index[:] = cut_indices
+        self._full = np.bincount(DECK_VALUES, minlength=12) * num_decks
+
+        # double_hard[was split, total], double_soft[was split, total]
+        self._double_hard = np.array(rules.double_hard)
+        self._double_soft = np.array(rules.double_soft)
+
+        # Per hand state; a seat holds up to resplit_till hands. Aces count 1 in hard.
+        shape = (num_tables, max(rules.resplit_till, 1))
+        self.hard = np.zeros(shape, dtype=np.int64)
+        self.aces = np.zeros(shape, dtype=np.int64)
+        self.num_cards = np.zeros(shape, dtype=np.int64)
+        self.first = np.zeros(shape, dtype=np.int8)
+        self.pair = np.zeros(shape, dtype=np.bool_)
+        self.bet = np.zeros(shape)
+        self.status = np.zeros(shape, dtype=np.int8)
+        self.was_split = np.zeros(shape, dtype=np.bool_)
+        self.split_aces = np.zeros(shape, dtype=np.bool_)
+        self.num_hands = np.ones(num_tables, dtype=np.int64)
+        # Hand being played
+        self.current = np.zeros(num_tables, dtype=np.int64)
+        self.hole = np.zeros(num_tables, dtype=np.int8)
+        self.upcard = np.zeros(num_tables, dtype=np.int8)
+        self.dealer_total = np.zeros(num_tables, dtype=np.int64)
+        self.done = np.ones(num_tables, dtype=np.bool_)
+
+    def _new_shoes(self, tables):
+        self.shoes[tables] = self.rng.permuted(np.tile(DECK_VALUES, (len(tables), self.num_decks)), axis=1)
+        # Same placement of the cut card as BlackjackShoe
+        self.cut_index[tables] = self.shoe_size - np.rint(52 * self.rng.uniform(1.2, 2, len(tables))).astype(np.int64)
+        self.deal_index[tables] = 0
+        self.seen[tables] = 0
+        self.high_low_count[tables] = 0
+        self.five_aces_count[tables] = 0
+
+    def _deal(self, tables, visible=True):
+        values = self.shoes[tables, self.deal_index[tables]]
+        self.deal_index[tables] += 1
+        if visible:
+            self._see(tables, values)
+        return values
+
+    def _see(self, tables, values):
+        self.seen[tables, values] += 1
+        self.high_low_count[tables] += HIGH_LOW_TAGS[values]
+        self.five_aces_count[tables] += FIVE_ACES_TAGS[values]
+
+    def _add_card(self, tables, hands, values):
+        ace = values == 11
+        self.hard[tables, hands] += np.where(ace, 1, values)
+        self.aces[tables, hands] += ace
+        self.num_cards[tables, hands] += 1
+
+    def _totals(self, tables, hands):
+        """Best total and softness of each hand."""
+        hard = self.hard[tables, hands]
+        soft = (self.aces[tables, hands] > 0) & (hard + 10 <= 21)
+        return np.where(soft, hard + 10, hard), soft
+
+    def _can_split(self, tables, hands):
+        return ((self.num_cards[tables, hands] == 2) & self.pair[tables, hands] & (self.num_hands[tables] < self.rules.resplit_till)
+                & (self.rules.resplit_aces | ~(self.was_split[tables, hands] & (self.first[tables, hands] == 11))))
+
+    def deal(self, bets):
+        """
+        Start a round at every table that is done, with bets (an array, or one bet for all).
+        :return: (observation, rewards, done); naturals and dealer blackjacks finish at once.
+        """
+        bets = np.broadcast_to(np.asarray(bets, dtype=np.float64), (self.num_tables,))
+        tables = np.flatnonzero(self.done)
+        if (bets[tables] <= 0).any():
+            raise ValueError("Bets must be positive")
+        rewards = np.zeros(self.num_tables)
+        if not tables.size:
+            return self.observation(), rewards, self.done.copy()
+        reshuffle = tables[self.deal_index[tables] > self.cut_index[tables]]
+        if reshuffle.size:
+            self._new_shoes(reshuffle)
+            self.reshuffles += reshuffle.size
+        for array in (self.hard, self.aces, self.num_cards, self.first, self.pair, self.bet, self.status, self.was_split, self.split_aces):
+            array[tables] = 0
+        self.num_hands[tables] = 1
+        self.current[tables] = 0
+        self.bet[tables, 0] = bets[tables]
+
+        # A card to the player, the hole card, the player's second card and the upcard
+        first = self._deal(tables)
+        self._add_card(tables, 0, first)
+        self.first[tables, 0] = first
+        self.hole[tables] = self._deal(tables, visible=False)
+        second = self._deal(tables)
+        self._add_card(tables, 0, second)
+        self.pair[tables, 0] = first == second
+        self.upcard[tables] = self._deal(tables)
+        self.done[tables] = False
+
+        peeked = self.hole[tables].astype(np.int64) + self.upcard[tables] == 21
+        dealer_blackjack = tables[peeked]
+        if dealer_blackjack.size:
+            self._see(dealer_blackjack, self.hole[dealer_blackjack])
+            self.dealer_total[dealer_blackjack] = 21
+            natural, _ = self._totals(dealer_blackjack, 0)
+            rewards[dealer_blackjack] = np.where(natural == 21, 0, -self.bet[dealer_blackjack, 0])
+            self.done[dealer_blackjack] = True
+        self._advance(rewards)
+        return self.observation(), rewards, self.done.copy()
+
+    def step(self, actions):
+        """
+        Play one decision (HIT, STAND, DOUBLE or SPLIT from strategies.compiled) on the current
+        hand of every table that is not done; the actions of done tables are ignored.
+        :return: (observation, rewards, done)
+        """
+        actions = np.broadcast_to(np.asarray(actions, dtype=np.int64), (self.num_tables,))
+        tables = np.flatnonzero(~self.done)
+        actions = actions[tables]
+        if ((actions < HIT) | (actions > SPLIT)).any() or not self.legal_actions()[tables, actions].all():
+            raise ValueError("Illegal action")
+        hands = self.current[tables]
+
+        hit = actions == HIT
+        self._add_card(tables[hit], hands[hit], self._deal(tables[hit]))
+
+        self.status[tables[actions == STAND], hands[actions == STAND]] = STOOD
+
+        double = actions == DOUBLE
+        doubled, doubled_hands = tables[double], hands[double]
+        self.bet[doubled, doubled_hands] *= 2
+        self._add_card(doubled, doubled_hands, self._deal(doubled))
+        self.status[doubled, doubled_hands] = STOOD
+
+        split = actions == SPLIT
+        split_tables, split_hands = tables[split], hands[split]
+        if split_tables.size:
+            new_hands = self.num_hands[split_tables]
+            card = self.first[split_tables, split_hands]
+            for hand_index in (split_hands, new_hands):
+                self.hard[split_tables, hand_index] = np.where(card == 11, 1, card)
+                self.aces[split_tables, hand_index] = card == 11
+                self.num_cards[split_tables, hand_index] = 1
+                self.first[split_tables, hand_index] = card
+                self.was_split[split_tables, hand_index] = True
+                self.split_aces[split_tables, hand_index] = (card == 11) & (not self.rules.hit_split_aces)
+            self.bet[split_tables, new_hands] = self.bet[split_tables, split_hands]
+            self.status[split_tables, new_hands] = ACTIVE
+            self.num_hands[split_tables] += 1
+            # One new card to each hand, the split hand first
+            for hand_index in (split_hands, new_hands):
+                values = self._deal(split_tables)
+                self._add_card(split_tables, hand_index, values)
+                self.pair[split_tables, hand_index] = values == card
+
+        rewards = np.zeros(self.num_tables)
+        self._advance(rewards)
+        return self.observation(), rewards, self.done.copy()
+
+    def _advance(self, rewards):
+        """Settle hands that need no decision and finish the tables whose hands are all played."""
+        while True:
+            tables = np.flatnonzero(~self.done & (self.current < self.num_hands))
+            if not tables.size:
+                break
+            hands = self.current[tables]
+            total, _ = self._totals(tables, hands)
+            status = self.status[tables, hands]
+            active = status == ACTIVE
+            status[active & (total > 21)] = BUST
+            status[active & (total == 21) & (self.num_cards[tables, hands] == 2)] = BLACKJACK
+            # Split aces that cannot draw stand unless they can be split again
+            status[(status == ACTIVE) & self.split_aces[tables, hands] & ~self._can_split(tables, hands)] = STOOD
+            self.status[tables, hands] = status
+            finished = status != ACTIVE
+            if not finished.any():
+                break
+            self.current[tables[finished]] += 1
+        tables = np.flatnonzero(~self.done & (self.current >= self.num_hands))
+        if tables.size:
+            self._dealer_turn(tables)
+            rewards[tables] = self._settle(tables)
+            self.done[tables] = True
+
+    def _dealer_turn(self, tables):
+        self._see(tables, self.hole[tables])
+        hard = np.zeros(len(tables), dtype=np.int64)
+        aces = np.zeros(len(tables), dtype=np.int64)
+        for values in (self.hole[tables], self.upcard[tables]):
+            hard += np.where(values == 11, 1, values)
+            aces += values == 11
+        hit_on_soft_17 = self.rules.hit_on_soft_17
+        while True:
+            soft = (aces > 0) & (hard + 10 <= 21)
+            total = np.where(soft, hard + 10, hard)
+            hits = (total < 17) | ((total == 17) & soft & hit_on_soft_17)
+            if not hits.any():
+                break
+            values = self._deal(tables[hits])
+            hard[hits] += np.where(values == 11, 1, values)
+            aces[hits] += values == 11
+        self.dealer_total[tables] = total
+
+    def _settle(self, tables):
+        """Player winnings of each table, as BlackjackRound._evaluate_round pays them."""
+        dealer_total = self.dealer_total[tables]
+        num_hands = self.num_hands[tables]
+        winnings = np.zeros(len(tables))
+        for hand in range(self.hard.shape[1]):
+            total, _ = self._totals(tables, hand)
+            bet = self.bet[tables, hand]
+            blackjack_payout = np.where(num_hands > 1, bet, np.rint(bet * self.rules.blackjack_payout))
+            payout = np.where(self.status[tables, hand] == BLACKJACK, blackjack_payout,
+                     np.where(total > 21, -bet,
+                     np.where((dealer_total > 21) | (total > dealer_total), bet,
+                     np.where(total < dealer_total, -bet, 0.0))))
+            winnings += np.where(hand < num_hands, payout, 0.0)
+        return winnings
+
+    def legal_actions(self):
+        """(num_tables, 4) mask of the legal HIT, STAND, DOUBLE and SPLIT on each table's current hand."""
+        tables = np.arange(self.num_tables)
+        hands = np.minimum(self.current, self.num_hands - 1)
+        total, soft = self._totals(tables, hands)
+        total = np.minimum(total, 21)
+        was_split = self.was_split[tables, hands].astype(np.int64)
+        split_aces = self.split_aces[tables, hands]
+        can_double = np.where(soft, self._double_soft[was_split, total], self._double_hard[was_split, total])
+        legal = np.zeros((self.num_tables, 4), dtype=np.bool_)
+        legal[:, HIT] = ~split_aces
+        legal[:, STAND] = True
+        legal[:, DOUBLE] = (self.num_cards[tables, hands] == 2) & ~split_aces & can_double
+        legal[:, SPLIT] = self._can_split(tables, hands)
+        legal[self.done] = False
+        return legal
+
+    def decks_left(self):
+        """Decks left in each shoe, rounded as BlackjackShoe.decks_left."""
+        return np.maximum(np.rint((self.num_decks - (self.deal_index + 1) / 52) * 2) / 2, 0.5)
+
+    def observation(self):
+        """
+        Arrays with a row per table describing the current hand and what the seat has seen:
+        total, soft, pair (value of a splittable two card pair, else 0), num_cards, hand (index of
+        the current hand), hands, was_split, upcard, high_low_count, true_count (high-low),
+        five_aces_count, remaining ((num_tables, 10) cards not yet seen, by value 2..11),
+        legal (see legal_actions) and done.
+        """
+        tables = np.arange(self.num_tables)
+        hands = np.minimum(self.current, self.num_hands - 1)
+        total, soft = self._totals(tables, hands)
+        num_cards = self.num_cards[tables, hands]
+        pair = np.where((num_cards == 2) & self.pair[tables, hands], self.first[tables, hands], 0)
+        return {
+            "total": total,
+            "soft": soft,
+            "pair": pair,
+            "num_cards": num_cards,
+            "hand": hands,
+            "hands": self.num_hands.copy(),
+            "was_split": self.was_split[tables, hands],
+            "upcard": self.upcard.copy(),
+            "high_low_count": self.high_low_count.copy(),
+            "true_count": self.high_low_count / self.decks_left(),
+            "five_aces_count": self.five_aces_count.copy(),
+            "remaining": (self._full - self.seen)[:, 2:],
+            "legal": self.legal_actions(),
+            "done": self.done.copy(),
+        }
+
+
+def strategy_actions(strategy, observation):
+    """
+    Actions of a strategy.compiled.CompiledStrategy (basic strategy, no index plays) for a
+    batch of observations, with the same choices Player.get_action makes.
+    """
+    total = np.minimum(observation["total"], 21)
+    up = observation["upcard"]
+    legal = observation["legal"]
+    actions = np.where(observation["soft"], strategy.soft[total, up], strategy.hard[total, up]).astype(np.int64)
+    pair_actions = strategy.pair[observation["pair"], up]
+    play_pair = legal[:, SPLIT] & (pair_actions >= 0)
+    actions = np.where(play_pair, pair_actions, actions)
+    # Soft 18 and up stand when they can't double
+    otherwise = np.where(observation["soft"] & (total >= 18), STAND, HIT)
+    actions = np.where((actions == DOUBLE) & ~legal[:, DOUBLE], otherwise, actions)
+    # Split aces that cannot draw either split again or stand
+    return np.where(legal[:, HIT], actions, np.where(play_pair & (pair_actions == SPLIT), SPLIT, STAND))
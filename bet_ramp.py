@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+
+from stats import RunningStats
+from strategies.deviations import COMPARISONS
+
+
+class CountDistribution:
+    """
+    Per true count outcome distribution of one flat-betting player, in units of the bet:
+    how often each (rounded) true count comes up, and the mean and second moment of the
+    player's result per round there.
+
+    A round's result scales with its initial bet, doubles, splits and insurance included,
+    so the EV and variance of any bet ramp follow from these moments without simulating
+    again: EV = sum f(t) b(t) mean(t), E[X^2] = sum f(t) b(t)^2 second_moment(t).
+    """
+    def __init__(self, true_counts, frequencies, means, second_moments):
+        self.true_counts = np.asarray(true_counts, dtype=np.int64)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.second_moments = np.asarray(second_moments, dtype=np.float64)
+
+    @classmethod
+    def from_count_totals(cls, count_totals, bet):
+        """
+        From house profit statistics per true count, as in main.run's state["count_totals"]
+        or ResultsStore.load_count_totals: true count -> stats.RunningStats.
+
+        :param bet: The flat bet of the run.
+        """
+        true_counts = sorted(count_totals)
+        rounds = np.array([count_totals[count].n for count in true_counts], dtype=np.float64)
+        means = np.array([count_totals[count].mean for count in true_counts], dtype=np.float64)
+        m2 = np.array([count_totals[count].m2 for count in true_counts], dtype=np.float64)
+        # House profit to player result, per unit bet
+        return cls(true_counts, rounds / rounds.sum(), -means / bet, (m2 / rounds + means * means) / bet ** 2)
+
+    @classmethod
+    def from_count_data(cls, count_data, bet):
+        """From Game.play's count data: true count -> list of house profits per round."""
+        return cls.from_count_totals(
+            {count: RunningStats().update(profits) for count, profits in count_data.items() if profits},
+            bet,
+        )
+
+    def bets(self, ramp):
+        """
+        The bet at each true count for a ramp given as a dict of true count -> bet.
+        A count bets the amount for the highest ramp count at or below it, and counts
+        below the whole ramp bet its lowest amount. A bet of 0 sits the round out.
+        """
+        steps = sorted(ramp)
+        bets = np.empty(self.true_counts.size)
+        for i, count in enumerate(self.true_counts.tolist()):
+            below = [step for step in steps if step <= count]
+            bets[i] = ramp[below[-1]] if below else ramp[steps[0]]
+        return bets
+
+    def evaluate(self, ramp, bankroll=None):
+        """
+        Evaluate one ramp (dict of true count -> bet, see bets).
+
+        :return: Dict with ev and sd per round, average_bet, score, n0, di and,
+            with a bankroll, risk_of_ruin.
+        """
+        results = self.evaluate_many([self.bets(ramp)], bankroll)
+        return {name: float(values[0]) for name, values in results.items()}
+
+    def evaluate_many(self, bet_matrix, bankroll=None):
+        """
+        Evaluate many ramps at once.
+
+        :param bet_matrix: One row of bets per ramp, one column per entry of true_counts.
+        :return: Dict of metric -> array with one value per ramp:
+            ev, sd: player result per round,
+            average_bet: mean bet over all rounds (sat out rounds count as 0),
+            score: SCORE, 1e6 (ev / sd)^2, negative when ev is,
+            n0: rounds for the expected win to equal one standard deviation, (sd / ev)^2,
+            di: desirability index, 1000 ev / sd,
+            risk_of_ruin: exp(-2 ev bankroll / sd^2) for a positive ev, else 1.
+        """
+        bets = np.atleast_2d(np.asarray(bet_matrix, dtype=np.float64))
+        ev = bets @ (self.frequencies * self.means)
+        second_moment = (bets * bets) @ (self.frequencies * self.second_moments)
+        variance = np.maximum(second_moment - ev * ev, 0.0)
+        sd = np.sqrt(variance)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(sd > 0, ev / sd, 0.0)
+            n0 = np.where(ev != 0, variance / (ev * ev), math.inf)
+        results = {
+            "ev": ev,
+            "sd": sd,
+            "average_bet": bets @ self.frequencies,
+            "score": 1e6 * ratio * ratio * np.sign(ev),
+            "n0": n0,
+            "di": 1000 * ratio,
+        }
+        if bankroll is not None:
+            risk_of_ruin = np.ones_like(ev)
+            winning = (ev > 0) & (variance > 0)
+            risk_of_ruin[winning] = np.exp(-2 * ev[winning] * bankroll / variance[winning])
+            results["risk_of_ruin"] = risk_of_ruin
+        return results
+
+
+def ramp_from_player(player, true_counts=range(-10, 11)):
+    """
+    A high-low Player's bet spread (Player.bet_ramp) as a dict of true count -> bet,
+    evaluated at each whole true count.
+    """
+    count_system, rules, default = player.bet_ramp()
+    if count_system == "ACE_FIVE":
+        raise ValueError("Ace-five bets depend on the ace-five count, not the high-low true count")
+    ramp = {}
+    for count in true_counts:
+        bet = default
+        for comparison, index, ramp_bet in rules:
+            if COMPARISONS[comparison](count, index):
+                bet = ramp_bet
+                break
+        ramp[count] = bet
+    return ramp
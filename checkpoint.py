@@ -0,0 +1,20 @@
+import os
+import pickle
+
+
+def save_checkpoint(path, state):
+    """
+    Pickle the simulation state to path.
+    The file is written next to the target first and then moved into place,
+    so an interrupted save never leaves a truncated checkpoint behind.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Load a simulation state written by save_checkpoint."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,182 @@
+import copy
+import hashlib
+import json
+import os
+
+from game import Game, BLACKJACKTHREETOTWOPAYOUT
+from player import Player
+from hand import Hand
+from strategies.strategy import StrategyTable
+from strategies.generator import generate_strategy
+from side_bets import SIDE_BETS
+from rules import Rules
+
+# A run configuration is a plain dict so it can live in a JSON or TOML file,
+# be stored in a checkpoint and be hashed to identify a run.
+DEFAULT_CONFIG = {
+    "rules": {
+        "num_decks": 6,
+        "hit_on_soft_17": True,
+        "resplit_till": 4,
+        "blackjack_payout": BLACKJACKTHREETOTWOPAYOUT,
+        # None, "late" or "early"
+        "surrender": None,
+        "double_after_split": True,
+        # "any", "9-11" or "10-11"
+        "double_on": "any",
+        "resplit_aces": True,
+        "hit_split_aces": True,
+        # False for no hole card (ENHC)
+        "dealer_peek": True,
+        "original_bets_only": False,
+        "insurance": True,
+    },
+    "players": [
+        {
+            "name": "Player 1",
+            "strategy": "MULTIDECK",
+            "bankroll": 0,
+            "min_bet": 25,
+            "denominations": 100,
+        }
+    ],
+    "games": 1,
+    "rounds": 100,
+    "seed": None,
+    # Stop early once the house profit per round is known to +/- precision at this confidence
+    "precision": None,
+    "confidence": 0.95,
+    # e.g. [{"name": "777", "stake": 5, "min_true_count": 2}]
+    "side_bets": [],
+    # Record bankrolls during each game: {"points": 50} log-spaced rounds or {"stride": 1000}
+    "bankroll_checkpoints": None,
+    # Deal from a bank written by shoe_bank.build_shoe_bank: {"path": "shoes.npy"}; campaign shards each get their own part
+    "shoe_bank": None,
+}
+
+# Options that change what a run reports but not its results
+OUTPUT_ONLY_KEYS = ("bankroll_checkpoints",)
+# Options added after the results store, hashed only when they differ from DEFAULT_CONFIG
+LATER_KEYS = ("shoe_bank",)
+LATER_RULES = ("surrender", "double_after_split", "double_on", "resplit_aces", "hit_split_aces",
+               "dealer_peek", "original_bets_only", "insurance")
+
+# Table rules generate_strategy assumes; surrender and insurance are decided apart from its tables
+GENERATOR_RULES = {
+    "double_after_split": True,
+    "double_on": "any",
+    "resplit_aces": True,
+    "hit_split_aces": True,
+    "dealer_peek": True,
+}
+
+PLAYER_OPTIONS = [
+    "min_bet",
+    "denominations",
+    "high_low_counting",
+    "ace_five_counting",
+    "playing_deviations",
+    "playing_two_hands_with_high_true_count",
+]
+
+
+def load_config(path=None):
+    """
+    Load a run configuration from a .json or .toml file and fill in the defaults.
+
+    :param path: Path to the configuration file, or None for the defaults.
+    :return: The configuration dict.
+    """
+    config = {}
+    if path is not None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".toml":
+            import tomllib
+            with open(path, "rb") as f:
+                config = tomllib.load(f)
+        elif extension == ".json":
+            with open(path) as f:
+                config = json.load(f)
+        else:
+            raise ValueError(f"Unsupported config format: {path}")
+    return merge_config(config)
+
+
+def merge_config(config):
+    """Return a copy of DEFAULT_CONFIG updated with the values in config."""
+    merged = copy.deepcopy(DEFAULT_CONFIG)
+    for key, value in config.items():
+        if key == "rules":
+            merged["rules"].update(value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def config_hash(config):
+    """
+    Stable hash of a configuration, used to identify runs and results.
+    Output-only options are left out, and so are options added since results were first
+    stored while they have their default values, so older stored runs stay reachable.
+    """
+    hashed = {key: value for key, value in config.items()
+              if key not in OUTPUT_ONLY_KEYS and not (key in LATER_KEYS and value == DEFAULT_CONFIG[key])}
+    if isinstance(config.get("rules"), dict):
+        hashed["rules"] = {key: value for key, value in config["rules"].items()
+                           if not (key in LATER_RULES and value == DEFAULT_CONFIG["rules"][key])}
+    encoded = json.dumps(hashed, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def build_players(config):
+    players = []
+    for i, player_config in enumerate(config["players"], start=1):
+        strategy_name = player_config.get("strategy", "MULTIDECK")
+        if strategy_name == "GENERATED":
+            # Basic strategy computed for the configured rules
+            rules = config["rules"]
+            unmodelled = [key for key, value in GENERATOR_RULES.items() if rules.get(key, value) != value]
+            if unmodelled:
+                raise ValueError(f"The GENERATED strategy cannot be computed with these rules: {', '.join(unmodelled)}")
+            strategy = generate_strategy(rules["num_decks"], rules["hit_on_soft_17"], rules["resplit_till"],
+                                         composition_dependent=player_config.get("composition_dependent", False))
+        elif strategy_name in StrategyTable:
+            strategy = StrategyTable[strategy_name]
+        else:
+            raise ValueError(f"Unknown strategy: {strategy_name}")
+        options = {key: player_config[key] for key in PLAYER_OPTIONS if key in player_config}
+        player = Player(
+            name=player_config.get("name", f"Player {i}"),
+            strategy=strategy,
+            bankroll=player_config.get("bankroll", 0),
+            hands=[Hand()],
+            **options,
+        )
+        players.append(player)
+    return players
+
+
+def build_side_bets(config):
+    side_bets = []
+    for side_bet_config in config.get("side_bets", []):
+        options = dict(side_bet_config)
+        name = options.pop("name")
+        if name not in SIDE_BETS:
+            raise ValueError(f"Unknown side bet: {name}")
+        side_bets.append(SIDE_BETS[name](**options))
+    return side_bets
+
+
+def build_game(config, **kwargs):
+    """
+    Build a Game from a configuration.
+    Extra keyword arguments are passed through to Game.
+    """
+    rules = config["rules"]
+    return Game(
+        num_decks=rules["num_decks"],
+        players=build_players(config),
+        rules=Rules.from_config(rules),
+        side_bets=build_side_bets(config),
+        **kwargs,
+    )
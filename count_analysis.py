@@ -0,0 +1,105 @@
+import numpy as np
+
+from deck import ranks
+
+# Tags per rank, in the order of deck.ranks (A, 2, ..., 10, J, Q, K)
+COUNT_SYSTEMS = {
+    "HIGH_LOW": {"A": -1, "2": 1, "3": 1, "4": 1, "5": 1, "6": 1, "10": -1, "J": -1, "Q": -1, "K": -1},
+    "ACE_FIVE": {"A": -1, "5": 1},
+}
+
+
+def count_tags(system="HIGH_LOW"):
+    """Tag of each rank code for a counting system name or a dict of rank -> tag."""
+    tags = COUNT_SYSTEMS[system] if isinstance(system, str) else system
+    return np.array([tags.get(rank, 0) for rank in ranks], dtype=np.int8)
+
+
+def shuffled_shoes(num_shoes, num_decks, rng):
+    """num_shoes shuffled shoes as rows of rank codes (indices into deck.ranks)."""
+    shoe = np.repeat(np.arange(len(ranks), dtype=np.int8), 4 * num_decks)
+    keys = rng.random((num_shoes, shoe.size), dtype=np.float32)
+    return shoe[np.argsort(keys, axis=1)]
+
+
+def decks_left(cards_dealt, num_decks, policy="game"):
+    """
+    Decks left to divide the running count by, after cards_dealt cards.
+
+    game: BlackjackShoe.decks_left, (deal index + 1) / 52 rounded to the nearest half deck, at least 0.5.
+    exact: remaining cards / 52.
+    half: remaining cards rounded to the nearest half deck, at least 0.5.
+    whole: remaining cards rounded to the nearest deck, at least 1.
+    """
+    cards_dealt = np.asarray(cards_dealt, dtype=np.float64)
+    if policy == "game":
+        return np.maximum(np.rint((num_decks - (cards_dealt + 1) / 52) * 2) / 2, 0.5)
+    remaining = num_decks - cards_dealt / 52
+    if policy == "exact":
+        return remaining
+    elif policy == "half":
+        return np.maximum(np.rint(remaining * 2) / 2, 0.5)
+    elif policy == "whole":
+        return np.maximum(np.rint(remaining), 1.0)
+    raise ValueError(f"Unknown decks left policy: {policy}")
+
+
+def true_count_frequencies(num_decks=6, penetrations=(0.75,), num_shoes=100000, system="HIGH_LOW",
+                           decks_left_policy="game", rounding="round", observe_every=1, batch_size=10000, seed=None):
+    """
+    How often each true count comes up before the cut card, for each penetration,
+    from shuffled card order alone (no hands are played).
+
+    The true count is observed before every observe_every-th card up to the penetration,
+    so with the default every card position counts once; pass the average cards per round
+    to weight by rounds instead.
+
+    :param penetrations: Fractions of the shoe dealt before the shuffle.
+    :param system: Counting system name in COUNT_SYSTEMS or a dict of rank -> tag.
+    :param decks_left_policy: See decks_left.
+    :param rounding: "round" (halves to even, like the game), "floor" or "truncate".
+    :return: Dict of penetration -> dict of true count -> frequency.
+    """
+    rng = np.random.default_rng(seed)
+    tags = count_tags(system)
+    total_cards = 52 * num_decks
+    cutoffs = {penetration: int(round(penetration * total_cards)) for penetration in penetrations}
+    positions = np.arange(0, max(cutoffs.values()), observe_every)
+    divisors = decks_left(positions, num_decks, decks_left_policy)
+
+    histograms = {penetration: {} for penetration in penetrations}
+    done = 0
+    while done < num_shoes:
+        batch = min(batch_size, num_shoes - done)
+        shoes = shuffled_shoes(batch, num_decks, rng)
+        # Running count before each card: cumulative tags of the cards already dealt
+        running = np.zeros((batch, total_cards + 1), dtype=np.int16)
+        np.cumsum(tags[shoes], axis=1, dtype=np.int16, out=running[:, 1:])
+        true_counts = running[:, positions] / divisors
+        if rounding == "round":
+            true_counts = np.rint(true_counts)
+        elif rounding == "floor":
+            true_counts = np.floor(true_counts)
+        elif rounding == "truncate":
+            true_counts = np.trunc(true_counts)
+        else:
+            raise ValueError(f"Unknown rounding: {rounding}")
+        true_counts = true_counts.astype(np.int64)
+        for penetration, cutoff in cutoffs.items():
+            observed = true_counts[:, positions < cutoff]
+            values, counts = np.unique(observed, return_counts=True)
+            histogram = histograms[penetration]
+            for value, count in zip(values.tolist(), counts.tolist()):
+                histogram[value] = histogram.get(value, 0) + count
+        done += batch
+
+    frequencies = {}
+    for penetration, histogram in histograms.items():
+        observations = sum(histogram.values())
+        frequencies[penetration] = {value: histogram[value] / observations for value in sorted(histogram)}
+    return frequencies
+
+
+def frequency_at_least(frequencies, true_count):
+    """Share of observations at or above true_count, from one penetration's frequencies."""
+    return sum(frequency for value, frequency in frequencies.items() if value >= true_count)
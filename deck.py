@@ -4,6 +4,9 @@ from counter import Counter
 suits = ["Clubs", "Diamonds", "Hearts", "Spades"]
 ranks = ["A", "2", "3", "4", "5", "6", "7", "8", 
          "9", "10", "J", "Q", "K"]
+# Card codes: suit index * 13 + rank index, the order create_single_deck builds a deck in
+RANK_INDEX = {rank: i for i, rank in enumerate(ranks)}
+SUIT_INDEX = {suit: i for i, suit in enumerate(suits)}
 
 class Card:
     def __init__(self, rank, suit):
@@ -15,10 +18,14 @@ class Card:
         """
         self.rank = rank
         self.suit = suit
+        self.code = SUIT_INDEX[suit] * 13 + RANK_INDEX[rank]
         
 def create_single_deck():
     """Create a list of (rank, suit) for one standard deck."""
     return [Card(rank, suit) for suit in suits for rank in ranks]
+# Card objects by code, shared by shoes that store their cards as codes
+CARDS_BY_CODE = create_single_deck()
+
 def create_shoe(num_decks=8):
     """Create a shoe composed of num_decks standard decks."""
     shoe = []
@@ -38,9 +45,15 @@ def shuffle_shoe(shoe):
 
 
 class BlackjackShoe:
-    def __init__(self, num_decks=8, penetration=None, counter=Counter()):
+    def __init__(self, num_decks=8, penetration=None, counter=Counter(), cards=None, cut_index=None):
+        """
+        :param cards: Card order to deal from instead of a freshly shuffled shoe.
+        :param cut_index: Where to place the cut card instead of drawing a position.
+        """
         self.num_decks = num_decks
-        if penetration is None:
+        if cut_index is not None:
+            self.cut_index = cut_index
+        elif penetration is None:
             # leftover_decks = 4
             leftover_decks = random.uniform(1.2, 2)
             self.cut_index = num_decks * 52 - round(52 * leftover_decks)
@@ -48,12 +61,19 @@ class BlackjackShoe:
             self.cut_index = 0.75 * num_decks * 52
         # Initialize and shuffle right away
         self.reshuffle_needed = False
-        self.cards = create_shoe(self.num_decks)
+        self.cards = create_shoe(self.num_decks) if cards is None else cards
         # self.cards = shuffle_shoe(self.cards)
         # Place the cut card
         self.deal_index = 0  # How many cards we've dealt so far
         self.counter = counter
 
+    def next_shoe(self):
+        """
+        The shoe that replaces this one at the shuffle. A fresh uniform shuffle here;
+        subclasses can carry cards over from this shoe's discards.
+        """
+        return BlackjackShoe(self.num_decks)
+
     def decks_left(self):
         """
         Return the number of decks left in the shoe.
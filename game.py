@@ -1,19 +1,54 @@
 from deck import BlackjackShoe
 from dealer import Dealer
 from hand import Hand
-from player import Player
+from player import Player, dealer_upcard_value
 from strategies.strategy import StrategyTable
 from round import BlackjackRound
 from collections import defaultdict
-from counter import Counter
 import numpy as np
+from counter import Counter
+from outcomes import OutcomeAccumulator
+from side_bets import SideBetEngine
+from stats import RunningStats
+from strategies.generator import add_card
+from rules import Rules
 
 BLACKJACKTHREETOTWOPAYOUT = 1.5
 BLACKJACKSIXTOFIVEPAYOUT = 1.2
+# Codes of the settled hands in Game.iter_rounds records (-1 for an unused slot)
+HAND_RESULTS = ["LOST", "WON", "PUSH", "BLACKJACK WIN", "SURRENDER"]
+HAND_RESULT_INDEX = {result: i for i, result in enumerate(HAND_RESULTS)}
+
+
+def checkpoint_rounds(rounds, points=50, stride=None):
+    """
+    Round numbers at which to record bankrolls over a game of rounds rounds: about points
+    log-spaced ones from 1 to rounds, or every stride rounds. rounds itself is always included.
+    """
+    if stride is not None:
+        checkpoints = np.arange(stride, rounds + 1, stride, dtype=np.int64)
+        if not checkpoints.size or checkpoints[-1] != rounds:
+            checkpoints = np.append(checkpoints, rounds)
+        return checkpoints
+    return np.unique(np.rint(np.geomspace(1, rounds, points)).astype(np.int64))
+
 
 class Game:
-    def __init__(self, num_decks, players, hit_on_soft_17=True, resplit_till=4, blackjack_payout=BLACKJACKTHREETOTWOPAYOUT, min_bet: int=10, denominations=10):
-        self.shoe = BlackjackShoe(num_decks)
+    def __init__(self, num_decks, players, hit_on_soft_17=True, resplit_till=4, blackjack_payout=BLACKJACKTHREETOTWOPAYOUT, min_bet: int=10, denominations=10, collect_count_data=True, side_bets=None, engine="object", shoe=None, rules=None, bankroll_checkpoints=None):
+        """
+        :param rules: The table's Rules. Without them the table plays the standard rules with
+            hit_on_soft_17, resplit_till and blackjack_payout; with them those three are ignored.
+        :param bankroll_checkpoints: Increasing round numbers (see checkpoint_rounds) after which the
+            players' and the house bankrolls are recorded in self.bankroll_history.
+        """
+        if rules is None:
+            rules = Rules(hit_on_soft_17=hit_on_soft_17, resplit_till=resplit_till, blackjack_payout=blackjack_payout)
+        self.rules = rules
+        hit_on_soft_17, resplit_till, blackjack_payout = rules.hit_on_soft_17, rules.resplit_till, rules.blackjack_payout
+        for player in players:
+            player.rules = rules
+        # Later shoes come from shoe.next_shoe(), so a custom first shoe sets how the game reshuffles
+        self.shoe = BlackjackShoe(num_decks) if shoe is None else shoe
         # self.shoe = BlackjackShoe(num_decks, penetration=0.75)
         self.num_decks = num_decks  # Number of decks in the shoe
         self.num_players = len(players)
@@ -24,73 +59,364 @@ class Game:
         self.min_bet = min_bet
         self.denominations = denominations
         self.house_bankroll = 0
+        # Side bets are settled by their own engine and tracked apart from the house bankroll
+        self.side_bets = SideBetEngine(side_bets) if side_bets else None
+        self.side_bet_bankroll = 0
         self.counter = Counter()
-        self.win_count_matrix = np.zeros((10, 35))
-        self.profit_count_matrix = np.zeros((10, 35))
-        self.total_count_matrix = np.zeros((10, 35))
-        self.total_profit_matrix = np.zeros((10, 35))
+        # Outcomes per (true count, dealer upcard, player state, action)
+        self.outcomes = OutcomeAccumulator()
         self.count_data_collector = defaultdict(list)
+        # Long runs keep their own aggregates instead of every round's profit
+        self.collect_count_data = collect_count_data
+        # Streaming house profit per round, overall and by rounded true count
+        self.round_stats = RunningStats()
+        self.count_stats = defaultdict(RunningStats)
+        # "object" plays rounds through BlackjackRound; "jit" plays whole shoes in the compiled kernel
+        if engine not in ("object", "jit"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if engine == "jit" and not rules.standard_play:
+            raise ValueError("The jit engine only plays the standard rules (no surrender, peek, DAS, doubles on any two cards)")
+        self.engine = engine
+        self._kernel_tables = None
+        # Rounds played and shoes reshuffled over the game's lifetime, for progress reports
+        self.rounds_played = 0
+        self.reshuffles = 0
+        # bankroll_history[i] holds each player's bankroll and then the house's after round bankroll_checkpoints[i]
+        if bankroll_checkpoints is None:
+            self.bankroll_checkpoints = None
+            self.bankroll_history = None
+        else:
+            self.bankroll_checkpoints = np.asarray(bankroll_checkpoints, dtype=np.int64)
+            if len(self.bankroll_checkpoints) and (self.bankroll_checkpoints[0] < 1 or (np.diff(self.bankroll_checkpoints) <= 0).any()):
+                raise ValueError("Bankroll checkpoints must be increasing round numbers from 1")
+            self.bankroll_history = np.full((len(self.bankroll_checkpoints), self.num_players + 1), np.nan)
+        self._next_checkpoint = 0
 
 
         # [TODO] implement total number of splits
 
-    def play(self, games=10, print_round_results=False, print_cards=False):
+    def play(self, games=10, print_round_results=False, print_cards=False, print_summary=True,
+             precision=None, count_precision=None, counts=None, confidence=0.95, chunk_size=100000, telemetry=None):
+        """
+        Play games rounds. Returns the house profit of each round and the profits by true count.
+
+        With precision and/or count_precision the rounds are played in chunks of chunk_size,
+        stopping as soon as the confidence interval of the house profit per round is within
+        +/- precision and, for count_precision, that of every true count in counts is within
+        +/- count_precision. games then caps the number of rounds and may be None.
+        The running estimates are kept in self.round_stats and self.count_stats.
+
+        With a telemetry.Telemetry, a progress record is written after every
+        telemetry.every_rounds rounds (and on its timer) and a final one at the end.
+        """
+        adaptive = precision is not None or count_precision is not None
+        if count_precision is not None and not counts:
+            raise ValueError("count_precision needs the true counts to reach it")
+        if games is None and not adaptive:
+            raise ValueError("games can only be None with a target precision")
+        chunked = adaptive
+        if telemetry is not None:
+            chunk_size = min(chunk_size, telemetry.every_rounds) if adaptive else telemetry.every_rounds
+            chunked = True
+            start = self.rounds_played
+            start_reshuffles = self.reshuffles
+            telemetry.start(lambda: (self.rounds_played - start, self.round_stats, self.reshuffles - start_reshuffles), games)
         data_collector = []
+        played = 0
+        while games is None or played < games:
+            rounds = chunk_size if chunked else games
+            if games is not None:
+                rounds = min(rounds, games - played)
+            if self.engine == "jit":
+                profits, true_counts = self._play_jit(rounds, print_round_results, print_cards)
+            else:
+                profits, true_counts = self._play_rounds(rounds, print_round_results, print_cards)
+            data_collector.extend(profits)
+            self._update_stats(profits, true_counts)
+            played += rounds
+            if telemetry is not None:
+                telemetry.report(played, self.round_stats, self.reshuffles - start_reshuffles)
+            if adaptive and self.precision_met(precision, count_precision, counts, confidence):
+                break
+
+        if telemetry is not None:
+            telemetry.stop()
+        self.outcomes.flush()
+        if print_summary:
+            self.print_summary(played)
+        return data_collector, self.count_data_collector
+
+    def precision_met(self, precision=None, count_precision=None, counts=(), confidence=0.95):
+        """Whether the running estimates are as precise as the targets (see play)."""
+        if precision is not None and self.round_stats.half_width(confidence) > precision:
+            return False
+        if count_precision is not None:
+            for count in counts:
+                if self.count_stats.get(count, RunningStats()).half_width(confidence) > count_precision:
+                    return False
+        return True
+
+    def _update_stats(self, profits, true_counts):
+        profits = np.asarray(profits, dtype=np.float64)
+        self.round_stats.update(profits)
+        # np.rint rounds halves to even like round(), which keys count_data_collector
+        count_keys = np.rint(true_counts).astype(np.int64)
+        for count in np.unique(count_keys).tolist():
+            self.count_stats[count].update(profits[count_keys == count])
+
+    def _play_rounds(self, games, print_round_results, print_cards):
+        profits = []
+        true_counts = []
         # bust = defaultdict(int) # dictionary to keep track of number of times a dealer busts
         # total = defaultdict(int) # dictionary to keep track of number of times a dealer showed a suit
         # blackjacks = 0  # Counter for number of blackjacks in the game
         for _ in range(games):
-            high_low_true_count = self.get_estimated_high_low_true_count()
-            five_aces_true_count = self.get_estimated_five_aces_true_count()
-            if high_low_true_count > 1 and self.players[0].high_low_counting and self.players[0].playing_two_hands_with_high_true_count:
-                # for _ in range(int(high_low_true_count)):
-                # if len(self.players) != self.num_players:
-                #     print(len(self.players))
-                self.players.append(self.players[-1].play_another_hand()) ## play an extra hand if true count is good
-            else:
-                self.players = self.players[:self.num_players]
-            for player in self.players:
-                player.new_hand()
-                player.put_bet_on_initial_hand(high_low_true_count, five_aces_true_count)
-            self.dealer.new_hand()
-            game_round = BlackjackRound(self.shoe, players=self.players, dealer=self.dealer, blackjack_payout=self.blackjack_payout, print_cards=print_cards ,resplit_till=self.resplit_till, counter=self.counter)
-            results = game_round.play_round()
-            self.house_bankroll += game_round.dealer_profit
-            # updating matricies
-            self.win_count_matrix += game_round.win_count_matrix
-            self.profit_count_matrix += game_round.profit_count_matrix
-            self.total_count_matrix += game_round.total_count_matrix
-            self.total_profit_matrix += game_round.total_profit_matrix
-            self.count_data_collector[round(high_low_true_count)].append(game_round.dealer_profit)
-            data_collector.append(game_round.dealer_profit)
-            if self.shoe.reshuffle_needed:
-                # print(self.counter.get_high_low_count())
-                # print(self.shoe.cards[self.shoe.deal_index:])
-                self.counter = Counter()                
-                self.shoe = BlackjackShoe(self.num_decks) 
-            if print_round_results:
-                print("=== Blackjack Round Results ===")
-                for outcome in results:
-                    print(outcome)
+            game_round, high_low_true_count = self.play_round(print_round_results=print_round_results, print_cards=print_cards)
+            profits.append(game_round.dealer_profit)
+            true_counts.append(high_low_true_count)
             # blackjacks += round.blackjack_counter
             # for key, value in round.bust_dict.items():
             #     bust[key] += value
             # for key, value in round.total_dict.items():
             #     total[key] += value
 
-        
+        # print(f"Player Blackjacks: {blackjacks / games}")
+        # print(f"bust percentage for each rank")
+        # for rank in sorted(total.keys()):
+        #     print(f"{rank}: {bust[rank] / total[rank]}")
+        return profits, true_counts
+
+    def _play_jit(self, games, print_round_results, print_cards):
+        """
+        Play games rounds in the compiled kernel, a shoe per call. The shoes, counts,
+        bankrolls and collected data are the same as the object engine's for the same seed;
+        only the outcome tensor is not recorded.
+        Returns the house profit and high-low true count of each round.
+        """
+        # Imported here so numba is only loaded when the jit engine is used
+        from kernel import KernelTables, card_values, play_shoe
+
+        if self.side_bets is not None or print_round_results or print_cards:
+            raise ValueError("The jit engine does not support side bets or printing rounds")
+        if self._kernel_tables is None:
+            self._kernel_tables = KernelTables(self.players)
+        for player in self.players:
+            player.new_hand()
+
+        earnings = np.zeros(len(self.players))
+        profits = np.zeros(games)
+        true_counts = np.zeros(games)
+        played = 0
+        while played < games:
+            counts = np.array([self.counter.high_low_count, self.counter.five_aces_count], dtype=np.int64)
+            position = np.array([self.shoe.deal_index, self.shoe.reshuffle_needed], dtype=np.int64)
+            # With bankroll checkpoints the kernel stops at each one so the bankrolls can be read
+            rounds = games - played
+            if self.bankroll_checkpoints is not None and self._next_checkpoint < len(self.bankroll_checkpoints):
+                rounds = min(rounds, int(self.bankroll_checkpoints[self._next_checkpoint]) - self.rounds_played)
+            rounds = play_shoe(card_values(self.shoe.cards), self.shoe.cut_index, self.num_decks, counts, position, rounds,
+                               self._kernel_tables, self.dealer.hit_on_soft_17, self.resplit_till, self.blackjack_payout,
+                               profits[played:], true_counts[played:], earnings)
+            self.counter.high_low_count, self.counter.five_aces_count = int(counts[0]), int(counts[1])
+            self.shoe.deal_index, self.shoe.reshuffle_needed = int(position[0]), bool(position[1])
+            self._reshuffle_if_needed()
+            self.rounds_played += rounds
+            if self.bankroll_checkpoints is not None:
+                self._settle_jit(profits[played:played + rounds], earnings)
+                self._record_bankrolls()
+            played += rounds
+
+        if self.bankroll_checkpoints is None:
+            self._settle_jit(profits, earnings)
+        profits = profits.tolist()
+        true_counts = true_counts.tolist()
+        if self.collect_count_data:
+            for true_count, profit in zip(true_counts, profits):
+                self.count_data_collector[round(true_count)].append(profit)
+        return profits, true_counts
+
+    def _settle_jit(self, profits, earnings):
+        """Add the kernel's house profits and the players' accumulated earnings to the bankrolls."""
+        self.house_bankroll += sum(profits.tolist())
+        for player, player_earnings in zip(self.players, earnings.tolist()):
+            player.bankroll += player_earnings
+        earnings[:] = 0
+
+    def _record_bankrolls(self):
+        checkpoint = self._next_checkpoint
+        if checkpoint < len(self.bankroll_checkpoints) and self.rounds_played == self.bankroll_checkpoints[checkpoint]:
+            history = self.bankroll_history[checkpoint]
+            for i, player in enumerate(self.players[:self.num_players]):
+                history[i] = player.bankroll
+            history[-1] = self.house_bankroll
+            self._next_checkpoint += 1
+
+    def round_dtype(self):
+        """
+        NumPy dtype of the records yielded by iter_rounds. The per-hand fields have a slot for
+        every hand the table can hold: resplit_till per seat, plus the extra spot played at a high count.
+        """
+        max_hands = (self.num_players + 1) * max(self.resplit_till, 1)
+        return np.dtype([
+            ("round", np.int64),
+            ("high_low_true_count", np.float64),
+            ("five_aces_true_count", np.float64),
+            ("dealer_upcard", np.int8),
+            ("dealer_total", np.int8),
+            ("hands", np.int8),
+            ("seat", np.int8, (max_hands,)),
+            ("bet", np.float64, (max_hands,)),
+            ("result", np.int8, (max_hands,)),
+            ("payout", np.float64, (max_hands,)),
+            ("profit", np.float64),
+            ("side_bet_profit", np.float64),
+            ("reshuffled", np.bool_),
+        ])
+
+    def iter_rounds(self, rounds, batch_size=None):
+        """
+        Play rounds rounds lazily, yielding a record (see round_dtype) per round, or with
+        batch_size a record array of up to batch_size rounds at a time. Each record holds the
+        true counts before the deal, the dealer's upcard value and final total, each hand's seat,
+        final bet, result code (HAND_RESULTS) and payout to the player, the house profit of the
+        round including insurance, the side bet profit and whether the shoe was reshuffled after it.
+
+        Nothing is kept once it is yielded, so memory does not grow with rounds. The bankrolls,
+        outcome tensor and running statistics are updated as in play, also when the consumer stops early.
+        Only the object engine records rounds.
+        """
+        if self.engine != "object":
+            raise ValueError("Only the object engine can record rounds")
+        dtype = self.round_dtype()
+        profits, true_counts = [], []
+        played = 0
+        try:
+            while played < rounds:
+                batch = np.zeros(min(batch_size or 1, rounds - played), dtype=dtype)
+                for record in batch:
+                    self._record_round(record)
+                    profits.append(float(record["profit"]))
+                    true_counts.append(float(record["high_low_true_count"]))
+                played += len(batch)
+                # The running statistics are updated in chunks so single records stay cheap
+                if len(profits) >= 1024:
+                    self._update_stats(profits, true_counts)
+                    profits, true_counts = [], []
+                if batch_size:
+                    yield batch
+                else:
+                    yield batch[0]
+        finally:
+            if profits:
+                self._update_stats(profits, true_counts)
+            self.outcomes.flush()
+
+    def _record_round(self, record):
+        """Play a round into a record of round_dtype."""
+        record["round"] = self.rounds_played
+        record["five_aces_true_count"] = self.get_estimated_five_aces_true_count()
+        reshuffles = self.reshuffles
+        game_round, record["high_low_true_count"] = self.play_round()
+        dealer_hand = self.dealer.hand
+        record["dealer_upcard"] = dealer_upcard_value(dealer_hand.cards[1])
+        record["dealer_total"] = dealer_hand.value
+        seats, bets, results, payouts = record["seat"], record["bet"], record["result"], record["payout"]
+        seats[:] = -1
+        results[:] = -1
+        hands = 0
+        for seat, player in enumerate(self.players):
+            for hand in player.hands:
+                seats[hands] = seat
+                bets[hands] = hand.bet
+                results[hands] = HAND_RESULT_INDEX[hand.hand_status]
+                payouts[hands] = hand.payout
+                hands += 1
+        record["hands"] = hands
+        record["profit"] = game_round.dealer_profit
+        record["side_bet_profit"] = game_round.side_bet_profit
+        record["reshuffled"] = self.reshuffles != reshuffles
+
+    def play_round(self, print_round_results=False, print_cards=False):
+        """
+        Plays a single round at the table and updates the house bankroll,
+        the outcome tensor and the shoe.
+        Returns the finished BlackjackRound and the high-low true count before the deal.
+        """
+        high_low_true_count = self.get_estimated_high_low_true_count()
+        five_aces_true_count = self.get_estimated_five_aces_true_count()
+        # At most one extra spot: the one from the last round is dropped before another is added
+        self.players = self.players[:self.num_players]
+        if high_low_true_count > 1 and self.players[0].high_low_counting and self.players[0].playing_two_hands_with_high_true_count:
+            self.players.append(self.players[-1].play_another_hand()) ## play an extra hand if true count is good
+        for player in self.players:
+            player.new_hand()
+            player.put_bet_on_initial_hand(high_low_true_count, five_aces_true_count)
+        self.dealer.new_hand()
+        first_card_index = self.shoe.deal_index
+        game_round = BlackjackRound(self.shoe, players=self.players, dealer=self.dealer, blackjack_payout=self.blackjack_payout, print_cards=print_cards ,resplit_till=self.resplit_till, counter=self.counter, outcomes=self.outcomes, rules=self.rules)
+        if self.side_bets is not None:
+            game_round.side_bet_profit = self.side_bets.settle(self.players, self.dealer.hand.cards[1], self.shoe.decks_left())
+        results = game_round.play_round()
+        self.rounds_played += 1
+        self.house_bankroll += game_round.dealer_profit
+        if self.bankroll_checkpoints is not None:
+            self._record_bankrolls()
+        if self.side_bets is not None:
+            self.side_bet_bankroll += game_round.side_bet_profit
+            self.side_bets.update_count(self.shoe.cards[first_card_index:self.shoe.deal_index])
+        if self.collect_count_data:
+            self.count_data_collector[round(high_low_true_count)].append(game_round.dealer_profit)
+        # print(self.counter.get_high_low_count())
+        # print(self.shoe.cards[self.shoe.deal_index:])
+        self._reshuffle_if_needed()
+        if print_round_results:
+            print("=== Blackjack Round Results ===")
+            for outcome in results:
+                print(outcome)
+        return game_round, high_low_true_count
+
+    def fast_forward_round(self, seats=None):
+        """
+        Advance the shoe through a round the players sit out, updating only the counts.
+        seats hands (by default one per player) and the dealer each get two cards; the
+        seats hit below 17 and the dealer plays by the table rules. Much cheaper than a
+        played round, for simulating back-counting.
+        Returns the number of cards dealt.
+        """
+        seats = self.num_players if seats is None else seats
+        first_card_index = self.shoe.deal_index
+        for seat in range(seats + 1):
+            dealer = seat == seats
+            total, soft = 0, False
+            cards = 0
+            while cards < 2 or total < 17 or (dealer and total == 17 and soft and self.dealer.hit_on_soft_17):
+                card = self.shoe.deal_card()
+                self.counter.update_count(card)
+                total, soft = add_card(total, soft, dealer_upcard_value(card))
+                cards += 1
+        cards_dealt = self.shoe.deal_index - first_card_index
+        if self.side_bets is not None:
+            self.side_bets.update_count(self.shoe.cards[first_card_index:self.shoe.deal_index])
+        self._reshuffle_if_needed()
+        return cards_dealt
+
+    def _reshuffle_if_needed(self):
+        if self.shoe.reshuffle_needed:
+            self.counter = Counter()
+            self.shoe = self.shoe.next_shoe()
+            self.reshuffles += 1
+            if self.side_bets is not None:
+                self.side_bets.reset()
+
+    def print_summary(self, games):
         print(f"=== Results After {games} Games ===")
         for player in self.players:
             print(f"{player.name}: ${player.bankroll}")
         print(f"House Bankroll: ${self.house_bankroll}")
+        if self.side_bets is not None:
+            print(f"House Side Bet Bankroll: ${self.side_bet_bankroll}")
         print(f"Cards Left: {len(self.shoe.cards) - self.shoe.deal_index}")
         print(f"Decks Left: {self.shoe.decks_left()}")
-        # print(f"Player Blackjacks: {blackjacks / games}")
-        # print(f"bust percentage for each rank")
-        # for rank in sorted(total.keys()):
-        #     print(f"{rank}: {bust[rank] / total[rank]}")
-        return data_collector, self.count_data_collector
-    
 
     def get_estimated_high_low_true_count(self):
         """Implement high low count"""
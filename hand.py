@@ -1,3 +1,4 @@
+from hand_states import BLACKJACK, EMPTY, PAIR, SOFT, STATE_INDEX, TRANSITIONS, VALUE, RANK_VALUES, hand_state
 
 class Hand:
     def __init__(self, cards=None, bet: int=0):
@@ -8,7 +9,8 @@ class Hand:
         # If no initial cards are provided, start with an empty list
         self.cards = cards if cards else []
 
-        # These will be set by self.evaluate() below
+        # These will be set by self.evaluate() below; state indexes hand_states' tables
+        self.state = EMPTY
         self.value = 0
         self.soft = False  # Indicates if at least one Ace is counted as 11
         # Evaluate the hand right away if there are initial cards
@@ -17,53 +19,36 @@ class Hand:
 
         self.bet = bet
         self.hand_status = "ACTIVE"
-        self.matrix_index = set()
+        # (state index, action index) of the first decision made on this hand
+        self.decision = None
         self.double = False
         self.was_split = False
+        # A split ace at a table where split aces get one card only
+        self.split_aces = False
+        # What the player won (negative for a loss) once the round is settled
+        self.payout = 0
     def evaluate(self):
         """
-        Calculates and updates:
+        Works the hand's state out again from its cards and updates:
           - self.value (the best total of the hand)
           - self.soft  (True if at least one Ace is counted as 11)
         
         Returns the computed total for convenience.
         """
-        # Map card ranks to their base values.
-        # Note: We'll treat Aces as 11 initially, then adjust as needed.
-        value_map = {
-            "A": 11, "K": 10, "Q": 10, "J": 10, "10": 10,
-            "9": 9,  "8": 8,  "7": 7,  "6": 6,
-            "5": 5,  "4": 4,  "3": 3,  "2": 2
-        }
+        self._set_state(hand_state(self.cards))
+        return self.value
 
-        total = 0
-        ace_count = 0
-
-        # First pass: Sum all card values, counting A as 11
-        for card in self.cards:
-            total += value_map[card.rank]
-            if card.rank == "A":
-                ace_count += 1
-
-        # Adjust for Aces if we're over 21
-        # Each adjustment turns one Ace from 11 down to 1 (subtract 10)
-        while total > 21 and ace_count > 0:
-            total -= 10
-            ace_count -= 1
-
-        # If we still have at least one Ace counted as 11,
-        # that means we have a "soft" hand
-        self.soft = (ace_count > 0)
-
-        self.value = total
-        return total
+    def _set_state(self, state):
+        self.state = state
+        self.value = VALUE[state]
+        self.soft = SOFT[state]
 
     def add_card(self, card):
         """
-        Adds one card to the hand and re-evaluates the total.
+        Adds one card to the hand and moves it to its next state.
         """
         self.cards.append(card)
-        self.evaluate()
+        self._set_state(TRANSITIONS[self.state][RANK_VALUES[card.rank]])
 
     def is_busted(self):
         """
@@ -78,7 +63,7 @@ class Hand:
         """
         Returns True if the hand contains exactly two cards and has a total of 21.
         """
-        if len(self.cards) == 2 and self.value == 21:
+        if BLACKJACK[self.state]:
             self.hand_status = "BLACKJACK"
             return True
         return False
@@ -95,13 +80,15 @@ class Hand:
     def blackjack_win(self):
         self.hand_status = "BLACKJACK WIN"
 
+    def surrender(self):
+        self.hand_status = "SURRENDER"
+
     def clear(self):
         """
         Clears the hand of all cards and resets value/soft status.
         """
         self.cards = []
-        self.value = 0
-        self.soft = False
+        self._set_state(EMPTY)
         self.insurance_bet = 0
         self.hand_status = "ACTIVE"
         self.bet = 0
@@ -115,46 +102,26 @@ class Hand:
 
     def split(self):
         second_card = self.cards.pop()  # Now 'hand' has just 1 card
+        self.evaluate()
         # Create a new Hand with that second card
         new_hand = Hand([second_card])
         new_hand.bet = self.bet
         new_hand.hand_status = "ACTIVE"
-        new_hand.matrix_index = self.matrix_index.copy()
         self.was_split = True
         new_hand.was_split = True
         return new_hand
     
     def is_pair(self):
-        if len(self.cards) != 2:
-            return False
+        """Two cards of the same rank, or two ten-valued cards."""
+        return PAIR[self.state] != 0
+
+    def get_state_index(self):
+        """
+        Index of the hand's state in the outcome tables:
+        0..15 hard 5..20, 16..24 soft 13..21, 25..34 pairs 2..A
+        """
+        return STATE_INDEX[self.state]
 
-        ranks = [card.rank for card in self.cards]
-        # Check if both are 10/J/Q/K
-        if (ranks[0] in ["10", "J", "Q", "K"] 
-                and ranks[1] in ["10", "J", "Q", "K"]):
-            return True
-        return (ranks[0] == ranks[1])
-    
-    def get_player_matrix_index(self):
-        value_map = {
-            "A": 11, "K": 10, "Q": 10, "J": 10, "10": 10,
-            "9": 9,  "8": 8,  "7": 7,  "6": 6,
-            "5": 5,  "4": 4,  "3": 3,  "2": 2
-        }
-        list = []
-        self.evaluate()
-        if self.is_pair():
-            list.append(int(23 + (value_map[self.cards[0].rank])))
-            if self.cards[0].rank not in ["2", "A"]:
-                list.append(self.value - 5)
-        elif self.soft:
-            list.append(int(15 + (self.value - 12)))
-        else:
-            list.append(self.value - 5)
-        return list
-        
-    def record_index(self):
-        self.matrix_index.update(self.get_player_matrix_index())
     def print_hand(self):
         """
         Prints the hand in a human-readable format, showing:
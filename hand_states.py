@@ -0,0 +1,71 @@
+# Every hand is one of a few hundred states: its hard total (aces counted as 1), whether
+# it holds an ace, its number of cards (0, 1, 2, or 3 and more) and, for one or two cards,
+# the first card's value or the pair's value. The tables below are indexed by state, so
+# adding a card is one lookup and a hand's total, softness and pair never have to be
+# worked out from its cards again.
+
+# Card value of each rank (A = 11)
+RANK_VALUES = {
+    "A": 11, "K": 10, "Q": 10, "J": 10, "10": 10,
+    "9": 9, "8": 8, "7": 7, "6": 6,
+    "5": 5, "4": 4, "3": 3, "2": 2,
+}
+# Hard totals are kept exactly up to here, which covers hitting any total up to 21.
+# No hand draws once it has busted.
+MAX_HARD = 31
+# The empty hand
+EMPTY = 0
+
+
+def _build_states():
+    """Enumerate the states reachable from the empty hand and the transitions between them."""
+    keys = [(0, False, 0, 0)]
+    index = {keys[0]: EMPTY}
+    transitions = []
+    i = 0
+    while i < len(keys):
+        hard, ace, cards, marker = keys[i]
+        # Indexed by card value; 0 and 1 are not card values
+        row = [-1, -1]
+        for value in range(2, 12):
+            if cards == 0:
+                new_marker = value
+            elif cards == 1 and value == marker:
+                new_marker = value
+            else:
+                new_marker = 0
+            key = (min(hard + (1 if value == 11 else value), MAX_HARD), ace or value == 11, min(cards + 1, 3), new_marker)
+            if key not in index:
+                index[key] = len(keys)
+                keys.append(key)
+            row.append(index[key])
+        transitions.append(row)
+        i += 1
+    return keys, transitions
+
+
+_KEYS, TRANSITIONS = _build_states()
+NUM_STATES = len(_KEYS)
+# Best total and softness of each state
+SOFT = [ace and hard + 10 <= 21 for hard, ace, _, _ in _KEYS]
+VALUE = [hard + 10 if soft else hard for (hard, _, _, _), soft in zip(_KEYS, SOFT)]
+# Number of cards, with 3 standing for 3 or more
+CARDS = [cards for _, _, cards, _ in _KEYS]
+# Value of the pair for a two card pair, else 0
+PAIR = [marker if cards == 2 else 0 for _, _, cards, marker in _KEYS]
+BLACKJACK = [cards == 2 and value == 21 for (_, _, cards, _), value in zip(_KEYS, VALUE)]
+# Row of the state in the outcome tables (see Hand.get_state_index)
+STATE_INDEX = [23 + pair if pair else 15 + (value - 12) if soft else value - 5 for pair, soft, value in zip(PAIR, SOFT, VALUE)]
+# Whether the dealer stands (or has busted) in each state, for dealers that stand and hit on soft 17
+DEALER_STANDS = {
+    hit_on_soft_17: [value > 17 or (value == 17 and not (soft and hit_on_soft_17)) for value, soft in zip(VALUE, SOFT)]
+    for hit_on_soft_17 in (False, True)
+}
+
+
+def hand_state(cards):
+    """State of a hand holding cards."""
+    state = EMPTY
+    for card in cards:
+        state = TRANSITIONS[state][RANK_VALUES[card.rank]]
+    return state
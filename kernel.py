@@ -0,0 +1,375 @@
+import numpy as np
+
+from deck import Card, suits, ranks
+from shoe_bank import BankCards
+from player import dealer_upcard_value
+from strategies.compiled import CompiledStrategy, COMPARISON_CODES, HIT, STAND, DOUBLE, SPLIT
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Hand statuses inside the kernel
+ACTIVE, LOST, BLACKJACK_WIN, PUSH = 0, 1, 2, 3
+# Extra action codes, after HIT/STAND/DOUBLE/SPLIT
+BUST, BLACKJACK = 4, 5
+# Name of each action code, as Player.get_action returns it
+TRACE_ACTIONS = ["HIT", "STAND", "DOUBLE", "SPLIT", "BUST", "BLACKJACK"]
+# Bet ramp count systems
+HIGH_LOW, ACE_FIVE, FLAT = 0, 1, 2
+COUNT_SYSTEMS = {"HIGH_LOW": HIGH_LOW, "ACE_FIVE": ACE_FIVE, None: FLAT}
+# Card value (2..11) of each card code
+CODE_VALUES = np.array([dealer_upcard_value(Card(rank, suit)) for suit in suits for rank in ranks], dtype=np.int8)
+
+
+def _jit(function):
+    """Compile with numba when it is installed; otherwise run the same code as plain Python."""
+    if njit is None:
+        return function
+    return njit(cache=True)(function)
+
+
+def card_values(cards):
+    """Card objects as an int8 array of values 2..11 (A = 11)."""
+    if isinstance(cards, BankCards):
+        return CODE_VALUES[cards.codes]
+    return CODE_VALUES[[card.code for card in cards]]
+
+
+class KernelTables:
+    """
+    Everything the kernel needs to know about the players at the table, as arrays
+    with one row per seat: compiled strategy and deviation tables and the bet ramp.
+    """
+    def __init__(self, players):
+        for player in players:
+            if player.playing_two_hands_with_high_true_count:
+                raise ValueError("The jit engine does not support playing two hands with a high true count")
+        compiled = [CompiledStrategy(_strategy_dict(player), _deviations_dict(player)) for player in players]
+        self.hard = np.stack([strategy.hard for strategy in compiled])
+        self.soft = np.stack([strategy.soft for strategy in compiled])
+        self.pair = np.stack([strategy.pair for strategy in compiled])
+        self.deviation_keys = np.stack([strategy.deviation_keys for strategy in compiled])
+        self.deviation_action = np.stack([strategy.deviation_action for strategy in compiled])
+        self.deviation_index = np.stack([strategy.deviation_index for strategy in compiled])
+        self.deviation_comparison = np.stack([strategy.deviation_comparison for strategy in compiled])
+        self.use_deviations = np.array([player.high_low_counting and player.playing_deviations for player in players], dtype=np.bool_)
+
+        ramps = [player.bet_ramp() for player in players]
+        max_rules = max([len(rules) for _, rules, _ in ramps] + [1])
+        self.ramp_system = np.array([COUNT_SYSTEMS[system] for system, _, _ in ramps], dtype=np.int8)
+        self.ramp_length = np.array([len(rules) for _, rules, _ in ramps], dtype=np.int8)
+        self.ramp_default = np.array([bet for _, _, bet in ramps], dtype=np.float64)
+        self.ramp_comparison = np.zeros((len(players), max_rules), dtype=np.int8)
+        self.ramp_index = np.zeros((len(players), max_rules))
+        self.ramp_bet = np.zeros((len(players), max_rules))
+        for seat, (_, rules, _) in enumerate(ramps):
+            for i, (comparison, index, bet) in enumerate(rules):
+                self.ramp_comparison[seat, i] = COMPARISON_CODES[comparison]
+                self.ramp_index[seat, i] = index
+                self.ramp_bet[seat, i] = bet
+
+
+def _strategy_dict(player):
+    return {"PAIR": player.pair_strategy, "SOFT": player.soft_strategy, "HARD": player.hard_strategy}
+
+
+def _deviations_dict(player):
+    return {"PAIR": player.pair_deviations, "TOTAL": player.total_deviations, "SOFT": player.soft_deviations}
+
+
+def play_shoe(cards, cut_index, num_decks, counts, position, max_rounds, tables,
+              hit_on_soft_17, resplit_till, blackjack_payout, profits, true_counts, earnings, trace=None, trace_length=None):
+    """
+    Play rounds from one shoe until the cut card comes out or max_rounds are played,
+    with the same rules, card order and count timing as BlackjackRound.
+
+    :param cards: Card values (card_values of the shoe).
+    :param counts: [high-low, ace-five] running counts, updated in place.
+    :param position: [deal index, reshuffle needed], updated in place.
+    :param profits: Filled with the house profit of each round.
+    :param true_counts: Filled with the high-low true count before each round.
+    :param earnings: Each seat's winnings are added to it.
+    :param trace: Optional (n, 4) int64 array filled with a (round, seat, hand, action code)
+        row per player decision, up to n rows; trace_length ([rows written]) is updated in place.
+    :return: Number of rounds played.
+    """
+    if trace is None:
+        trace = np.zeros((0, 4), dtype=np.int64)
+        trace_length = np.zeros(1, dtype=np.int64)
+    return _play_shoe(cards, cut_index, num_decks, counts, position, max_rounds,
+                      tables.hard, tables.soft, tables.pair, tables.deviation_keys, tables.deviation_action,
+                      tables.deviation_index, tables.deviation_comparison, tables.use_deviations,
+                      tables.ramp_system, tables.ramp_length, tables.ramp_default,
+                      tables.ramp_comparison, tables.ramp_index, tables.ramp_bet,
+                      hit_on_soft_17, resplit_till, blackjack_payout, profits, true_counts, earnings, trace, trace_length)
+
+
+@_jit
+def _decks_left(deal_index, num_decks):
+    # Same rounding as BlackjackShoe.decks_left (round half to even)
+    rounded_decks = np.rint((num_decks - (deal_index + 1) / 52) * 2) / 2
+    if rounded_decks < 0.5:
+        return 0.5
+    return rounded_decks
+
+
+@_jit
+def _deal(cards, cut_index, position):
+    deal_index = position[0]
+    if deal_index >= cards.shape[0]:
+        raise IndexError("Ran out of cards in the shoe")
+    if deal_index >= cut_index:
+        position[1] = 1
+    position[0] = deal_index + 1
+    return cards[deal_index]
+
+
+@_jit
+def _count(counts, value):
+    if value >= 10:
+        counts[0] -= 1
+    elif value <= 6:
+        counts[0] += 1
+    if value == 5:
+        counts[1] += 1
+    elif value == 11:
+        counts[1] -= 1
+
+
+@_jit
+def _total(hard_total, aces):
+    """Best total and softness of a hand whose aces are counted as 1 in hard_total."""
+    if aces > 0 and hard_total + 10 <= 21:
+        return hard_total + 10, True
+    return hard_total, False
+
+
+@_jit
+def _compare(comparison, true_count, index):
+    if comparison == 0:
+        return true_count >= index
+    elif comparison == 1:
+        return true_count > index
+    elif comparison == 2:
+        return true_count <= index
+    return true_count < index
+
+
+@_jit
+def _action(seat, total, soft, pair_value, num_cards, up, true_count, can_split,
+            hard, soft_table, pair, deviation_keys, deviation_action, deviation_index, deviation_comparison, use_deviations):
+    # Mirrors CompiledStrategy.action
+    if total > 21:
+        return BUST
+    if num_cards == 2 and total == 21:
+        return BLACKJACK
+    splittable = num_cards == 2 and pair_value > 0 and can_split
+
+    if use_deviations[seat]:
+        kind = -1
+        if splittable and deviation_keys[seat, 0, total]:
+            kind = 0
+        elif deviation_keys[seat, 1, total]:
+            kind = 1
+        elif soft and deviation_keys[seat, 2, total]:
+            kind = 2
+        if kind >= 0:
+            code = deviation_action[seat, kind, total, up]
+            if code >= 0 and (code != DOUBLE or num_cards == 2) and _compare(deviation_comparison[seat, kind, total, up], true_count, deviation_index[seat, kind, total, up]):
+                return code
+
+    if splittable:
+        code = pair[seat, pair_value, up]
+        if code >= 0:
+            return code
+
+    if soft:
+        code = soft_table[seat, total, up]
+    else:
+        code = hard[seat, total, up]
+    if code == DOUBLE and num_cards != 2:
+        return STAND if soft and total >= 18 else HIT
+    return code
+
+
+@_jit
+def _play_shoe(cards, cut_index, num_decks, counts, position, max_rounds,
+               hard, soft_table, pair, deviation_keys, deviation_action, deviation_index, deviation_comparison, use_deviations,
+               ramp_system, ramp_length, ramp_default, ramp_comparison, ramp_index, ramp_bet,
+               hit_on_soft_17, resplit_till, blackjack_payout, profits, true_counts, earnings, trace, trace_length):
+    num_seats = ramp_system.shape[0]
+    max_hands = max(resplit_till, 1)
+    hand_total = np.zeros((num_seats, max_hands), dtype=np.int64)
+    hand_aces = np.zeros((num_seats, max_hands), dtype=np.int64)
+    hand_cards = np.zeros((num_seats, max_hands), dtype=np.int64)
+    first_card = np.zeros((num_seats, max_hands), dtype=np.int64)
+    second_card = np.zeros((num_seats, max_hands), dtype=np.int64)
+    hand_bet = np.zeros((num_seats, max_hands))
+    hand_status = np.zeros((num_seats, max_hands), dtype=np.int64)
+    num_hands = np.zeros(num_seats, dtype=np.int64)
+    insurance = np.zeros(num_seats)
+
+    rounds = 0
+    while rounds < max_rounds and position[1] == 0:
+        # Bets from the true counts before the deal
+        decks_left = _decks_left(position[0], num_decks)
+        high_low_true_count = counts[0] / decks_left
+        five_aces_true_count = counts[1] / decks_left
+        for seat in range(num_seats):
+            true_count = five_aces_true_count if ramp_system[seat] == ACE_FIVE else high_low_true_count
+            bet = ramp_default[seat]
+            for i in range(ramp_length[seat]):
+                if _compare(ramp_comparison[seat, i], true_count, ramp_index[seat, i]):
+                    bet = ramp_bet[seat, i]
+                    break
+            num_hands[seat] = 1
+            hand_total[seat, 0] = 0
+            hand_aces[seat, 0] = 0
+            hand_cards[seat, 0] = 0
+            hand_bet[seat, 0] = bet
+            hand_status[seat, 0] = ACTIVE
+            insurance[seat] = 0.0
+
+        # One card to each player, then the hole card, then the second cards and the upcard
+        hole = 0
+        up = 0
+        for i in range(2):
+            for seat in range(num_seats):
+                value = _deal(cards, cut_index, position)
+                if i == 0:
+                    first_card[seat, 0] = value
+                else:
+                    second_card[seat, 0] = value
+                hand_total[seat, 0] += 1 if value == 11 else value
+                hand_aces[seat, 0] += value == 11
+                hand_cards[seat, 0] += 1
+                _count(counts, value)
+            if i == 0:
+                hole = _deal(cards, cut_index, position)
+            else:
+                up = _deal(cards, cut_index, position)
+        dealer_hard = (1 if hole == 11 else hole) + (1 if up == 11 else up)
+        dealer_aces = (hole == 11) + (up == 11)
+
+        _count(counts, up)
+        if up == 11:
+            true_count = counts[0] / _decks_left(position[0], num_decks)
+            for seat in range(num_seats):
+                if true_count >= 3.2:
+                    insurance[seat] = hand_bet[seat, 0] / 2
+
+        dealer_total, dealer_soft = _total(dealer_hard, dealer_aces)
+        dealer_blackjack = dealer_total == 21
+        if dealer_blackjack:
+            _count(counts, hole)
+            for seat in range(num_seats):
+                total, soft = _total(hand_total[seat, 0], hand_aces[seat, 0])
+                hand_status[seat, 0] = PUSH if total == 21 else LOST
+        else:
+            for seat in range(num_seats):
+                hand = 0
+                while hand < num_hands[seat]:
+                    while True:
+                        total, soft = _total(hand_total[seat, hand], hand_aces[seat, hand])
+                        pair_value = 0
+                        if hand_cards[seat, hand] == 2 and first_card[seat, hand] == second_card[seat, hand]:
+                            pair_value = first_card[seat, hand]
+                        true_count = counts[0] / _decks_left(position[0], num_decks)
+                        action = _action(seat, total, soft, pair_value, hand_cards[seat, hand], up, true_count,
+                                         num_hands[seat] < resplit_till, hard, soft_table, pair, deviation_keys,
+                                         deviation_action, deviation_index, deviation_comparison, use_deviations)
+                        if trace_length[0] < trace.shape[0]:
+                            row = trace_length[0]
+                            trace[row, 0] = rounds
+                            trace[row, 1] = seat
+                            trace[row, 2] = hand
+                            trace[row, 3] = action
+                            trace_length[0] = row + 1
+                        if action == BUST:
+                            hand_status[seat, hand] = LOST
+                            break
+                        elif action == BLACKJACK:
+                            hand_status[seat, hand] = BLACKJACK_WIN
+                            break
+                        elif action == HIT or action == DOUBLE:
+                            value = _deal(cards, cut_index, position)
+                            hand_total[seat, hand] += 1 if value == 11 else value
+                            hand_aces[seat, hand] += value == 11
+                            hand_cards[seat, hand] += 1
+                            _count(counts, value)
+                            if action == DOUBLE:
+                                hand_bet[seat, hand] *= 2
+                                break
+                        elif action == SPLIT:
+                            value = first_card[seat, hand]
+                            new_hand = num_hands[seat]
+                            num_hands[seat] += 1
+                            card_1 = _deal(cards, cut_index, position)
+                            card_2 = _deal(cards, cut_index, position)
+                            for split_hand, card in ((hand, card_1), (new_hand, card_2)):
+                                first_card[seat, split_hand] = value
+                                second_card[seat, split_hand] = card
+                                hand_total[seat, split_hand] = (1 if value == 11 else value) + (1 if card == 11 else card)
+                                hand_aces[seat, split_hand] = (value == 11) + (card == 11)
+                                hand_cards[seat, split_hand] = 2
+                                hand_status[seat, split_hand] = ACTIVE
+                            hand_bet[seat, new_hand] = hand_bet[seat, hand]
+                            _count(counts, card_1)
+                            _count(counts, card_2)
+                        else:
+                            break
+                    hand += 1
+
+            _count(counts, hole)
+            while True:
+                dealer_total, dealer_soft = _total(dealer_hard, dealer_aces)
+                if dealer_total > 17 or (dealer_total == 17 and not (dealer_soft and hit_on_soft_17)):
+                    break
+                value = _deal(cards, cut_index, position)
+                dealer_hard += 1 if value == 11 else value
+                dealer_aces += value == 11
+                _count(counts, value)
+                dealer_total, dealer_soft = _total(dealer_hard, dealer_aces)
+                if dealer_total > 21:
+                    break
+
+        # Settle in the same order as BlackjackRound._evaluate_round
+        dealer_bust = dealer_total > 21
+        dealer_earnings = 0.0
+        for seat in range(num_seats):
+            player_earnings = 0.0
+            for hand in range(num_hands[seat]):
+                total, soft = _total(hand_total[seat, hand], hand_aces[seat, hand])
+                bet = hand_bet[seat, hand]
+                payout = 0.0
+                status = hand_status[seat, hand]
+                if status == LOST:
+                    payout -= bet
+                elif status == BLACKJACK_WIN:
+                    if num_hands[seat] > 1:
+                        payout += bet
+                    else:
+                        payout += np.rint(bet * blackjack_payout)
+                elif status == ACTIVE:
+                    if total > 21:
+                        payout -= bet
+                    elif dealer_bust or total > dealer_total:
+                        payout += bet
+                    elif total < dealer_total:
+                        payout -= bet
+                player_earnings += payout
+                dealer_earnings -= payout
+            if insurance[seat] > 0:
+                if dealer_blackjack:
+                    player_earnings += insurance[seat] * 2
+                    dealer_earnings -= insurance[seat] * 2
+                else:
+                    player_earnings -= insurance[seat]
+                    dealer_earnings += insurance[seat]
+            earnings[seat] += player_earnings
+        profits[rounds] = dealer_earnings
+        true_counts[rounds] = high_low_true_count
+        rounds += 1
+    return rounds
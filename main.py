@@ -1,70 +1,261 @@
-from deck import BlackjackShoe
-from dealer import Dealer
-from round import BlackjackRound
-from hand import Hand
-from game import Game, BLACKJACKSIXTOFIVEPAYOUT, BLACKJACKTHREETOTWOPAYOUT
-from strategies.strategy import StrategyTable
-import seaborn as sns
-import numpy as np
+import argparse
+import os
+import random
+from collections import defaultdict
 
-if __name__ == "__main__":
-    # game = Game(8, num_players=1, strategy=StrategyTable["MULTIDECK"], hit_on_soft_17=True, blackjack_payout=BLACKJACKTHREETOTWOPAYOUT, min_bet=10, denominations=10, player_bankroll=0)
-    # data = game.play(100000, print_cards=False)
-
-    # print(sns.displot(data, kind="kde"))
-
-    rounds = []
-    rounds_count = []
-    games = []
-    num_players = 1
-    num_games = 1
-    bet_size = 25
-    num_rounds = 100
-    win_count_matrix = np.zeros((10, 35))
-    profit_count_matrix = np.zeros((10, 35))
-    total_count_matrix = np.zeros((10, 35))
-    total_profit_matrix = np.zeros((10, 35))
-
-    for _ in range(num_games):
-        game = Game(num_decks=6, num_players=num_players, strategy=StrategyTable["MULTIDECK"], hit_on_soft_17=True, blackjack_payout=BLACKJACKTHREETOTWOPAYOUT, min_bet=bet_size, denominations=100, player_bankroll=0, resplit_till=4)
-        for player in game.players:
-            player.ace_five_counting = True
-            player.high_low_counting = False
-        round_data, round_count_data = game.play(num_rounds, print_cards=False, print_round_results=False)
-        rounds_count.extend(round_count_data)
-        rounds.extend(round_data)
-        games.append(game.house_bankroll)
-        win_count_matrix += game.win_count_matrix
-        profit_count_matrix += game.profit_count_matrix
-        total_count_matrix += game.total_count_matrix
-        total_profit_matrix += game.total_profit_matrix
-
-    # win_percentage_matrix = np.divide(win_count_matrix, total_count_matrix, out=np.zeros_like(win_count_matrix), where=total_count_matrix != 0)
-    # print(win_percentage_matrix[:, 17:25])
-    # print("total_profit_matrix")
-    # for row in total_profit_matrix:
-    #     print(" ".join(f"{value:2.0f}" for value in row))
-    # print(total_profit_matrix[:, 24])
-    # print("profit_count_matrix")
-    # for row in profit_count_matrix:
-    #     print(" ".join(f"{value:2.0f}" for value in row))
-    # print(profit_count_matrix[:, 24])
-
-    sum = 0
-    wins = 0
-    losses = 0
-    pushes = 0
-    for g in rounds:
-        print(rounds_count)
-        if g > 0:
-            wins += 1
-        elif g < 0:
-            losses += 1
+from config import load_config, build_game
+from checkpoint import save_checkpoint, load_checkpoint
+from outcomes import OutcomeAccumulator
+from game import checkpoint_rounds
+from shoe_bank import BankShoe, ShoeBank
+from stats import RunningStats, quantile_bands
+from results_store import ResultsStore
+from telemetry import Telemetry
+
+# Rounds between checks of the precision target
+PRECISION_CHECK_EVERY = 10000
+
+
+def new_state(config):
+    """Fresh simulation state for a configuration."""
+    return {
+        "config": config,
+        "game_index": 0,
+        "rounds_done": 0,
+        "game": None,
+        "game_results": [],
+        # House profit per round, overall and by rounded true count
+        "totals": RunningStats(),
+        "count_totals": defaultdict(RunningStats),
+        # Outcomes per (true count, upcard, player state, action) over finished games
+        "outcomes": OutcomeAccumulator(),
+        "random_state": None,
+        # Set once the precision target is met; the run then ends after the current game
+        "converged": False,
+        "reshuffles": 0,
+        # Each game's bankroll_history, with bankroll_checkpoints in the configuration
+        "bankroll_histories": [],
+    }
+
+
+def run(state, checkpoint_path=None, checkpoint_every=100000, print_round_results=False, print_cards=False, telemetry=None):
+    """
+    Play every game of the configuration, resuming from state.
+    The state is checkpointed every checkpoint_every rounds and after each game.
+    With a precision in the configuration, the run stops as soon as the house
+    profit per round is known to within it.
+    With a telemetry.Telemetry, progress is reported every telemetry.every_rounds rounds.
+    """
+    config = state["config"]
+    precision = config.get("precision")
+    confidence = config.get("confidence", 0.95)
+    if state["random_state"] is not None:
+        random.setstate(state["random_state"])
+    elif config["seed"] is not None:
+        random.seed(config["seed"])
+
+    totals = state["totals"]
+    count_totals = state["count_totals"]
+    checkpoints = bankroll_checkpoints(config)
+    if telemetry is not None:
+        # Progress counts the rounds this call plays, not those of a resumed checkpoint
+        start_rounds, _, start_reshuffles = _progress(state)
+        telemetry.start(lambda: _progress(state, start_rounds, start_reshuffles), config["games"] * config["rounds"] - start_rounds)
+    while state["game_index"] < config["games"] and not state.get("converged"):
+        if state["game"] is None:
+            state["game"] = build_game(config, collect_count_data=False, bankroll_checkpoints=checkpoints, shoe=bank_shoe(config, state))
+            state["rounds_done"] = 0
+        game = state["game"]
+        while state["rounds_done"] < config["rounds"]:
+            game_round, high_low_true_count = game.play_round(print_round_results=print_round_results, print_cards=print_cards)
+            profit = game_round.dealer_profit
+            totals.add(profit)
+            count_totals[round(high_low_true_count)].add(profit)
+            state["rounds_done"] += 1
+            if precision is not None and totals.n % PRECISION_CHECK_EVERY == 0:
+                if totals.half_width(confidence) <= precision:
+                    state["converged"] = True
+                    break
+            if checkpoint_path and state["rounds_done"] % checkpoint_every == 0:
+                _checkpoint(checkpoint_path, state)
+            if telemetry is not None and (totals.n - start_rounds) % telemetry.every_rounds == 0:
+                telemetry.report(*_progress(state, start_rounds, start_reshuffles))
+
+        game.outcomes.flush()
+        game.print_summary(state["rounds_done"])
+        state["outcomes"].merge(game.outcomes)
+        state["game_results"].append(game.house_bankroll)
+        if game.bankroll_history is not None:
+            state.setdefault("bankroll_histories", []).append(game.bankroll_history)
+        state["reshuffles"] = state.get("reshuffles", 0) + game.reshuffles
+        if isinstance(game.shoe, BankShoe):
+            # The next game picks up the bank where this one left off
+            state["bank_index"] = game.shoe.index + 1
+        state["game_index"] += 1
+        state["game"] = None
+        if checkpoint_path:
+            _checkpoint(checkpoint_path, state)
+    if telemetry is not None:
+        telemetry.stop()
+    return state
+
+
+def bank_shoe(config, state):
+    """The first shoe of the next game with a shoe_bank in the configuration, or None."""
+    spec = config.get("shoe_bank")
+    if not spec:
+        return None
+    bank = ShoeBank(spec["path"])
+    if "partition" in spec:
+        bank = bank.partition(*spec["partition"])
+    return bank.shoe(state.get("bank_index", 0))
+
+
+def bankroll_checkpoints(config):
+    """The rounds at which each game records bankrolls, or None."""
+    spacing = config.get("bankroll_checkpoints")
+    if not spacing:
+        return None
+    return checkpoint_rounds(config["rounds"], **spacing)
+
+
+def _progress(state, start_rounds=0, start_reshuffles=0):
+    """(rounds, house profit stats, reshuffles) of a run since start_rounds and start_reshuffles, for telemetry."""
+    game = state["game"]
+    reshuffles = state.get("reshuffles", 0) + (game.reshuffles if game is not None else 0)
+    return state["totals"].n - start_rounds, state["totals"], reshuffles - start_reshuffles
+
+
+def _checkpoint(path, state):
+    state["random_state"] = random.getstate()
+    save_checkpoint(path, state)
+
+
+def resume(path):
+    return load_checkpoint(path)
+
+
+def print_report(state):
+    totals = state["totals"]
+    confidence = state["config"].get("confidence", 0.95)
+    print(f"=== Results After {state['game_index']} Games, {totals.n} Rounds ===")
+    print(f"House Bankroll per Game: {state['game_results']}")
+    print(f"House Profit per Round: ${totals.mean:.4f} +/- {totals.half_width(confidence):.4f} ({confidence:.0%} CI)")
+    print("House Profit per Round by True Count:")
+    for count in sorted(state["count_totals"]):
+        count_stats = state["count_totals"][count]
+        print(f"Count: {count}, Rounds: {count_stats.n}, Profit: ${count_stats.mean:.4f} +/- {count_stats.half_width(confidence):.4f}")
+    if state.get("bankroll_histories"):
+        # House bankroll at the last checkpoint across games
+        bands = quantile_bands(state["bankroll_histories"])[:, -1, -1]
+        print(f"House Bankroll Percentiles (5/25/50/75/95) After {state['config']['rounds']} Rounds: {', '.join(f'${band:.0f}' for band in bands)}")
+
+
+def plot_bankroll_bands(state, path, column=-1):
+    """
+    Save a plot of the 5-95% and 25-75% bands and the median of a bankroll (by default the
+    house's; i for the i-th player) across games against rounds played. Imports matplotlib only when called.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    rounds = bankroll_checkpoints(state["config"])
+    bands = quantile_bands(state["bankroll_histories"])[:, :, column]
+    plt.figure(figsize=(10, 6))
+    plt.fill_between(rounds, bands[0], bands[4], alpha=0.2, label='5-95%')
+    plt.fill_between(rounds, bands[1], bands[3], alpha=0.4, label='25-75%')
+    plt.plot(rounds, bands[2], label='Median')
+    plt.xscale('log')
+    plt.xlabel('Rounds')
+    plt.ylabel('Bankroll')
+    plt.title(f'Bankroll Across {len(state["bankroll_histories"])} Games')
+    plt.legend()
+    plt.grid(linestyle='--', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path)
+
+
+def plot_count_edges(state, path):
+    """Save a bar chart of the player edge per true count. Imports matplotlib only when called."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    counts = sorted(state["count_totals"])
+    edges = [-state["count_totals"][c].mean for c in counts]  ## house edge to player edge
+    plt.figure(figsize=(10, 6))
+    plt.bar(counts, edges, edgecolor='black', alpha=0.7)
+    plt.xlabel('True Count')
+    plt.ylabel('Average Player Profit per Round')
+    plt.title('Average Player Edge by True Count')
+    plt.grid(axis='y', linestyle='--', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate blackjack rounds to find EV.")
+    parser.add_argument("config", nargs="?", help="run configuration (.json or .toml)")
+    parser.add_argument("--rounds", type=int, help="rounds per game, overrides the config")
+    parser.add_argument("--games", type=int, help="number of games, overrides the config")
+    parser.add_argument("--seed", type=int, help="random seed, overrides the config")
+    parser.add_argument("--precision", type=float, help="stop once the house profit per round is known to +/- this")
+    parser.add_argument("--checkpoint", help="checkpoint file to write periodically")
+    parser.add_argument("--checkpoint-every", type=int, default=100000, help="rounds between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from --checkpoint if it exists")
+    parser.add_argument("--plot", help="save a per true count edge plot to this file")
+    parser.add_argument("--plot-bankroll", help="save percentile bands of the house bankroll across games to this file")
+    parser.add_argument("--store", help="SQLite results store; configurations already in it are not simulated again")
+    parser.add_argument("--refresh", action="store_true", help="simulate even if the store has the configuration")
+    parser.add_argument("--telemetry", help="append JSON lines progress records to this file")
+    parser.add_argument("--telemetry-socket", help="send JSON lines progress records to this Unix socket")
+    parser.add_argument("--telemetry-every", type=int, default=100000, help="rounds between progress records")
+    parser.add_argument("--telemetry-interval", type=float, help="also send a progress record every this many seconds")
+    parser.add_argument("--print-cards", action="store_true")
+    parser.add_argument("--print-round-results", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.resume and args.checkpoint and os.path.exists(args.checkpoint):
+        state = resume(args.checkpoint)
+        print(f"Resuming game {state['game_index'] + 1} at round {state['rounds_done']}")
+    else:
+        config = load_config(args.config)
+        for key in ("rounds", "games", "seed", "precision"):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+        if args.plot_bankroll and not config["bankroll_checkpoints"]:
+            config["bankroll_checkpoints"] = {"points": 50}
+        state = new_state(config)
+
+    store = ResultsStore(args.store) if args.store else None
+    if store is not None and not args.refresh and store.has_run(state["config"]):
+        print(f"Loaded results from {args.store}")
+        state = store.load_run(state["config"])
+    else:
+        telemetry = None
+        if args.telemetry or args.telemetry_socket:
+            telemetry = Telemetry(args.telemetry, args.telemetry_socket, every_rounds=args.telemetry_every,
+                                  interval=args.telemetry_interval, confidence=state["config"].get("confidence", 0.95))
+        run(state, checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every,
+            print_round_results=args.print_round_results, print_cards=args.print_cards, telemetry=telemetry)
+        if store is not None:
+            store.save_run(state)
+    if store is not None:
+        store.close()
+    print_report(state)
+    if args.plot:
+        plot_count_edges(state, args.plot)
+    if args.plot_bankroll:
+        if state.get("bankroll_histories"):
+            plot_bankroll_bands(state, args.plot_bankroll)
         else:
-            pushes += 1
-        sum += g
-    print(sum)
+            print("No bankroll checkpoints were recorded for this run")
+    return state
 
-    print(sum / num_players / num_games / num_rounds)
-    print(f"Wins: {wins / num_rounds}, Losses: {losses / num_rounds}, Pushes: {pushes / num_rounds}")
-    print()
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
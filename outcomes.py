@@ -0,0 +1,126 @@
+import numpy as np
+from statistics import NormalDist
+
+# Axes of the outcome tensor
+MIN_TRUE_COUNT = -10
+MAX_TRUE_COUNT = 10
+NUM_TRUE_COUNTS = MAX_TRUE_COUNT - MIN_TRUE_COUNT + 1
+# Dealer upcard index: 2..10 -> 0..8, A -> 9
+NUM_UPCARDS = 10
+# Player state index from Hand.get_state_index:
+# 0..15 hard 5..20, 16..24 soft 13..21, 25..34 pairs 2..A
+NUM_STATES = 35
+# "NONE" is recorded for hands that never acted because the dealer had blackjack
+ACTIONS = ["HIT", "STAND", "DOUBLE", "SPLIT", "BLACKJACK", "NONE", "SURRENDER"]
+ACTION_INDEX = {action: i for i, action in enumerate(ACTIONS)}
+NUM_ACTIONS = len(ACTIONS)
+
+SHAPE = (NUM_TRUE_COUNTS, NUM_UPCARDS, NUM_STATES, NUM_ACTIONS)
+
+
+def true_count_index(true_count):
+    """Bucket a true count into its index on the true count axis, clipping at the ends."""
+    bucket = min(max(round(true_count), MIN_TRUE_COUNT), MAX_TRUE_COUNT)
+    return bucket - MIN_TRUE_COUNT
+
+
+def upcard_index(card):
+    """Index of the dealer upcard on the upcard axis."""
+    if card.rank == 'A':
+        return 9
+    elif card.rank in ['10', 'J', 'Q', 'K']:
+        return 8
+    return int(card.rank) - 2
+
+
+class OutcomeAccumulator:
+    """
+    Accumulates hand outcomes keyed by (true count, dealer upcard, player state, action).
+
+    Outcomes are buffered as flat indices and values and flushed in batches with
+    np.bincount. Each cell tracks the number of outcomes, their sum, their sum of
+    squares and the number of wins (pushes count as half a win), so win rates, EV
+    and confidence intervals per cell all come from one pass.
+    Values are in units of the hand's initial bet.
+    """
+    def __init__(self, buffer_size=8192):
+        self.buffer_size = buffer_size
+        size = int(np.prod(SHAPE))
+        self.count = np.zeros(size)
+        self.total = np.zeros(size)
+        self.total_sq = np.zeros(size)
+        self.wins = np.zeros(size)
+        self._indices = []
+        self._values = []
+
+    def record(self, true_count_idx, upcard_idx, state_idx, action_idx, value):
+        index = ((true_count_idx * NUM_UPCARDS + upcard_idx) * NUM_STATES + state_idx) * NUM_ACTIONS + action_idx
+        self._indices.append(index)
+        self._values.append(value)
+        if len(self._indices) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Add the buffered outcomes to the accumulated totals."""
+        if not self._indices:
+            return
+        size = self.count.size
+        indices = np.asarray(self._indices, dtype=np.intp)
+        values = np.asarray(self._values, dtype=float)
+        self.count += np.bincount(indices, minlength=size)
+        self.total += np.bincount(indices, weights=values, minlength=size)
+        self.total_sq += np.bincount(indices, weights=values * values, minlength=size)
+        self.wins += np.bincount(indices, weights=(values > 0) + 0.5 * (values == 0), minlength=size)
+        self._indices = []
+        self._values = []
+
+    def merge(self, other):
+        """Add the outcomes of another accumulator into this one."""
+        self.flush()
+        other.flush()
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.wins += other.wins
+        return self
+
+    def _reduce(self, true_count=None, action=None, axes=(0, 3)):
+        """
+        Sum the accumulated arrays over axes, optionally keeping only one
+        true count bucket or one action first.
+        """
+        self.flush()
+        arrays = []
+        for array in (self.count, self.total, self.total_sq, self.wins):
+            array = array.reshape(SHAPE)
+            if true_count is not None:
+                array = array[true_count_index(true_count)][np.newaxis]
+            if action is not None:
+                array = array[..., ACTION_INDEX[action]][..., np.newaxis]
+            arrays.append(array.sum(axis=axes) if axes else array)
+        return arrays
+
+    def ev(self, true_count=None, action=None, axes=(0, 3)):
+        """
+        Mean outcome per cell. By default cells are collapsed over true counts and
+        actions into the (upcard, player state) layout used by the heatmaps;
+        pass axes=() for the full tensor.
+        """
+        count, total, _, _ = self._reduce(true_count, action, axes)
+        return np.divide(total, count, out=np.zeros_like(total), where=count != 0)
+
+    def win_rate(self, true_count=None, action=None, axes=(0, 3)):
+        count, _, _, wins = self._reduce(true_count, action, axes)
+        return np.divide(wins, count, out=np.zeros_like(wins), where=count != 0)
+
+    def confidence_interval(self, confidence=0.95, true_count=None, action=None, axes=(0, 3)):
+        """Normal approximation confidence interval (lower, upper) of the EV per cell."""
+        count, total, total_sq, _ = self._reduce(true_count, action, axes)
+        mean = np.divide(total, count, out=np.zeros_like(total), where=count != 0)
+        variance = np.divide(total_sq - count * mean * mean, count - 1, out=np.full_like(total, np.inf), where=count > 1)
+        std_error = np.sqrt(np.maximum(variance, 0) / np.maximum(count, 1))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return mean - z * std_error, mean + z * std_error
+
+    def counts(self, true_count=None, action=None, axes=(0, 3)):
+        return self._reduce(true_count, action, axes)[0]
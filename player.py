@@ -1,11 +1,13 @@
 from hand import Hand
+from rules import DEFAULT_RULES
+from strategies.deviations import DEVIATIONS_DICT, COMPARISONS
 import copy
 
 class Player:
     """
     A Blackjack Player with a specific strategy.
     """
-    def __init__(self, name, strategy, bankroll, hands=[Hand()], min_bet=10, denominations=10, high_low_counting=False, ace_five_counting=False, playing_deviations=False, playing_two_hands_with_high_true_count=False):
+    def __init__(self, name, strategy, bankroll, hands=[Hand()], min_bet=10, denominations=10, high_low_counting=False, ace_five_counting=False, playing_deviations=False, playing_two_hands_with_high_true_count=False, deviations=DEVIATIONS_DICT):
         """
         :param name: A string to identify this player
         :param strategy: An object implementing .get_action(hand, dealer_card)
@@ -15,6 +17,9 @@ class Player:
         self.pair_strategy = strategy["PAIR"]
         self.soft_strategy = strategy["SOFT"]
         self.hard_strategy = strategy["HARD"]
+        self.pair_deviations = deviations["PAIR"]
+        self.total_deviations = deviations["TOTAL"]
+        self.soft_deviations = deviations["SOFT"]
         self.high_low_counting = high_low_counting
         self.ace_five_counting = ace_five_counting
         self.playing_deviations = playing_deviations
@@ -23,6 +28,8 @@ class Player:
         self.min_bet = min_bet
         self.denominations = denominations
         self.insurance_bet = 0
+        # The table's Rules, set by the Game the player sits at
+        self.rules = DEFAULT_RULES
 
     def play_another_hand(self):
         name = self.name + "_" + "+TC"
@@ -47,22 +54,45 @@ class Player:
         # Dealer upcard as integer (2..11)
         up_val = dealer_upcard_value(dealer_card)
 
+        if hand.split_aces:
+            # Split aces that cannot draw stand, unless they can be split again
+            if len(hand.cards) == 2 and hand.is_pair() and self._can_split(hand, resplit_till) and self._pair_action(hand, up_val) == "SPLIT":
+                return "SPLIT"
+            return "STAND"
+
+        rules = self.rules
         if self.high_low_counting and self.playing_deviations:
             action = self._deviations(hand, up_val, resplit_till, true_count)
+            if action == "DOUBLE" and not (len(hand.cards) == 2 and (rules.double_soft if hand.soft else rules.double_hard)[hand.was_split][hand.value]):
+                # A double the table doesn't allow falls back to the strategy without doubling
+                action = None
             if action:
                 return action
         # If 2 cards and pair
-        if len(hand.cards) == 2 and hand.is_pair() and len(self.hands) < resplit_till:
+        if len(hand.cards) == 2 and hand.is_pair() and self._can_split(hand, resplit_till):
             action = self._pair_action(hand, up_val)
             if action:
                 return action  # if the strategy says "Split" or "Stand" or something
 
         # If hand is soft
         if hand.soft:
-            return self._soft_action(hand.value, up_val, can_double=(len(hand.cards)==2))
+            return self._soft_action(hand.value, up_val, can_double=(len(hand.cards)==2 and rules.double_soft[hand.was_split][hand.value]))
 
         # Otherwise, hard
-        return self._hard_action(hand.value, up_val, can_double=(len(hand.cards)==2))
+        return self._hard_action(hand.value, up_val, can_double=(len(hand.cards)==2 and rules.double_hard[hand.was_split][hand.value]))
+
+    def _can_split(self, hand, resplit_till):
+        """Whether the table lets a pair be split (again)."""
+        return len(self.hands) < resplit_till and (self.rules.resplit_aces or not hand.was_split or hand.cards[0].rank != "A")
+
+    def surrenders(self, hand, dealer_card):
+        """Basic strategy surrender of a first two card hand, for the table's surrender rule."""
+        up_val = dealer_upcard_value(dealer_card)
+        if hand.is_pair():
+            return dealer_upcard_value(hand.cards[0]) in self.rules.surrender_pairs.get(up_val, ())
+        if hand.soft:
+            return False
+        return hand.value in self.rules.surrender_hard.get(up_val, ())
 
 
     def _pair_action(self, hand, dealer_up_val):
@@ -134,13 +164,15 @@ class Player:
         # Some entries have 'ALL' = 'H' or 'S'
         if 'ALL' in rule:
             action_code = rule['ALL']
-            return self._interpret_action_code(action_code, can_double)
-
-        # If there's no single 'ALL' rule, we check up_val
-        action_code = rule.get(dealer_up_val)
-        if action_code is None:
-            action_code = rule.get('DEFAULT', 'H')  # fallback
+        else:
+            # If there's no single 'ALL' rule, we check up_val
+            action_code = rule.get(dealer_up_val)
+            if action_code is None:
+                action_code = rule.get('DEFAULT', 'H')  # fallback
 
+        if action_code == 'D' and not can_double and total >= 18:
+            # Soft 18 and 19 stand when they can't double
+            return "STAND"
         return self._interpret_action_code(action_code, can_double)
 
     def _hard_action(self, total, dealer_up_val, can_double):
@@ -184,70 +216,19 @@ class Player:
         return "HIT"  # fallback
 
     def _deviations(self, hand, dealer_up_val, resplit_till, true_count):
-        if len(hand.cards) == 2 and hand.is_pair() and len(self.hands) < resplit_till and hand.value == 20:
-            if true_count >= 4 and dealer_up_val == 6:
-                return "SPLIT"
-            if true_count >= 5 and dealer_up_val == 5:
-                return "SPLIT"
-            if true_count >= 6 and dealer_up_val == 4:
-                return "SPLIT"
-        elif len(hand.cards) == 2 and hand.is_pair() and len(self.hands) < resplit_till and hand.value == 18:
-            if true_count >= 3 and dealer_up_val == 7:
-                return "SPLIT"
-        elif hand.value == 16:
-            if true_count > 0 and dealer_up_val == 10:
-                return "STAND"
-            if true_count >= 4 and dealer_up_val == 9:
-                return "STAND"
-            if true_count >= 3 and dealer_up_val == 11:
-                return "STAND"
-        elif hand.value == 15:
-            if true_count >= 4 and dealer_up_val == 10:
-                return "STAND"
-        elif hand.value == 13:
-            if true_count <= -1 and dealer_up_val == 2:
-                return "HIT"
-            if true_count <= -2 and dealer_up_val == 3:
-                return "HIT"
-        elif hand.value == 12:
-            if true_count >= 3 and dealer_up_val == 2:
-                return "STAND"
-            if true_count >= 2 and dealer_up_val == 3:
-                return "STAND"
-            if true_count < 0 and dealer_up_val == 4:
-                return "HIT"
-        elif hand.value == 11:
-            if true_count > 0 and dealer_up_val == 11:
-                return "DOUBLE"
-        elif hand.value == 10:
-            if true_count >= 4 and dealer_up_val == 10:
-                return "DOUBLE"
-            if true_count >= 3 and dealer_up_val == 11:
-                return "DOUBLE"
-        elif hand.soft and hand.value == 20:
-            if true_count >= 4 and dealer_up_val == 6:
-                return "DOUBLE"
-            if true_count >= 5 and dealer_up_val == 5:
-                return "DOUBLE"
-            if true_count >= 6 and dealer_up_val == 4:
-                return "DOUBLE"
-        elif hand.soft and hand.value == 19:
-            if true_count >= 0 and dealer_up_val == 6:
-                return "DOUBLE"
-            if true_count >= 1 and dealer_up_val == 5:
-                return "DOUBLE"
-            if true_count >= 3 and dealer_up_val == 4:
-                return "DOUBLE"
-            if true_count >= 5 and dealer_up_val == 3:
-                return "DOUBLE"
-        elif hand.soft and hand.value == 17:
-            if true_count >= 1 and dealer_up_val == 2:
-                return "DOUBLE"
-        elif hand.soft and hand.value == 15:
-            if true_count < 0 and dealer_up_val == 4:
-                return "HIT"
+        """Use the deviation tables: pairs that can be split first, then any total, then soft totals."""
+        if len(hand.cards) == 2 and hand.is_pair() and self._can_split(hand, resplit_till) and hand.value in self.pair_deviations:
+            rules = self.pair_deviations[hand.value]
+        elif hand.value in self.total_deviations:
+            rules = self.total_deviations[hand.value]
+        elif hand.soft and hand.value in self.soft_deviations:
+            rules = self.soft_deviations[hand.value]
         else:
             return None
+        for up_val, comparison, index, action in rules:
+            if dealer_up_val == up_val and COMPARISONS[comparison](true_count, index):
+                return action
+        return None
 
  
     def put_insurance_bet(self, true_count):
@@ -256,34 +237,39 @@ class Player:
             self.insurance_bet = bet
         return
     
-    def put_bet_on_initial_hand(self, high_low_true_count, five_aces_true_count):
+    def bet_ramp(self):
+        """
+        The player's bet spread as (count system, rules, default bet).
+        Each rule is (comparison, true count, bet); the first rule matching the
+        true count before the deal sets the bet, otherwise the default is bet.
+        """
         if self.high_low_counting:
             bet = self.min_bet * 2
-            if high_low_true_count <= -1:
-                bet -= self.denominations
-            elif high_low_true_count >= 2:
-                bet += 2 * self.denominations
-            elif high_low_true_count >= 3:
-                bet += 4 * self.denominations
-            elif high_low_true_count >= 4:
-                bet += 6 * self.denominations
-            self.hands[0].put_initial_bet(bet)
+            return "HIGH_LOW", [
+                ("<=", -1, bet - self.denominations),
+                (">=", 2, bet + 2 * self.denominations),
+                (">=", 3, bet + 4 * self.denominations),
+                (">=", 4, bet + 6 * self.denominations),
+            ], bet
         elif self.ace_five_counting:
             bet = self.min_bet
-            if five_aces_true_count >= 2:
-                bet *= 2
-            elif five_aces_true_count >= 3:
-                bet *= 4
-            elif five_aces_true_count >= 4:
-                bet *= 8
-            elif five_aces_true_count >= 5:
-                bet *= 16
-            elif five_aces_true_count >= 6:
-                bet *= 32
-            self.hands[0].put_initial_bet(bet)
-        else:
-            bet = self.min_bet
-            self.hands[0].put_initial_bet(bet)
+            return "ACE_FIVE", [
+                (">=", 2, bet * 2),
+                (">=", 3, bet * 4),
+                (">=", 4, bet * 8),
+                (">=", 5, bet * 16),
+                (">=", 6, bet * 32),
+            ], bet
+        return None, [], self.min_bet
+
+    def put_bet_on_initial_hand(self, high_low_true_count, five_aces_true_count):
+        count_system, rules, bet = self.bet_ramp()
+        true_count = five_aces_true_count if count_system == "ACE_FIVE" else high_low_true_count
+        for comparison, index, ramp_bet in rules:
+            if COMPARISONS[comparison](true_count, index):
+                bet = ramp_bet
+                break
+        self.hands[0].put_initial_bet(bet)
         return bet
 
     def new_hand(self):
@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from config import config_hash
+from outcomes import OutcomeAccumulator
+from stats import RunningStats
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    config_hash TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    created REAL NOT NULL,
+    games INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    game_results TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS count_results (
+    config_hash TEXT NOT NULL,
+    true_count INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    PRIMARY KEY (config_hash, true_count)
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    config_hash TEXT NOT NULL,
+    cell INTEGER NOT NULL,
+    count REAL NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    wins REAL NOT NULL,
+    PRIMARY KEY (config_hash, cell)
+);
+"""
+
+
+class ResultsStore:
+    """
+    Simulation results in a local SQLite file, keyed by the hash of the full run
+    configuration so a configuration that was already simulated is served from
+    the store instead of being run again.
+
+    runs: one row per configuration with the round totals and each game's result.
+    count_results: rounds, sum and sum of squares of the house profit per true count.
+    outcomes: the non-empty cells of the outcome tensor (flat index into outcomes.SHAPE).
+
+    Each run is written in one transaction with batched inserts, and the three
+    parts can be loaded separately so notebooks only read what they plot.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def has_run(self, config):
+        row = self.connection.execute("SELECT 1 FROM runs WHERE config_hash = ?", (config_hash(config),)).fetchone()
+        return row is not None
+
+    def save_run(self, state):
+        """Store the results of a finished main.run state, replacing any earlier results for its configuration."""
+        config = state["config"]
+        key = config_hash(config)
+        rounds, total, total_sq = state["totals"].sums()
+        outcomes = state["outcomes"]
+        outcomes.flush()
+        cells = np.flatnonzero(outcomes.count)
+        with self.connection:
+            for table in ("runs", "count_results", "outcomes"):
+                self.connection.execute(f"DELETE FROM {table} WHERE config_hash = ?", (key,))
+            self.connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(config, sort_keys=True), time.time(), state["game_index"], rounds, total, total_sq,
+                 json.dumps(state["game_results"])),
+            )
+            self.connection.executemany(
+                "INSERT INTO count_results VALUES (?, ?, ?, ?, ?)",
+                [(key, true_count, *count_stats.sums()) for true_count, count_stats in state["count_totals"].items()],
+            )
+            self.connection.executemany(
+                "INSERT INTO outcomes VALUES (?, ?, ?, ?, ?, ?)",
+                zip([key] * len(cells), cells.tolist(), outcomes.count[cells].tolist(), outcomes.total[cells].tolist(),
+                    outcomes.total_sq[cells].tolist(), outcomes.wins[cells].tolist()),
+            )
+        return key
+
+    def load_summary(self, config):
+        """
+        :return: Dict with config, games, totals (RunningStats of the house profit) and game_results, or None.
+        """
+        row = self.connection.execute(
+            "SELECT config, games, rounds, total, total_sq, game_results FROM runs WHERE config_hash = ?",
+            (config_hash(config),),
+        ).fetchone()
+        if row is None:
+            return None
+        stored_config, games, rounds, total, total_sq, game_results = row
+        return {
+            "config": json.loads(stored_config),
+            "game_index": games,
+            "totals": RunningStats.from_sums(rounds, total, total_sq),
+            "game_results": json.loads(game_results),
+        }
+
+    def load_count_totals(self, config):
+        """:return: Dict of true count -> RunningStats of the house profit."""
+        rows = self.connection.execute(
+            "SELECT true_count, rounds, total, total_sq FROM count_results WHERE config_hash = ? ORDER BY true_count",
+            (config_hash(config),),
+        )
+        return {true_count: RunningStats.from_sums(n, total, total_sq) for true_count, n, total, total_sq in rows}
+
+    def load_outcomes(self, config):
+        """:return: OutcomeAccumulator holding the stored outcome tensor."""
+        rows = self.connection.execute(
+            "SELECT cell, count, total, total_sq, wins FROM outcomes WHERE config_hash = ?", (config_hash(config),)
+        ).fetchall()
+        outcomes = OutcomeAccumulator()
+        if rows:
+            cells, count, total, total_sq, wins = (np.array(column) for column in zip(*rows))
+            cells = cells.astype(np.intp)
+            outcomes.count[cells] = count
+            outcomes.total[cells] = total
+            outcomes.total_sq[cells] = total_sq
+            outcomes.wins[cells] = wins
+        return outcomes
+
+    def load_run(self, config):
+        """The stored results in the same layout as a finished main.run state, or None."""
+        state = self.load_summary(config)
+        if state is None:
+            return None
+        state["count_totals"] = self.load_count_totals(config)
+        state["outcomes"] = self.load_outcomes(config)
+        return state
@@ -0,0 +1,188 @@
+import copy
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from counter import Counter
+from dealer import Dealer
+from deck import BlackjackShoe, Card, suits
+from hand import Hand
+from player import Player, dealer_upcard_value
+from round import BlackjackRound
+from rules import DEFAULT_RULES, Rules
+from stats import z_score
+from strategies.compiled import PAIR_RANKS
+from strategies.generator import VALUES, full_composition
+from strategies.strategy import StrategyTable
+
+# The player's result per rollout, in units of the bet
+ActionEstimate = namedtuple("ActionEstimate", ["ev", "standard_error", "rollouts"])
+# Bet the rollouts are played with; large enough that a 3:2 or 6:5 blackjack pays whole units
+BET = 100
+
+
+class Spot:
+    """
+    A decision to roll out: a hand against the dealer's upcard, after the dealer has checked
+    for blackjack (at a peek table), with the cards left in the shoe and the seats still to act.
+
+    :param hand: Ranks of the hand, e.g. ["10", "6"].
+    :param upcard: Rank of the dealer's upcard.
+    :param composition: Cards left in the shoe, hole card included, by value 2..11 as in
+        strategies.generator.full_composition. Defaults to a full shoe less the cards on the table.
+    :param other_hands: Ranks of the hands of the seats that act after this one; they play the strategy.
+    :param rules: The table's Rules.
+    """
+    def __init__(self, hand, upcard, composition=None, other_hands=(), rules=DEFAULT_RULES, num_decks=6):
+        self.hand = [Card(rank, suits[i]) for i, rank in enumerate(hand)]
+        self.upcard = Card(upcard, suits[0])
+        self.other_hands = [[Card(rank, suits[i]) for i, rank in enumerate(other_hand)] for other_hand in other_hands]
+        self.rules = rules
+        self.num_decks = num_decks
+        if composition is None:
+            composition = list(full_composition(num_decks))
+            for card in self.hand + [self.upcard] + [card for other_hand in self.other_hands for card in other_hand]:
+                composition[dealer_upcard_value(card) - 2] -= 1
+        if len(composition) != len(VALUES) or min(composition) < 0:
+            raise ValueError(f"Invalid shoe composition: {composition}")
+        self.composition = tuple(composition)
+        start = Hand(list(self.hand))
+        if len(start.cards) < 2 or start.value >= 21:
+            raise ValueError("The hand has no decision to make")
+
+        self.cards = [Card(PAIR_RANKS[value], suits[i % len(suits)]) for value, count in zip(VALUES, self.composition) for i in range(count)]
+        upcard_value = dealer_upcard_value(self.upcard)
+        peeked = rules.dealer_peek and upcard_value in (10, 11)
+        # Cards the hole card can be: all of them, or those that don't give the dealer blackjack
+        self.hole_choices = [i for i, card in enumerate(self.cards) if not peeked or dealer_upcard_value(card) + upcard_value != 21]
+        if not self.hole_choices:
+            raise ValueError("No hole card is possible")
+        # The rounds settle surrender here and never insure; the shoe is a template for each rollout
+        self.round_rules = Rules(**dict(rules.to_dict(), surrender=None, insurance=False))
+        self.shoe = BlackjackShoe(num_decks, cards=[])
+
+    def legal_actions(self):
+        """The actions the table allows on the hand."""
+        hand = Hand(list(self.hand))
+        actions = ["HIT", "STAND"]
+        if len(hand.cards) == 2:
+            if (self.rules.double_soft if hand.soft else self.rules.double_hard)[0][hand.value]:
+                actions.append("DOUBLE")
+            if hand.is_pair() and self.rules.resplit_till > 1:
+                actions.append("SPLIT")
+            if self.rules.surrender is not None:
+                actions.append("SURRENDER")
+        return actions
+
+
+def play_spot(spot, action, seed, strategy=StrategyTable["MULTIDECK"]):
+    """
+    Play one random completion of a spot, taking action on the hand and following the
+    strategy afterwards. The same seed deals the same cards whatever the action.
+    :return: The player's result in units of the bet.
+    """
+    if action == "SURRENDER":
+        return -0.5
+    rng = random.Random(seed)
+    cards = list(spot.cards)
+    hole = cards.pop(rng.choice(spot.hole_choices))
+    rng.shuffle(cards)
+    shoe = copy.copy(spot.shoe)
+    shoe.cards = cards
+    shoe.deal_index = 0
+
+    player = Player(name="Player", strategy=strategy, bankroll=0, hands=[Hand(list(spot.hand), bet=BET)])
+    others = [Player(name=f"Seat {i}", strategy=strategy, bankroll=0, hands=[Hand(list(other_hand), bet=BET)])
+              for i, other_hand in enumerate(spot.other_hands, start=2)]
+    for seat in [player] + others:
+        seat.rules = spot.round_rules
+    get_action = player.get_action
+    decisions = []
+
+    def forced_action(hand, dealer_card, resplit_till, true_count):
+        # The first decision is the spot's; the rest follow the strategy
+        if not decisions:
+            decisions.append(action)
+            return action
+        return get_action(hand, dealer_card, resplit_till, true_count)
+    player.get_action = forced_action
+
+    dealer = Dealer(hit_on_soft_17=spot.rules.hit_on_soft_17, hand=Hand([hole, spot.upcard]))
+    game_round = BlackjackRound(shoe, [player] + others, dealer, spot.rules.blackjack_payout, resplit_till=spot.rules.resplit_till,
+                                counter=Counter(), rules=spot.round_rules, deal_initial_cards=False)
+    game_round.play_round()
+    return player.bankroll / BET
+
+
+def _play_batch(spot, action, seeds, strategy):
+    return np.array([play_spot(spot, action, seed, strategy) for seed in seeds])
+
+
+def rollout(spot, actions=None, max_rollouts=100000, batch_size=2000, confidence=0.95, seed=None, processes=1,
+            strategy=StrategyTable["MULTIDECK"]):
+    """
+    Estimate the EV of each action in a spot by playing random completions.
+
+    Every action is played on the same seeds (common random numbers), so the differences
+    between actions are much less noisy than the EVs. Rollouts are added batch_size at a time
+    until max_rollouts, or until the best action's paired lower confidence bound on its
+    advantage over every other action is above 0.
+
+    :param actions: Actions to compare; all the legal ones by default.
+    :param processes: Worker processes to spread the batches over; 1 plays them here.
+    :return: Dict of action -> ActionEstimate (EV per unit bet, its standard error, rollouts).
+    """
+    legal = spot.legal_actions()
+    actions = legal if actions is None else list(actions)
+    for action in actions:
+        if action not in legal:
+            raise ValueError(f"{action} is not allowed in this spot")
+    seed = random.getrandbits(63) if seed is None else seed
+    z = z_score(confidence)
+    results = {action: [] for action in actions}
+    pool = ProcessPoolExecutor(processes) if processes != 1 else None
+    try:
+        played = 0
+        while played < max_rollouts:
+            count = min(batch_size, max_rollouts - played)
+            seeds = range(seed + played, seed + played + count)
+            if pool is None:
+                for action in actions:
+                    results[action].append(_play_batch(spot, action, seeds, strategy))
+            else:
+                chunk = -(-count // processes)
+                futures = {action: [pool.submit(_play_batch, spot, action, seeds[i:i + chunk], strategy) for i in range(0, count, chunk)]
+                           for action in actions}
+                for action in actions:
+                    results[action].append(np.concatenate([future.result() for future in futures[action]]))
+            played += count
+            if len(actions) > 1 and _clearly_best({action: np.concatenate(batches) for action, batches in results.items()}, z):
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    estimates = {}
+    for action, batches in results.items():
+        values = np.concatenate(batches)
+        estimates[action] = ActionEstimate(float(values.mean()), _standard_error(values), len(values))
+    return estimates
+
+
+def _standard_error(values):
+    if len(values) < 2:
+        return float("inf")
+    return float(values.std(ddof=1) / np.sqrt(len(values)))
+
+
+def _clearly_best(results, z):
+    """Whether the action with the best mean beats every other by more than z paired standard errors."""
+    best = max(results, key=lambda action: results[action].mean())
+    for action, values in results.items():
+        if action != best:
+            difference = results[best] - values
+            if difference.mean() - z * _standard_error(difference) <= 0:
+                return False
+    return True
@@ -5,12 +5,16 @@ from player import Player
 from strategies.strategy import StrategyTable
 from collections import defaultdict
 from counter import Counter
-import numpy as np
+from outcomes import ACTION_INDEX, true_count_index, upcard_index
+from rules import DEFAULT_RULES
 
 class BlackjackRound:
-    def __init__(self, shoe: BlackjackShoe, players, dealer, blackjack_payout, print_cards=False, resplit_till=4, counter: Counter=None):
+    def __init__(self, shoe: BlackjackShoe, players, dealer, blackjack_payout, print_cards=False, resplit_till=4, counter: Counter=None, outcomes=None, rules=DEFAULT_RULES, deal_initial_cards=True):
         """
         Simulates a single round of blackjack
+        :param rules: The table's Rules for surrender, peek, insurance and split aces.
+        :param deal_initial_cards: Deal the first two cards of every hand. Without it the players'
+            and the dealer's hands are played as they are, e.g. to play out a given spot.
         """
         self.shoe = shoe
         # Store each player's hand as a list of (rank, suit)
@@ -19,20 +23,26 @@ class BlackjackRound:
         self.dealer = dealer
         self.blackjack_payout = blackjack_payout
         self.resplit_till = resplit_till
+        self.rules = rules
         self.dealer_profit = 0
+        # House profit from side bets, kept apart from dealer_profit
+        self.side_bet_profit = 0
         self._print_cards = print_cards
         self.counter = counter
-        self.win_count_matrix = np.zeros((10, 35))
-        self.profit_count_matrix = np.zeros((10, 35))
-        self.total_count_matrix = np.zeros((10, 35))
-        self.total_profit_matrix = np.zeros((10, 35))
+        # OutcomeAccumulator recording each decision's result, or None
+        self.outcomes = outcomes
+        if outcomes is not None:
+            self.true_count_index = true_count_index(self.get_estimated_high_low_true_count())
+            # (player, state index, initial bet) of each player's first split
+            self.split_decisions = []
         ########################################################################
         # BUSTING DEBUGGING VARIABLES
         # self.blackjack_counter = 0
         # self.bust_dict = defaultdict(int)
         # self.total_dict = defaultdict(int)
 
-        self._deal_initial_cards()
+        if deal_initial_cards:
+            self._deal_initial_cards()
 
     def _deal_initial_cards(self):
         """
@@ -65,20 +75,27 @@ class BlackjackRound:
             print("=== Dealer Card ===")
             print(dealer_upcard)
         results = []
+        rules = self.rules
+        if rules.early_surrender:
+            self._offer_surrender(dealer_upcard)
         # offer insurance if the dealer has potential for blackjack
-        if dealer_upcard.rank == "A":
+        if dealer_upcard.rank == "A" and rules.insurance:
             high_low_true_count = self.get_estimated_high_low_true_count()
             # five_ace_true_count = self.get_estimated_five_aces_true_count()
             for player in self.players:
-                player.put_insurance_bet(high_low_true_count)
+                if player.hands[0].hand_status != "SURRENDER":
+                    player.put_insurance_bet(high_low_true_count)
             self.dealer.hand.evaluate()
 
 
-        if self.dealer.hand.is_blackjack():
+        if rules.dealer_peek and self.dealer.hand.is_blackjack():
             self.counter.update_count(self.dealer.hand.cards[0])
             for player in self.players:
                 players_hand = player.hands[0]
-                players_hand.record_index()
+                if players_hand.hand_status == "SURRENDER":
+                    continue
+                if self.outcomes is not None:
+                    players_hand.decision = (players_hand.get_state_index(), ACTION_INDEX["NONE"])
                 if not player.hands[0].is_blackjack():
                     players_hand.lost()
                     results.append(f"{player.name} loses, dealer has blackjack")
@@ -88,13 +105,18 @@ class BlackjackRound:
                     results.append(f"{player.name} pushes with blackjack")
             results.extend(self._evaluate_round())
             return results
-        
+
+        if rules.late_surrender:
+            self._offer_surrender(dealer_upcard)
         for player in self.players:
             self._player_turn(player, dealer_upcard)
 
         # Dealer takes turn
         self.counter.update_count(self.dealer.hand.cards[0])
-        self.dealer.dealer_turn(self.shoe, self.counter)
+        if not rules.dealer_peek and self.dealer.hand.is_blackjack():
+            self._settle_unpeeked_blackjack()
+        else:
+            self.dealer.dealer_turn(self.shoe, self.counter)
         results.extend(self._evaluate_round())
 
         ########################################################################
@@ -113,22 +135,54 @@ class BlackjackRound:
         # Evaluate results
         return results
 
+    def _offer_surrender(self, dealer_upcard):
+        """Let each player surrender their first two cards for half their bet."""
+        for player in self.players:
+            hand = player.hands[0]
+            if player.surrenders(hand, dealer_upcard):
+                if self.outcomes is not None:
+                    hand.decision = (hand.get_state_index(), ACTION_INDEX["SURRENDER"])
+                hand.surrender()
+
+    def _settle_unpeeked_blackjack(self):
+        """
+        A dealer blackjack found after the players acted (no peek): every hand loses all
+        its bets, or with original_bets_only only the original bet, except a natural, which pushes.
+        """
+        for player in self.players:
+            for i, hand in enumerate(player.hands):
+                if hand.hand_status == "SURRENDER":
+                    continue
+                if hand.hand_status == "BLACKJACK WIN" and len(player.hands) == 1:
+                    hand.push()
+                elif self.rules.original_bets_only and i > 0:
+                    hand.push()
+                else:
+                    if self.rules.original_bets_only and hand.double:
+                        # The double is returned
+                        hand.bet //= 2
+                        hand.double = False
+                    hand.lost()
+
     def _player_turn(self, player, dealer_upcard, hand_index=0):
         """
         Allow the player to act on each of their hands in sequence (handling splits).
         'player.hands' is a list of Hand objects. 
         """
+        if player.hands[0].hand_status == "SURRENDER":
+            return
         # We'll process each hand in the player's list of hands
         while hand_index < len(player.hands):
             hand = player.hands[hand_index]
             if self._print_cards:
                 print(f"\n{player.name}'s actions for hand {hand_index+1}:")
-            hand.record_index()
             # Continue acting on this hand until the player stands, busts, or doubles
             while True:
 
                 # Ask the player's strategy for an action
                 action = player.get_action(hand, dealer_upcard, self.resplit_till, self.get_estimated_high_low_true_count())
+                if self.outcomes is not None and hand.decision is None:
+                    hand.decision = (hand.get_state_index(), ACTION_INDEX[action])
                 if self._print_cards:
                     print(action)
                 if action == "BUST":
@@ -144,7 +198,6 @@ class BlackjackRound:
                     # Deal one card to the current hand
                     card = self.shoe.deal_card()
                     hand.add_card(card)
-                    # hand.record_index()
                     self.counter.update_count(card)
 
                 elif action == "STAND":
@@ -162,14 +215,20 @@ class BlackjackRound:
                 elif action == "SPLIT":
                     # Handle splitting (the hand must have exactly 2 cards of same rank)
                     new_hand = hand.split()
+                    if self.outcomes is not None:
+                        # The first split is scored on the result of all the hands it creates;
+                        # the split hands then record their own decisions
+                        if len(player.hands) == 1:
+                            self.split_decisions.append((player, hand.decision[0], hand.bet))
+                        hand.decision = None
 
                     # Deal one new card to each split hand
                     card_1 = self.shoe.deal_card()
                     card_2 = self.shoe.deal_card()
                     hand.add_card(card_1)
                     new_hand.add_card(card_2)
-                    hand.record_index()
-                    new_hand.record_index()
+                    if hand.cards[0].rank == "A" and not self.rules.hit_split_aces:
+                        hand.split_aces = new_hand.split_aces = True
                     self.counter.update_count(card_1)
                     self.counter.update_count(card_2)
 
@@ -189,16 +248,10 @@ class BlackjackRound:
         and return a summary of outcomes.
         """
         # Evaluate the dealer's final total
-        dealer_total = self.dealer.hand.evaluate()
+        dealer_total = self.dealer.hand.value
         dealer_bust = dealer_total > 21
 
-        dealer_upcard_rank = self.dealer.hand.cards[1].rank
-        if dealer_upcard_rank == 'A':
-            dealer_matrix_index = 9
-        elif dealer_upcard_rank in ['J', 'Q', 'K']:
-            dealer_matrix_index = 8
-        else:
-            dealer_matrix_index = int(dealer_upcard_rank) - 2
+        dealer_upcard_index = upcard_index(self.dealer.hand.cards[1])
         outcomes = []
         # Iterate through each player
         dealer_earnings = 0
@@ -207,10 +260,7 @@ class BlackjackRound:
 
             # Each player could have multiple hands (due to splits, etc.)            
             for j, hand in enumerate(player.hands, start=1):
-                for matrix_idx in hand.matrix_index:
-                    self.total_count_matrix[dealer_matrix_index, matrix_idx] += 1
-                    self.total_profit_matrix[dealer_matrix_index, matrix_idx] += hand.bet
-                player_total = hand.evaluate()
+                player_total = hand.value
                 payout = 0
                 if hand.hand_status == "LOST":
                     outcomes.append(f"{player.name} Hand {j} lost with {player_total}. Dealer wins.")
@@ -244,6 +294,9 @@ class BlackjackRound:
                         else:
                             hand.push()
                             outcomes.append(f"Push! {player.name} Hand {j} ties dealer at {player_total}.")
+                elif hand.hand_status == "SURRENDER":
+                    payout -= hand.bet / 2
+                    outcomes.append(f"{player.name} Hand {j} surrenders.")
                 elif hand.hand_status == "PUSH":
                     outcomes.append(f"Push! {player.name} Hand {j} ties dealer at {player_total}.")
                 else:
@@ -251,15 +304,17 @@ class BlackjackRound:
                     print(f"Unexpected hand status: {hand.hand_status}")
                     i = 1 / 0
                     return i
+                hand.payout = payout
                 player_earnings += payout
                 dealer_earnings -= payout
-                for matrix_idx in hand.matrix_index:
-                    if payout > 0:
-                        self.profit_count_matrix[dealer_matrix_index, matrix_idx] += (payout + hand.bet)
-                        self.win_count_matrix[dealer_matrix_index, matrix_idx] += 1
-                    if payout == 0:
-                        self.profit_count_matrix[dealer_matrix_index, matrix_idx] += hand.bet
-                        self.win_count_matrix[dealer_matrix_index, matrix_idx] += 0.5
+                if self.outcomes is not None and hand.decision is not None and hand.bet:
+                    initial_bet = hand.bet / 2 if hand.double else hand.bet
+                    self.outcomes.record(self.true_count_index, dealer_upcard_index, *hand.decision, payout / initial_bet)
+
+            if self.outcomes is not None:
+                for split_player, state_index, initial_bet in self.split_decisions:
+                    if split_player is player and initial_bet:
+                        self.outcomes.record(self.true_count_index, dealer_upcard_index, state_index, ACTION_INDEX["SPLIT"], player_earnings / initial_bet)
 
             if player.insurance_bet > 0:
                 if self.dealer.hand.is_blackjack():
@@ -0,0 +1,103 @@
+from strategies.surrender import EARLY_SURRENDER, LATE_SURRENDER_H17, LATE_SURRENDER_S17
+
+SURRENDER_OPTIONS = (None, "late", "early")
+# Hard totals a two card hand can double on
+DOUBLE_OPTIONS = {"any": range(2, 22), "9-11": (9, 10, 11), "10-11": (10, 11)}
+
+
+class Rules:
+    """
+    The rules of a table.
+
+    :param hit_on_soft_17: Dealer hits soft 17.
+    :param resplit_till: Most hands a player can split into.
+    :param blackjack_payout: Payout of a natural, e.g. 1.5 for 3:2.
+    :param surrender: None, "late" (after the dealer checks for blackjack, so only with dealer_peek)
+        or "early" (before).
+    :param double_after_split: Split hands can double.
+    :param double_on: "any" two cards, "9-11" or "10-11" (hard totals only).
+    :param resplit_aces: Split aces that draw another ace can be split again.
+    :param hit_split_aces: Split aces play on; otherwise they get one card each and stand.
+    :param dealer_peek: The dealer checks for blackjack before the players act. Without it (ENHC)
+        a dealer blackjack is found after the players act and takes their doubles and splits too.
+        The hole card is still dealt up front; from a shuffled shoe it is the same card either way.
+    :param original_bets_only: Without peek, a dealer blackjack only takes the original bets.
+    :param insurance: Insurance is offered against an ace.
+
+    Everything the rounds check is worked out here once, when the table is built: which
+    hands can double (per total, softness and whether the hand was split) and which hands
+    surrender, so a decision costs the same lookup whatever the rules. Rules are not
+    meant to be changed after they are built.
+    """
+    def __init__(self, hit_on_soft_17=True, resplit_till=4, blackjack_payout=1.5, surrender=None,
+                 double_after_split=True, double_on="any", resplit_aces=True, hit_split_aces=True,
+                 dealer_peek=True, original_bets_only=False, insurance=True):
+        if surrender not in SURRENDER_OPTIONS:
+            raise ValueError(f"Unknown surrender rule: {surrender}")
+        if double_on not in DOUBLE_OPTIONS:
+            raise ValueError(f"Unknown double rule: {double_on}")
+        if surrender == "late" and not dealer_peek:
+            # Late surrender comes after the dealer checks for blackjack, which a no peek dealer never does
+            raise ValueError("Late surrender needs a dealer that peeks; use early surrender without peek")
+        self.hit_on_soft_17 = hit_on_soft_17
+        self.resplit_till = resplit_till
+        self.blackjack_payout = blackjack_payout
+        self.surrender = surrender
+        self.double_after_split = double_after_split
+        self.double_on = double_on
+        self.resplit_aces = resplit_aces
+        self.hit_split_aces = hit_split_aces
+        self.dealer_peek = dealer_peek
+        self.original_bets_only = original_bets_only
+        self.insurance = insurance
+
+        # double_hard[was split][total], double_soft[was split][total]
+        hard_totals = set(DOUBLE_OPTIONS[double_on])
+        self.double_hard = (
+            tuple(total in hard_totals for total in range(22)),
+            tuple(double_after_split and total in hard_totals for total in range(22)),
+        )
+        soft_doubles = double_on == "any"
+        self.double_soft = ((soft_doubles,) * 22, (soft_doubles and double_after_split,) * 22)
+
+        self.early_surrender = surrender == "early"
+        self.late_surrender = surrender == "late"
+        if surrender == "early":
+            table = EARLY_SURRENDER
+        elif surrender == "late":
+            table = LATE_SURRENDER_H17 if hit_on_soft_17 else LATE_SURRENDER_S17
+        else:
+            table = {"HARD": {}, "PAIR": {}}
+        # Upcard value -> hard totals / pair card values that surrender
+        self.surrender_hard = {up: frozenset(totals) for up, totals in table["HARD"].items()}
+        self.surrender_pairs = {up: frozenset(values) for up, values in table["PAIR"].items()}
+
+        # Only the dealer's rule, splits and payout differ from the game BlackjackRound was written for
+        self.standard_play = (surrender is None and double_after_split and double_on == "any" and resplit_aces
+                              and hit_split_aces and dealer_peek and insurance)
+
+    def to_dict(self):
+        return {
+            "hit_on_soft_17": self.hit_on_soft_17,
+            "resplit_till": self.resplit_till,
+            "blackjack_payout": self.blackjack_payout,
+            "surrender": self.surrender,
+            "double_after_split": self.double_after_split,
+            "double_on": self.double_on,
+            "resplit_aces": self.resplit_aces,
+            "hit_split_aces": self.hit_split_aces,
+            "dealer_peek": self.dealer_peek,
+            "original_bets_only": self.original_bets_only,
+            "insurance": self.insurance,
+        }
+
+    @classmethod
+    def from_config(cls, rules):
+        """From a configuration's rules section (which also holds num_decks)."""
+        return cls(**{key: value for key, value in rules.items() if key != "num_decks"})
+
+    def __repr__(self):
+        return f"Rules({', '.join(f'{key}={value!r}' for key, value in self.to_dict().items())})"
+
+
+DEFAULT_RULES = Rules()
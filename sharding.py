@@ -0,0 +1,257 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+
+import main
+from config import load_config
+from stats import RunningStats
+
+# Layout of a work directory shared by the coordinator and the workers:
+#   campaign.json            the full configuration and the number of shards
+#   jobs/shard-NNNN.json     shards nobody has claimed
+#   running/shard-NNNN.json@worker   shards being run; the file's mtime is the worker's heartbeat
+#   results/shard-NNNN.npz   partial results of finished shards
+JOBS, RUNNING, RESULTS = "jobs", "running", "results"
+# Seconds without a heartbeat after which a running shard can be claimed again
+DEFAULT_LEASE = 300
+
+
+def shard_seed(seed, index):
+    """Seed of shard index of a campaign seeded with seed: independent streams that are the same on every host."""
+    digest = hashlib.sha256(f"{seed}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def plan_shards(config, work_dir, shards):
+    """
+    Split a run configuration into shards written as job files in work_dir.
+    The games are divided among the shards (at most one shard per game), and each shard
+    gets its own seed derived from the configuration's seed (or a random one, recorded
+    in campaign.json so the campaign can be rerun).
+    :return: The number of shards.
+    """
+    shards = max(1, min(shards, config["games"]))
+    seed = config["seed"] if config["seed"] is not None else random.getrandbits(63)
+    for directory in (JOBS, RUNNING, RESULTS):
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+    games_per_shard, extra_games = divmod(config["games"], shards)
+    for index in range(shards):
+        shard_config = dict(config, games=games_per_shard + (index < extra_games), seed=shard_seed(seed, index))
+        if config.get("shoe_bank"):
+            # Shards deal from consecutive, disjoint parts of the bank
+            shard_config["shoe_bank"] = dict(config["shoe_bank"], partition=[index, shards])
+        _write_json(os.path.join(work_dir, JOBS, _shard_name(index) + ".json"), {"shard": index, "config": shard_config})
+    _write_json(os.path.join(work_dir, "campaign.json"), {"config": config, "seed": seed, "shards": shards})
+    return shards
+
+
+def _shard_name(index):
+    return f"shard-{index:04d}"
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class Worker:
+    """
+    Claims shards from a work directory and runs them until none are left.
+
+    A shard is claimed by renaming its job file into running/ under the worker's name;
+    rename is atomic, so of several workers racing for a shard exactly one wins. While
+    it runs the worker touches the claimed file every lease / 3 seconds. A shard whose
+    file has not been touched for lease seconds belongs to a worker that died, and is
+    claimed again the same way. A shard that raises is put back in jobs/.
+    """
+    def __init__(self, work_dir, worker_id=None, lease=DEFAULT_LEASE):
+        self.work_dir = work_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+
+    def run(self, max_shards=None, quiet=True):
+        """Run shards until there are none to claim. Returns the indices of the shards run."""
+        done = []
+        while max_shards is None or len(done) < max_shards:
+            claimed = self.claim()
+            if claimed is None:
+                break
+            done.append(self.run_shard(claimed, quiet))
+        return done
+
+    def claim(self):
+        """Claim a pending shard, or else an abandoned one. Returns the path of the claimed file, or None."""
+        jobs = os.path.join(self.work_dir, JOBS)
+        for name in sorted(os.listdir(jobs)):
+            if name.endswith(".json"):
+                claimed = self._take(os.path.join(jobs, name), name)
+                if claimed is not None:
+                    return claimed
+        running = os.path.join(self.work_dir, RUNNING)
+        now = time.time()
+        for name in sorted(os.listdir(running)):
+            path = os.path.join(running, name)
+            try:
+                abandoned = now - os.path.getmtime(path) > self.lease
+            except FileNotFoundError:
+                continue
+            if abandoned:
+                claimed = self._take(path, name.split("@")[0])
+                if claimed is not None:
+                    return claimed
+        return None
+
+    def _take(self, path, job_name):
+        claimed = os.path.join(self.work_dir, RUNNING, f"{job_name}@{self.worker_id}")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            # Another worker got there first
+            return None
+        os.utime(claimed)
+        return claimed
+
+    def run_shard(self, claimed, quiet=True):
+        """Run a claimed shard and write its partial results. Returns the shard index."""
+        with open(claimed) as f:
+            job = json.load(f)
+        index = job["shard"]
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(claimed, stop), daemon=True)
+        heartbeat.start()
+        try:
+            state = main.new_state(job["config"])
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                main.run(state)
+            save_partial(os.path.join(self.work_dir, RESULTS, _shard_name(index) + ".npz"), state)
+        except BaseException:
+            stop.set()
+            heartbeat.join()
+            with contextlib.suppress(FileNotFoundError):
+                os.rename(claimed, os.path.join(self.work_dir, JOBS, _shard_name(index) + ".json"))
+            raise
+        stop.set()
+        heartbeat.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(claimed)
+        return index
+
+    def _heartbeat(self, claimed, stop):
+        while not stop.wait(self.lease / 3):
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(claimed)
+
+
+def save_partial(path, state):
+    """
+    Write the results of a finished main.run state as a compact .npz: the house profit
+    statistics (rounds, mean, sum of squared differences from the mean) overall and per
+    true count, each game's house bankroll and the non-empty
+    cells of the outcome tensor. Written next to the target and moved into place.
+    """
+    outcomes = state["outcomes"]
+    outcomes.flush()
+    cells = np.flatnonzero(outcomes.count)
+    true_counts = sorted(state["count_totals"])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            totals=_stats_row(state["totals"]),
+            game_results=np.array(state["game_results"], dtype=np.float64),
+            true_counts=np.array(true_counts, dtype=np.int64),
+            count_totals=np.array([_stats_row(state["count_totals"][count]) for count in true_counts], dtype=np.float64).reshape(-1, 3),
+            cells=cells,
+            count=outcomes.count[cells],
+            total=outcomes.total[cells],
+            total_sq=outcomes.total_sq[cells],
+            wins=outcomes.wins[cells],
+            # (games, checkpoints, players + house), empty without bankroll checkpoints
+            bankroll_histories=np.array(state.get("bankroll_histories", []), dtype=np.float64),
+        )
+    os.replace(tmp_path, path)
+
+
+def _stats_row(stats):
+    return np.array([stats.n, stats.mean, stats.m2], dtype=np.float64)
+
+
+def _stats_from_row(row):
+    stats = RunningStats()
+    stats.n, stats.mean, stats.m2 = int(row[0]), row[1], row[2]
+    return stats
+
+
+def merge_results(work_dir, allow_missing=False):
+    """
+    Combine the partial results of a campaign into one state in main.run's layout, ready for
+    main.print_report or ResultsStore.save_run. Statistics are merged with RunningStats.merge
+    in shard order, so the result is the same whichever workers ran the shards.
+    :param allow_missing: Merge the shards that are finished instead of raising when some are not.
+    """
+    with open(os.path.join(work_dir, "campaign.json")) as f:
+        campaign = json.load(f)
+    state = main.new_state(campaign["config"])
+    totals = state["totals"]
+    count_totals = state["count_totals"]
+    outcomes = state["outcomes"]
+    missing = []
+    for index in range(campaign["shards"]):
+        path = os.path.join(work_dir, RESULTS, _shard_name(index) + ".npz")
+        if not os.path.exists(path):
+            missing.append(index)
+            continue
+        with np.load(path) as partial:
+            totals.merge(_stats_from_row(partial["totals"].tolist()))
+            state["game_results"].extend(partial["game_results"].tolist())
+            for count, row in zip(partial["true_counts"].tolist(), partial["count_totals"].tolist()):
+                count_totals[count].merge(_stats_from_row(row))
+            cells = partial["cells"]
+            outcomes.count[cells] += partial["count"]
+            outcomes.total[cells] += partial["total"]
+            outcomes.total_sq[cells] += partial["total_sq"]
+            outcomes.wins[cells] += partial["wins"]
+            if "bankroll_histories" in partial.files:
+                state["bankroll_histories"].extend(partial["bankroll_histories"])
+    if missing and not allow_missing:
+        raise RuntimeError(f"Shards not finished: {missing}")
+    state["game_index"] = len(state["game_results"])
+    state["missing_shards"] = missing
+    return state
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a simulation campaign as shards over hosts sharing a directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan = commands.add_parser("plan", help="split a configuration into shard jobs")
+    plan.add_argument("config", nargs="?", help="run configuration (.json or .toml)")
+    plan.add_argument("work_dir")
+    plan.add_argument("--shards", type=int, required=True)
+    work = commands.add_parser("work", help="claim and run shards until none are left")
+    work.add_argument("work_dir")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="seconds without a heartbeat before a shard is claimed again")
+    merge = commands.add_parser("merge", help="combine the finished shards and print the report")
+    merge.add_argument("work_dir")
+    merge.add_argument("--allow-missing", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "plan":
+        print(f"Planned {plan_shards(load_config(args.config), args.work_dir, args.shards)} shards in {args.work_dir}")
+    elif args.command == "work":
+        print(f"Ran shards {Worker(args.work_dir, lease=args.lease).run()}")
+    else:
+        main.print_report(merge_results(args.work_dir, args.allow_missing))
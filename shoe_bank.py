@@ -0,0 +1,110 @@
+import numpy as np
+
+from deck import CARDS_BY_CODE, BlackjackShoe
+
+# Shoes shuffled at a time while building a bank
+BUILD_CHUNK_SHOES = 4096
+
+
+def bank_dtype(num_decks):
+    """One shoe of a bank: where the cut card goes and the card codes in dealing order."""
+    return np.dtype([("cut_index", np.int32), ("cards", np.uint8, (num_decks * 52,))])
+
+
+def build_shoe_bank(path, num_shoes, num_decks=6, seed=None, chunk_shoes=BUILD_CHUNK_SHOES):
+    """
+    Shuffle num_shoes shoes and write them to path as a .npy file that ShoeBank maps into memory.
+    Cut cards are placed as BlackjackShoe places them. The same seed builds the same bank.
+    """
+    rng = np.random.default_rng(seed)
+    shoes = np.lib.format.open_memmap(path, mode="w+", dtype=bank_dtype(num_decks), shape=(num_shoes,))
+    deck = np.tile(np.arange(52, dtype=np.uint8), num_decks)
+    # Drawn first so that the bank does not depend on chunk_shoes
+    shoes["cut_index"] = deck.size - np.rint(52 * rng.uniform(1.2, 2, num_shoes))
+    for start in range(0, num_shoes, chunk_shoes):
+        count = min(chunk_shoes, num_shoes - start)
+        shoes["cards"][start:start + count] = rng.permuted(np.broadcast_to(deck, (count, deck.size)), axis=1)
+    shoes.flush()
+
+
+class ShoeBank:
+    """
+    The shoes start..stop of a bank written by build_shoe_bank, mapped read-only so that
+    every process reading the file shares the same pages and nothing is copied.
+    Pickles as its path and range, so it can be sent to worker processes and checkpointed.
+    """
+    def __init__(self, path, start=0, stop=None):
+        shoes = np.load(path, mmap_mode="r")
+        if shoes.dtype.names != ("cut_index", "cards"):
+            raise ValueError(f"{path} is not a shoe bank")
+        stop = len(shoes) if stop is None else stop
+        if not 0 <= start < stop <= len(shoes):
+            raise ValueError(f"Shoes {start}..{stop} are not in a bank of {len(shoes)}")
+        self.path = path
+        self.start = start
+        self.stop = stop
+        self.num_decks = shoes.dtype["cards"].shape[0] // 52
+        self.cards = shoes["cards"][start:stop]
+        self.cut_indices = shoes["cut_index"][start:stop]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getstate__(self):
+        return {"path": self.path, "start": self.start, "stop": self.stop}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def partition(self, index, parts):
+        """Part index of parts nearly equal runs of consecutive shoes, e.g. one per worker or shard."""
+        if not 0 <= index < parts <= len(self):
+            raise ValueError(f"Cannot take part {index} of {parts} of {len(self)} shoes")
+        size, extra = divmod(len(self), parts)
+        start = self.start + index * size + min(index, extra)
+        return ShoeBank(self.path, start, start + size + (index < extra))
+
+    def shoe(self, index=0):
+        """A shoe dealing the bank's shoes from index on."""
+        return BankShoe(self, index)
+
+
+class BankCards:
+    """A shoe's card codes in the bank, read as Cards without copying them out."""
+    def __init__(self, codes):
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CARDS_BY_CODE[code] for code in self.codes[index].tolist()]
+        return CARDS_BY_CODE[self.codes[index]]
+
+
+class BankShoe(BlackjackShoe):
+    """
+    A shoe dealt from a ShoeBank: each reshuffle moves on to the bank's next shoe, so
+    there is no shuffling while playing. Shoes are never dealt twice: moving on from
+    the bank's last shoe raises IndexError, so a bank should hold more shoes than a run plays.
+    """
+    def __init__(self, bank, index=0):
+        if not 0 <= index < len(bank):
+            raise IndexError(f"All {len(bank)} shoes of {bank.path} [{bank.start}:{bank.stop}] have been dealt; build a larger bank")
+        self.bank = bank
+        self.index = index
+        super().__init__(bank.num_decks, cards=BankCards(bank.cards[index]), cut_index=int(bank.cut_indices[index]))
+
+    def __getstate__(self):
+        # The cards are a view of the bank's file, which the bank maps again when unpickled
+        state = dict(self.__dict__)
+        del state["cards"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cards = BankCards(self.bank.cards[self.index])
+
+    def next_shoe(self):
+        return BankShoe(self.bank, self.index + 1)
@@ -0,0 +1,189 @@
+import itertools
+import os
+import random
+import re
+
+import numpy as np
+
+from counter import Counter
+from deck import CARDS_BY_CODE, BlackjackShoe, ranks, suits, shuffle_shoe
+
+SUIT_LETTERS = {suit[0]: i for i, suit in enumerate(suits)}
+RANK_ALIASES = dict({rank: rank for rank in ranks}, T="10")
+TEXT_EXTENSIONS = (".txt", ".csv")
+BINARY_EXTENSIONS = (".bin", ".dat")
+# Shoes read from a binary file at a time
+DEFAULT_CHUNK_SHOES = 1024
+
+
+def read_shoes(path, num_decks=6, file_format=None, allow_partial=False, chunk_shoes=DEFAULT_CHUNK_SHOES):
+    """
+    Stream recorded shoes from a file as lists of Cards, one shoe at a time, without
+    reading the whole file.
+
+    Text (.txt, .csv): one shoe per line, cards separated by commas, semicolons or spaces.
+    A card is a rank (A, 2..10, T, J, Q, K) with an optional suit letter (C, D, H, S),
+    e.g. "AS, 10h, K". Blank lines and lines starting with # are skipped. Cards without
+    a suit are given the suits of that rank's unused cards in turn.
+    Binary (.bin, .dat): shoes of num_decks * 52 card codes (suit index * 13 + rank index),
+    one byte each, back to back; see write_binary_shoes.
+
+    Every shoe is checked against the composition of num_decks decks. With allow_partial a
+    text shoe may stop early (e.g. at the cut card); the cards it is missing are shuffled
+    in behind the recorded ones.
+    :param file_format: "text" or "binary"; by default from the file's extension.
+    """
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension in TEXT_EXTENSIONS:
+            file_format = "text"
+        elif extension in BINARY_EXTENSIONS:
+            file_format = "binary"
+        else:
+            raise ValueError(f"Unsupported shoe file format: {path}")
+    if file_format == "text":
+        return _read_text_shoes(path, num_decks, allow_partial)
+    if file_format == "binary":
+        return _read_binary_shoes(path, num_decks, chunk_shoes)
+    raise ValueError(f"Unknown shoe file format: {file_format}")
+
+
+def _read_text_shoes(path, num_decks, allow_partial):
+    shoe_size = num_decks * 52
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                codes = _parse_cards(re.split(r"[,;\s]+", line), num_decks)
+            except ValueError as error:
+                raise ValueError(f"{path}:{line_number}: {error}") from None
+            if len(codes) < shoe_size:
+                if not allow_partial:
+                    raise ValueError(f"{path}:{line_number}: {len(codes)} cards, a full shoe has {shoe_size}")
+                codes += _missing_cards(codes, num_decks)
+            yield [CARDS_BY_CODE[code] for code in codes]
+
+
+def _parse_cards(tokens, num_decks):
+    """Card codes of a recorded shoe, checked against the composition of num_decks decks."""
+    parsed = []
+    for token in tokens:
+        if not token:
+            continue
+        token = token.upper()
+        suit = None
+        if len(token) > 1 and token[-1] in SUIT_LETTERS:
+            token, suit = token[:-1], SUIT_LETTERS[token[-1]]
+        if token not in RANK_ALIASES:
+            raise ValueError(f"Unknown card: {token}")
+        parsed.append((ranks.index(RANK_ALIASES[token]), suit))
+
+    # Cards with a suit first, so the suitless ones take the suits that are left
+    code_counts = np.zeros(52, dtype=np.int64)
+    for rank, suit in parsed:
+        if suit is not None:
+            code_counts[suit * 13 + rank] += 1
+    if code_counts.max() > num_decks:
+        card = CARDS_BY_CODE[int(code_counts.argmax())]
+        raise ValueError(f"More than {num_decks} cards of {card.rank} of {card.suit}")
+    codes = []
+    for rank, suit in parsed:
+        if suit is None:
+            free = [s for s in range(4) if code_counts[s * 13 + rank] < num_decks]
+            if not free:
+                raise ValueError(f"More than {4 * num_decks} cards of rank {ranks[rank]}")
+            suit = min(free, key=lambda s: code_counts[s * 13 + rank])
+            code_counts[suit * 13 + rank] += 1
+        codes.append(suit * 13 + rank)
+    return codes
+
+
+def _missing_cards(codes, num_decks):
+    counts = np.bincount(codes, minlength=52)
+    missing = [code for code in range(52) for _ in range(num_decks - counts[code])]
+    shuffle_shoe(missing)
+    return missing
+
+
+def _read_binary_shoes(path, num_decks, chunk_shoes):
+    shoe_size = num_decks * 52
+    index = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(shoe_size * chunk_shoes)
+            if not data:
+                break
+            if len(data) % shoe_size:
+                raise ValueError(f"{path}: {len(data) % shoe_size} bytes left over after the last full shoe")
+            chunk = np.frombuffer(data, dtype=np.uint8).reshape(-1, shoe_size)
+            if chunk.max() >= 52:
+                raise ValueError(f"{path}: card code {int(chunk.max())} out of range")
+            for codes in chunk:
+                if (np.bincount(codes, minlength=52) != num_decks).any():
+                    raise ValueError(f"{path}: shoe {index} is not {num_decks} full decks")
+                yield [CARDS_BY_CODE[code] for code in codes.tolist()]
+                index += 1
+
+
+def write_binary_shoes(path, shoes):
+    """Write shoes (lists of Cards) as card codes in read_shoes' binary format."""
+    with open(path, "wb") as f:
+        for cards in shoes:
+            f.write(bytes(card.code for card in cards))
+
+
+class ReplayShoe(BlackjackShoe):
+    """
+    A shoe that deals recorded shoes in order instead of shuffling: each reshuffle moves
+    on to the next shoe from shoes. Once they run out, the next shoe is empty and has
+    exhausted set; dealing from it raises IndexError.
+    :param shoes: Iterator of recorded shoes, e.g. from read_shoes.
+    :param cut_index: Where to place the cut card; by default as BlackjackShoe does, per shoe.
+    """
+    def __init__(self, shoes, num_decks=6, cut_index=None):
+        self.shoes = iter(shoes)
+        self.fixed_cut_index = cut_index
+        cards = next(self.shoes, None)
+        self.exhausted = cards is None
+        # A fixed cut needs no random placement, so replays draw the same random numbers however many games share them
+        super().__init__(num_decks, cards=[] if cards is None else cards, cut_index=cut_index)
+
+    def next_shoe(self):
+        return ReplayShoe(self.shoes, self.num_decks, self.fixed_cut_index)
+
+
+def replay(games, shoes, max_shoes=None):
+    """
+    Play several games over the same recorded shoes in one pass: each shoe is read once,
+    played to its cut card at every game with the same cut card position, and dropped.
+    The games keep their bankrolls, outcome tensors and running statistics as with Game.play,
+    and go back to their own shoes afterwards.
+    :param shoes: Iterable of recorded shoes, e.g. from read_shoes.
+    :param max_shoes: Stop after this many shoes.
+    :return: The number of shoes played.
+    """
+    own_shoes = [game.shoe for game in games]
+    played = 0
+    for cards in itertools.islice(shoes, max_shoes):
+        num_decks = len(cards) // 52
+        cut_index = num_decks * 52 - round(52 * random.uniform(1.2, 2))
+        for game in games:
+            shoe = ReplayShoe(iter((cards,)), num_decks, cut_index)
+            game.shoe = shoe
+            game.counter = Counter()
+            if game.side_bets is not None:
+                game.side_bets.reset()
+            profits, true_counts = [], []
+            while game.shoe is shoe:
+                game_round, true_count = game.play_round()
+                profits.append(game_round.dealer_profit)
+                true_counts.append(true_count)
+            game._update_stats(profits, true_counts)
+        played += 1
+    for game, own_shoe in zip(games, own_shoes):
+        game.shoe = own_shoe.next_shoe()
+        game.counter = Counter()
+        game.outcomes.flush()
+    return played
@@ -0,0 +1,201 @@
+import random
+from collections import defaultdict
+
+import numpy as np
+
+from count_analysis import count_tags
+from deck import BlackjackShoe, Card, suits
+from stats import RunningStats
+
+HIGH_LOW_TAGS = count_tags("HIGH_LOW")
+# Card codes of the aces
+ACE_CODES = [Card("A", suit).code for suit in suits]
+
+
+class CasinoShuffle:
+    """
+    A zone shuffle as done by hand in many casinos. The discards are split into two
+    stacks, grabs of about grab_size cards are taken from the top of each and riffled
+    together riffles times, the riffled grabs are stacked in order, and this is repeated
+    passes times before the shoe is cut.
+
+    Cards only move within their pair of grabs, so someone who watched the discards
+    knows roughly where each part of the previous shoe ends up.
+    """
+    def __init__(self, grab_size=26, grab_jitter=3, riffles=2, passes=1):
+        self.grab_size = grab_size
+        self.grab_jitter = grab_jitter
+        self.riffles = riffles
+        self.passes = passes
+
+    def shuffle(self, cards, rng=random):
+        """
+        Shuffle cards (the discard tray, top card first).
+        :return: The new card order and the cut position, which the table sees.
+        """
+        for _ in range(self.passes):
+            cards = self._pass(cards, rng)
+        cut = rng.randint(len(cards) // 4, 3 * len(cards) // 4)
+        return cards[cut:] + cards[:cut], cut
+
+    def nominal_order(self, num_cards, cut):
+        """
+        Where each card of the tray is expected to land: the tray position of the card
+        at each position of the new shoe, shuffling with no jitter and perfect riffles.
+        """
+        positions = list(range(num_cards))
+        for _ in range(self.passes):
+            positions = self._pass(positions, None)
+        return positions[cut:] + positions[:cut]
+
+    def _jitter(self, rng):
+        return 0 if rng is None else rng.randint(-self.grab_jitter, self.grab_jitter)
+
+    def _pass(self, cards, rng):
+        half = len(cards) // 2 + self._jitter(rng)
+        left, right = cards[:half], cards[half:]
+        shuffled = []
+        while left or right:
+            left_size = max(self.grab_size + self._jitter(rng), 1)
+            right_size = max(self.grab_size + self._jitter(rng), 1)
+            packet = self._riffle(left[:left_size], right[:right_size], rng)
+            left, right = left[left_size:], right[right_size:]
+            for _ in range(self.riffles - 1):
+                split = len(packet) // 2 + self._jitter(rng)
+                packet = self._riffle(packet[:split], packet[split:], rng)
+            shuffled.extend(packet)
+        return shuffled
+
+    @staticmethod
+    def _riffle(left, right, rng):
+        """Interleave two packets: cards drop in proportion to what is left in each (perfectly alternating without rng)."""
+        riffled = []
+        i = j = 0
+        while i < len(left) or j < len(right):
+            left_left, right_left = len(left) - i, len(right) - j
+            if rng is None:
+                take_left = left_left >= right_left
+            else:
+                take_left = rng.random() * (left_left + right_left) < left_left
+            if take_left:
+                riffled.append(left[i])
+                i += 1
+            else:
+                riffled.append(right[j])
+                j += 1
+        return riffled
+
+
+class ShuffleTracker:
+    """
+    What a tracker knows about a shoe shuffled from a previous shoe's discards:
+    the high-low tags of the cards they saw dealt, spread through the casino shuffle.
+
+    expected_tags[k] is the expected tag of the card at position k of the new shoe:
+    the tray cards' tags (cards never seen share what is left of the count) carried
+    to their nominal positions and blurred over blur cards for the riffles. Prefix sums
+    make the expected count of any stretch of the shoe an O(1) lookup.
+
+    For ace sequencing, ace_keys[code] is the share of a card's copies that were seen
+    directly before an ace, so seeing a key card again hints at an ace close behind it.
+    """
+    def __init__(self, tray, cards_seen, casino_shuffle, cut, blur=8):
+        codes = np.array([card.code for card in tray], dtype=np.intp)
+        tags = HIGH_LOW_TAGS[codes % 13].astype(np.float64)
+        unseen = len(tray) - cards_seen
+        if unseen:
+            # A full shoe counts to zero, so the unseen cards hold minus the running count
+            tags[cards_seen:] = -tags[:cards_seen].sum() / unseen
+
+        expected = tags[casino_shuffle.nominal_order(len(tray), cut)]
+        if blur > 1:
+            kernel = np.ones(blur)
+            expected = np.convolve(expected, kernel, mode="same") / np.convolve(np.ones(len(tray)), kernel, mode="same")
+        self.expected_tags = expected
+        self._prefix = np.concatenate([[0.0], np.cumsum(expected)])
+
+        num_decks = len(tray) // 52
+        ace_keys = np.zeros(52)
+        aces = set(ACE_CODES)
+        for key, following in zip(codes[:cards_seen - 1].tolist(), codes[1:cards_seen].tolist()):
+            if following in aces:
+                ace_keys[key] += 1
+        self.ace_keys = ace_keys / max(num_decks, 1)
+
+    def expected_count(self, start, length):
+        """Expected high-low tag sum of the cards at positions start .. start + length."""
+        end = min(start + length, len(self.expected_tags))
+        return float(self._prefix[end] - self._prefix[start])
+
+    def tracked_true_count(self, start, length=52):
+        """
+        Expected true count of the next length cards from the player's side: positive
+        when they are expected to be rich in tens and aces.
+        """
+        end = min(start + length, len(self.expected_tags))
+        if end <= start:
+            return 0.0
+        return -self.expected_count(start, length) / ((end - start) / 52)
+
+    def ace_signal(self, card):
+        """Share of the card's copies that were seen directly before an ace."""
+        return float(self.ace_keys[card.code])
+
+
+class TrackedShoe(BlackjackShoe):
+    """
+    A shoe whose successor is shuffled from its own discards by a CasinoShuffle
+    instead of a fresh uniform shuffle. The discard tray holds the cards in the order
+    they came out, with the undealt cards behind the cut card on the bottom.
+    Shoes after the first carry a ShuffleTracker in self.tracker.
+    """
+    def __init__(self, num_decks=8, casino_shuffle=None, previous=None, blur=8):
+        self.casino_shuffle = casino_shuffle or CasinoShuffle()
+        self.blur = blur
+        self.tracker = None
+        if previous is None:
+            super().__init__(num_decks)
+            return
+        cards, cut = self.casino_shuffle.shuffle(previous.cards)
+        super().__init__(num_decks, cards=cards)
+        self.tracker = ShuffleTracker(previous.cards, previous.deal_index, self.casino_shuffle, cut, blur)
+
+    def next_shoe(self):
+        return TrackedShoe(self.num_decks, self.casino_shuffle, previous=self, blur=self.blur)
+
+
+class TrackingRun:
+    """
+    Plays rounds at a game dealing TrackedShoes and groups the house profit by the
+    tracked true count of the next window cards at the start of each round, and by
+    whether the last card seen was an ace key card. Rounds in a shoe without a tracker
+    (the first one) are skipped from the groups.
+
+    count_totals has the main.run layout (bucket -> stats.RunningStats), so
+    bet_ramp.CountDistribution.from_count_totals can price a tracking bet ramp from it.
+    """
+    def __init__(self, game, window=52, ace_signal_threshold=0.5):
+        if not isinstance(game.shoe, TrackedShoe):
+            raise ValueError("The game must deal from a TrackedShoe")
+        self.game = game
+        self.window = window
+        self.ace_signal_threshold = ace_signal_threshold
+        self.count_totals = defaultdict(RunningStats)
+        self.ace_totals = defaultdict(RunningStats)
+
+    def play(self, rounds):
+        game = self.game
+        for _ in range(rounds):
+            shoe = game.shoe
+            tracker = shoe.tracker
+            if tracker is not None:
+                bucket = round(tracker.tracked_true_count(shoe.deal_index, self.window))
+                last_card = shoe.cards[shoe.deal_index - 1] if shoe.deal_index else None
+                ace_expected = last_card is not None and tracker.ace_signal(last_card) >= self.ace_signal_threshold
+            game_round, _ = game.play_round()
+            if tracker is None:
+                continue
+            profit = game_round.dealer_profit
+            self.count_totals[bucket].add(profit)
+            self.ace_totals[ace_expected].add(profit)
+        return self
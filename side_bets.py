@@ -0,0 +1,178 @@
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from deck import ranks, RANK_INDEX
+
+# Payouts are net multiples of the stake; a losing side bet pays -1.
+PERFECT_PAIRS_PAYOUTS = {"PERFECT": 25, "COLORED": 12, "MIXED": 6}
+TWENTY_ONE_PLUS_THREE_PAYOUTS = {"SUITED_TRIPS": 100, "STRAIGHT_FLUSH": 40, "TRIPS": 30, "STRAIGHT": 10, "FLUSH": 5}
+# Sevens among the player's first two cards and the dealer upcard
+SEVENS_PAYOUTS = {"SUITED_777": 500, "777": 100, "TWO_SEVENS": 20, "ONE_SEVEN": 2}
+
+# Side counts: weight per rank, in the order of deck.ranks
+SEVENS_COUNT = {rank: (-12 if rank == "7" else 1) for rank in ranks}
+
+
+def _rank_and_suit(shape_axes):
+    """Rank and suit index grids for every card code on each of the given axes."""
+    codes = np.arange(52)
+    grids = []
+    for axis in range(shape_axes):
+        shape = [1] * shape_axes
+        shape[axis] = 52
+        grids.append(codes.reshape(shape))
+    return [grid % 13 for grid in grids], [grid // 13 for grid in grids]
+
+
+@lru_cache(maxsize=None)
+def perfect_pairs_table(perfect=25, colored=12, mixed=6):
+    """Payout of Perfect Pairs for every pair of first two card codes, flattened as c1 * 52 + c2."""
+    (r1, r2), (s1, s2) = _rank_and_suit(2)
+    # Diamonds and Hearts are the red suits
+    red1, red2 = (s1 == 1) | (s1 == 2), (s2 == 1) | (s2 == 2)
+    table = np.full((52, 52), -1.0)
+    pair = r1 == r2
+    table[pair & (red1 != red2)] = mixed
+    table[pair & (red1 == red2)] = colored
+    table[pair & (s1 == s2)] = perfect
+    return table.ravel()
+
+
+@lru_cache(maxsize=None)
+def twenty_one_plus_three_table(suited_trips=100, straight_flush=40, trips=30, straight=10, flush=5):
+    """Payout of 21+3 for every (first card, second card, upcard) code, flattened as (c1 * 52 + c2) * 52 + c3."""
+    (r1, r2, r3), (s1, s2, s3) = _rank_and_suit(3)
+    shape = (52, 52, 52)
+    ordered = np.sort(np.stack(np.broadcast_arrays(r1, r2, r3), axis=-1), axis=-1)
+    low, mid, high = ordered[..., 0], ordered[..., 1], ordered[..., 2]
+    is_flush = np.broadcast_to((s1 == s2) & (s2 == s3), shape)
+    is_trips = (low == high)
+    # Aces (rank index 0) play low in A-2-3 and high in Q-K-A
+    is_straight = ((mid == low + 1) & (high == mid + 1)) | ((low == 0) & (mid == 11) & (high == 12))
+    table = np.full(shape, -1.0)
+    table[is_flush] = flush
+    table[is_straight] = straight
+    table[is_trips] = trips
+    table[is_straight & is_flush] = straight_flush
+    table[is_trips & is_flush] = suited_trips
+    return table.ravel()
+
+
+@lru_cache(maxsize=None)
+def sevens_table(suited_777=500, three_sevens=100, two_sevens=20, one_seven=2):
+    """Payout of the 777s bet for every (first card, second card, upcard) code."""
+    (r1, r2, r3), (s1, s2, s3) = _rank_and_suit(3)
+    seven = RANK_INDEX["7"]
+    sevens = (r1 == seven).astype(int) + (r2 == seven) + (r3 == seven)
+    is_flush = (s1 == s2) & (s2 == s3)
+    table = np.full((52, 52, 52), -1.0)
+    table[sevens == 1] = one_seven
+    table[sevens == 2] = two_sevens
+    table[sevens == 3] = three_sevens
+    table[(sevens == 3) & is_flush] = suited_777
+    return table.ravel()
+
+
+class SideBet:
+    """
+    A side bet settled from a precomputed payout table.
+
+    :param name: Name used in the results.
+    :param table: Flat payout table indexed by card codes.
+    :param uses_upcard: Whether the bet also uses the dealer upcard (three card bets).
+    :param stake: Amount wagered each time the bet is placed.
+    :param count_weights: Optional dedicated side count, weight per rank.
+    :param min_true_count: Only place the bet when the side true count is at least this.
+    """
+    def __init__(self, name, table, uses_upcard, stake=5, count_weights=None, min_true_count=None):
+        self.name = name
+        self.table = table
+        self.uses_upcard = uses_upcard
+        self.stake = stake
+        self.count_weights = count_weights
+        self.min_true_count = min_true_count
+
+
+def perfect_pairs(stake=5, count_weights=None, min_true_count=None, payouts=PERFECT_PAIRS_PAYOUTS):
+    table = perfect_pairs_table(payouts["PERFECT"], payouts["COLORED"], payouts["MIXED"])
+    return SideBet("PERFECT_PAIRS", table, False, stake, count_weights, min_true_count)
+
+
+def twenty_one_plus_three(stake=5, count_weights=None, min_true_count=None, payouts=TWENTY_ONE_PLUS_THREE_PAYOUTS):
+    table = twenty_one_plus_three_table(payouts["SUITED_TRIPS"], payouts["STRAIGHT_FLUSH"], payouts["TRIPS"], payouts["STRAIGHT"], payouts["FLUSH"])
+    return SideBet("21+3", table, True, stake, count_weights, min_true_count)
+
+
+def sevens(stake=5, count_weights=SEVENS_COUNT, min_true_count=None, payouts=SEVENS_PAYOUTS):
+    table = sevens_table(payouts["SUITED_777"], payouts["777"], payouts["TWO_SEVENS"], payouts["ONE_SEVEN"])
+    return SideBet("777", table, True, stake, count_weights, min_true_count)
+
+
+SIDE_BETS = {"PERFECT_PAIRS": perfect_pairs, "21+3": twenty_one_plus_three, "777": sevens}
+
+
+def _empty_results():
+    return [0, 0.0, 0.0]
+
+
+class SideBetEngine:
+    """
+    Settles the configured side bets for every seat after the initial deal and
+    keeps each bet's side count.
+
+    results[name][true count] holds [bets, sum, sum of squares] of the outcome
+    per unit staked, so the count at which a side bet turns +EV can be read off.
+    """
+    def __init__(self, side_bets):
+        self.side_bets = side_bets
+        # Python lists index faster than numpy arrays one card at a time
+        self.tables = [side_bet.table.tolist() for side_bet in side_bets]
+        # Rank weights indexed by card code, one row per side bet (zero rows when a bet has no count)
+        self.code_weights = np.zeros((len(side_bets), 52))
+        for i, side_bet in enumerate(side_bets):
+            if side_bet.count_weights:
+                for rank, weight in side_bet.count_weights.items():
+                    self.code_weights[i, RANK_INDEX[rank]::13] = weight
+        self.running_counts = np.zeros(len(side_bets))
+        self.results = {side_bet.name: defaultdict(_empty_results) for side_bet in side_bets}
+
+    def settle(self, players, dealer_upcard, decks_left):
+        """
+        Settle every side bet for every player's first two cards.
+        Call after the initial deal, before any split changes the first hand.
+        Returns the house profit from the side bets.
+        """
+        house_profit = 0
+        upcard = dealer_upcard.code
+        for i, side_bet in enumerate(self.side_bets):
+            true_count = self.running_counts[i] / decks_left
+            if side_bet.min_true_count is not None and true_count < side_bet.min_true_count:
+                continue
+            results = self.results[side_bet.name][round(true_count)]
+            for player in players:
+                first, second = player.hands[0].cards[:2]
+                index = first.code * 52 + second.code
+                if side_bet.uses_upcard:
+                    index = index * 52 + upcard
+                outcome = self.tables[i][index]
+                player.bankroll += outcome * side_bet.stake
+                house_profit -= outcome * side_bet.stake
+                results[0] += 1
+                results[1] += outcome
+                results[2] += outcome * outcome
+        return house_profit
+
+    def update_count(self, cards):
+        """Add the cards seen this round to the side counts."""
+        if cards:
+            codes = [card.code for card in cards]
+            self.running_counts += self.code_weights[:, codes].sum(axis=1)
+
+    def reset(self):
+        self.running_counts[:] = 0
+
+    def expected_value(self, name):
+        """Sorted list of (true count, bets, EV per unit staked) for one side bet."""
+        return [(count, n, total / n) for count, (n, total, _) in sorted(self.results[name].items())]
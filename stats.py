@@ -0,0 +1,88 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+
+def z_score(confidence=0.95):
+    """Two sided normal critical value for a confidence level, e.g. 1.96 for 0.95."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+class RunningStats:
+    """
+    Streaming mean and variance of a series, updated a chunk at a time.
+    Chunks are combined with the parallel form of Welford's update, so two
+    RunningStats from separate runs can also be merged exactly.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        # Sum of squared differences from the mean
+        self.m2 = 0.0
+
+    def add(self, value):
+        """Add a single value (Welford's update)."""
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        return self
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return self
+        chunk = RunningStats()
+        chunk.n = values.size
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        return self.merge(chunk)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        return self
+
+    @classmethod
+    def from_sums(cls, n, total, total_sq):
+        """From a count, sum and sum of squares, the layout the results store keeps."""
+        stats = cls()
+        if n:
+            stats.n = n
+            stats.mean = total / n
+            stats.m2 = max(total_sq - n * stats.mean * stats.mean, 0.0)
+        return stats
+
+    def sums(self):
+        """(n, sum, sum of squares), the layout the results store keeps."""
+        return self.n, self.n * self.mean, self.m2 + self.n * self.mean * self.mean
+
+    def variance(self):
+        if self.n < 2:
+            return math.inf
+        return self.m2 / (self.n - 1)
+
+    def standard_error(self):
+        if self.n < 2:
+            return math.inf
+        return math.sqrt(self.variance() / self.n)
+
+    def half_width(self, confidence=0.95):
+        """Half width of the normal confidence interval for the mean."""
+        return z_score(confidence) * self.standard_error()
+
+
+def quantile_bands(histories, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Percentile bands across games of values recorded at the same checkpoints, e.g. the
+    bankroll_history of many Games stacked into shape (games, checkpoints, ...).
+    Checkpoints a game did not reach (NaN) are left out.
+    :return: Array of shape (len(percentiles), checkpoints, ...).
+    """
+    return np.nanpercentile(np.asarray(histories, dtype=np.float64), percentiles, axis=0)
@@ -0,0 +1,129 @@
+import numpy as np
+
+from deck import Card
+from hand import Hand
+from player import Player
+from strategies.deviations import DEVIATIONS_DICT
+
+# Integer action codes used by the compiled tables
+HIT, STAND, DOUBLE, SPLIT = 0, 1, 2, 3
+ACTION_NAMES = ["HIT", "STAND", "DOUBLE", "SPLIT"]
+ACTION_CODES = {name: code for code, name in enumerate(ACTION_NAMES)}
+
+# Deviation kinds, in the order Player._deviations checks them
+PAIR_KIND, TOTAL_KIND, SOFT_KIND = 0, 1, 2
+# Comparison codes for deviation indices
+COMPARISON_CODES = {">=": 0, ">": 1, "<=": 2, "<": 3}
+
+# Tables are indexed by hand total (0..21) and dealer upcard value (2..11)
+NUM_TOTALS = 22
+NUM_UPCARDS = 12
+# Rank of a card of each pair value, used to build pair hands
+PAIR_RANKS = {2: "2", 3: "3", 4: "4", 5: "5", 6: "6", 7: "7", 8: "8", 9: "9", 10: "10", 11: "A"}
+
+
+class CompiledStrategy:
+    """
+    A strategy dict (PAIR/SOFT/HARD) and deviation dict compiled into integer tables.
+
+    The tables are built by asking Player's own lookup methods about every
+    total and upcard, so a compiled lookup always agrees with Player.get_action.
+
+    hard[total, up], soft[total, up]: action for a two card hand; DOUBLE means
+        "double if allowed, otherwise hit" (stand for soft 18 and up).
+    pair[pair value, up]: HIT, STAND or SPLIT, or -1 to play the pair as a total.
+    deviation_keys[kind, total]: whether Player._deviations stops at this kind and total.
+    deviation_action[kind, total, up]: action code, or -1 when no index play applies.
+    deviation_index[kind, total, up], deviation_comparison[kind, total, up]: index and comparison code.
+
+    The numpy arrays can be handed to compiled kernels; the *_rows attributes are
+    the same tables as nested lists for fast lookups one hand at a time.
+    """
+    def __init__(self, strategy, deviations=DEVIATIONS_DICT):
+        player = Player(name="compiler", strategy=strategy, bankroll=0, hands=[Hand()])
+
+        self.hard = np.full((NUM_TOTALS, NUM_UPCARDS), HIT, dtype=np.int8)
+        self.soft = np.full((NUM_TOTALS, NUM_UPCARDS), HIT, dtype=np.int8)
+        self.pair = np.full((NUM_UPCARDS, NUM_UPCARDS), -1, dtype=np.int8)
+        for up in range(2, 12):
+            for total in range(NUM_TOTALS):
+                self.hard[total, up] = ACTION_CODES[player._hard_action(total, up, can_double=True)]
+                self.soft[total, up] = ACTION_CODES[player._soft_action(total, up, can_double=True)]
+            for value, rank in PAIR_RANKS.items():
+                action = player._pair_action(Hand([Card(rank, "Clubs"), Card(rank, "Hearts")]), up)
+                if action is not None:
+                    self.pair[value, up] = ACTION_CODES[action]
+
+        self.deviation_keys = np.zeros((3, NUM_TOTALS), dtype=np.bool_)
+        self.deviation_action = np.full((3, NUM_TOTALS, NUM_UPCARDS), -1, dtype=np.int8)
+        self.deviation_index = np.zeros((3, NUM_TOTALS, NUM_UPCARDS))
+        self.deviation_comparison = np.zeros((3, NUM_TOTALS, NUM_UPCARDS), dtype=np.int8)
+        for kind, name in enumerate(["PAIR", "TOTAL", "SOFT"]):
+            for total, rules in deviations[name].items():
+                self.deviation_keys[kind, total] = True
+                # Only the first rule for an upcard can ever match
+                for up, comparison, index, action in reversed(rules):
+                    self.deviation_action[kind, total, up] = ACTION_CODES[action]
+                    self.deviation_index[kind, total, up] = index
+                    self.deviation_comparison[kind, total, up] = COMPARISON_CODES[comparison]
+
+        self.hard_rows = self.hard.tolist()
+        self.soft_rows = self.soft.tolist()
+        self.pair_rows = self.pair.tolist()
+        self.deviation_key_rows = self.deviation_keys.tolist()
+        self.deviation_action_rows = self.deviation_action.tolist()
+        self.deviation_index_rows = self.deviation_index.tolist()
+        self.deviation_comparison_rows = self.deviation_comparison.tolist()
+
+    def action(self, total, soft, pair_value, num_cards, up_val, true_count=0, can_split=True, use_deviations=False):
+        """
+        Look up the action for a hand, with the same result as Player.get_action.
+
+        :param total: Hand total.
+        :param soft: Whether an ace counts as 11.
+        :param pair_value: Value (2..11) of a two card pair, or 0.
+        :param num_cards: Number of cards in the hand.
+        :param up_val: Dealer upcard value (2..11).
+        :param can_split: Whether the player may still split (fewer hands than resplit_till).
+        :param use_deviations: Whether to apply the high-low index plays.
+        :return: One of "HIT", "STAND", "DOUBLE", "SPLIT", "BUST", "BLACKJACK".
+        """
+        if total > 21:
+            return "BUST"
+        if num_cards == 2 and total == 21:
+            return "BLACKJACK"
+        splittable = num_cards == 2 and pair_value and can_split
+
+        if use_deviations:
+            kind = -1
+            if splittable and self.deviation_key_rows[PAIR_KIND][total]:
+                kind = PAIR_KIND
+            elif self.deviation_key_rows[TOTAL_KIND][total]:
+                kind = TOTAL_KIND
+            elif soft and self.deviation_key_rows[SOFT_KIND][total]:
+                kind = SOFT_KIND
+            if kind >= 0:
+                code = self.deviation_action_rows[kind][total][up_val]
+                # Index plays that double only apply to two card hands
+                if code >= 0 and (code != DOUBLE or num_cards == 2) and _compare(self.deviation_comparison_rows[kind][total][up_val], true_count, self.deviation_index_rows[kind][total][up_val]):
+                    return ACTION_NAMES[code]
+
+        if splittable:
+            code = self.pair_rows[pair_value][up_val]
+            if code >= 0:
+                return ACTION_NAMES[code]
+
+        code = self.soft_rows[total][up_val] if soft else self.hard_rows[total][up_val]
+        if code == DOUBLE and num_cards != 2:
+            return "STAND" if soft and total >= 18 else "HIT"
+        return ACTION_NAMES[code]
+
+
+def _compare(comparison, true_count, index):
+    if comparison == 0:
+        return true_count >= index
+    elif comparison == 1:
+        return true_count > index
+    elif comparison == 2:
+        return true_count <= index
+    return true_count < index
@@ -0,0 +1,35 @@
+# High-Low index plays, used when a player is counting and playing deviations.
+# Each rule is (dealer upcard value, comparison, true count, action); the first
+# rule matching the upcard and the true count wins.
+
+# Pairs that can still be split, keyed by the pair's total
+PAIR_DEVIATIONS = {
+    20: [(6, ">=", 4, "SPLIT"), (5, ">=", 5, "SPLIT"), (4, ">=", 6, "SPLIT")],
+    18: [(7, ">=", 3, "SPLIT")],
+}
+
+# Any hand (hard or soft), keyed by total
+TOTAL_DEVIATIONS = {
+    16: [(10, ">", 0, "STAND"), (9, ">=", 4, "STAND"), (11, ">=", 3, "STAND")],
+    15: [(10, ">=", 4, "STAND")],
+    13: [(2, "<=", -1, "HIT"), (3, "<=", -2, "HIT")],
+    12: [(2, ">=", 3, "STAND"), (3, ">=", 2, "STAND"), (4, "<", 0, "HIT")],
+    11: [(11, ">", 0, "DOUBLE")],
+    10: [(10, ">=", 4, "DOUBLE"), (11, ">=", 3, "DOUBLE")],
+}
+
+# Soft totals not covered above, keyed by total
+SOFT_DEVIATIONS = {
+    20: [(6, ">=", 4, "DOUBLE"), (5, ">=", 5, "DOUBLE"), (4, ">=", 6, "DOUBLE")],
+    19: [(6, ">=", 0, "DOUBLE"), (5, ">=", 1, "DOUBLE"), (4, ">=", 3, "DOUBLE"), (3, ">=", 5, "DOUBLE")],
+    17: [(2, ">=", 1, "DOUBLE")],
+}
+
+DEVIATIONS_DICT = {"PAIR": PAIR_DEVIATIONS, "TOTAL": TOTAL_DEVIATIONS, "SOFT": SOFT_DEVIATIONS}
+
+COMPARISONS = {
+    ">=": lambda true_count, index: true_count >= index,
+    ">": lambda true_count, index: true_count > index,
+    "<=": lambda true_count, index: true_count <= index,
+    "<": lambda true_count, index: true_count < index,
+}
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+# Card values 2..11 (A = 11) are indexed 0..9 in a composition
+VALUES = list(range(2, 12))
+# Bumped whenever the generated tables would change for the same rules
+GENERATOR_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+# Dealer outcomes: final totals 17..21, then bust
+DEALER_OUTCOMES = 6
+
+
+def full_composition(num_decks):
+    """Number of cards of each value 2..11 in a fresh shoe."""
+    return tuple(16 * num_decks if value == 10 else 4 * num_decks for value in VALUES)
+
+
+def add_card(total, soft, value):
+    """Add a card value to a (total, soft) hand, counting aces as 11 when possible."""
+    if value == 11:
+        if total + 11 <= 21:
+            return total + 11, True
+        total += 1
+    else:
+        total += value
+    if total > 21 and soft:
+        return total - 10, False
+    return total, soft
+
+
+def _remove(composition, value):
+    index = value - 2
+    return composition[:index] + (composition[index] - 1,) + composition[index + 1:]
+
+
+def dealer_probabilities(upcard, composition, hit_on_soft_17, peek=True):
+    """
+    Probabilities of the dealer finishing on 17, 18, 19, 20, 21 or busting,
+    drawing without replacement from composition (which excludes the upcard).
+    With peek, the hole card is conditioned on the dealer not having blackjack.
+    """
+    @lru_cache(maxsize=None)
+    def draw(total, soft, composition):
+        if total > 21:
+            return (0.0,) * (DEALER_OUTCOMES - 1) + (1.0,)
+        if total > 17 or (total == 17 and not (soft and hit_on_soft_17)):
+            result = [0.0] * DEALER_OUTCOMES
+            result[total - 17] = 1.0
+            return tuple(result)
+        remaining = sum(composition)
+        result = [0.0] * DEALER_OUTCOMES
+        for value, count in zip(VALUES, composition):
+            if count:
+                outcome = draw(*add_card(total, soft, value), _remove(composition, value))
+                for i in range(DEALER_OUTCOMES):
+                    result[i] += count / remaining * outcome[i]
+        return tuple(result)
+
+    up_total, up_soft = add_card(0, False, upcard)
+    remaining = sum(composition)
+    result = [0.0] * DEALER_OUTCOMES
+    weight = 0.0
+    for value, count in zip(VALUES, composition):
+        if not count:
+            continue
+        if peek and {upcard, value} == {10, 11}:
+            continue
+        probability = count / remaining
+        weight += probability
+        outcome = draw(*add_card(up_total, up_soft, value), _remove(composition, value))
+        for i in range(DEALER_OUTCOMES):
+            result[i] += probability * outcome[i]
+    return [p / weight for p in result]
+
+
+class _PlayerEV:
+    """
+    Expected values of the player's options against one dealer upcard.
+    Player draws use fixed probabilities from the composition at the decision
+    (the usual total-dependent approximation); the dealer's final totals come
+    from the exact finite shoe computation.
+    """
+    def __init__(self, dealer, composition, resplit_till):
+        self.dealer = dealer
+        remaining = sum(composition)
+        self.draw = [(value, count / remaining) for value, count in zip(VALUES, composition) if count]
+        self.resplit_till = resplit_till
+        self.stand = lru_cache(maxsize=None)(self._stand)
+        self.best_hit_stand = lru_cache(maxsize=None)(self._best_hit_stand)
+
+    def _stand(self, total):
+        if total > 21:
+            return -1.0
+        bust = self.dealer[-1]
+        ev = bust
+        for dealer_total, probability in zip(range(17, 22), self.dealer):
+            if total > dealer_total:
+                ev += probability
+            elif total < dealer_total:
+                ev -= probability
+        return ev
+
+    def hit(self, total, soft):
+        return sum(p * self.best_hit_stand(*add_card(total, soft, value)) for value, p in self.draw)
+
+    def _best_hit_stand(self, total, soft):
+        if total > 21:
+            return -1.0
+        return max(self.stand(total), self.hit(total, soft))
+
+    def double(self, total, soft):
+        return 2 * sum(p * self.stand(add_card(total, soft, value)[0]) for value, p in self.draw)
+
+    def best(self, total, soft):
+        """EV of the best play of a two card hand, without splitting."""
+        return max(self.best_hit_stand(total, soft), self.double(total, soft))
+
+    def split(self, value, hands=2):
+        """EV of splitting a pair of value into two hands, with resplits up to resplit_till hands."""
+        return 2 * self._split_hand(value, hands)
+
+    def _split_hand(self, value, hands):
+        ev = 0.0
+        for drawn, p in self.draw:
+            total, soft = add_card(*add_card(0, False, value), drawn)
+            if total == 21:
+                # A two card 21 after a split is paid even money without facing the dealer
+                ev += p
+                continue
+            option = self.best(total, soft)
+            if drawn == value and hands < self.resplit_till:
+                option = max(option, self.split(value, hands + 1))
+            ev += p * option
+        return ev
+
+
+def _decide(player_ev, total, soft):
+    """Strategy code for a total: 'D' when doubling is best, else 'H' or 'S'."""
+    stand = player_ev.stand(total)
+    hit = player_ev.hit(total, soft)
+    if player_ev.double(total, soft) > max(stand, hit):
+        return 'D'
+    return 'H' if hit > stand else 'S'
+
+
+def _weighted_hands(composition, total_filter):
+    """Every two card hand (value pair) accepted by total_filter, with its probability."""
+    remaining = sum(composition)
+    for i, first in enumerate(VALUES):
+        for second in VALUES[i:]:
+            first_count = composition[first - 2]
+            second_count = composition[second - 2] - (first == second)
+            probability = first_count / remaining * second_count / (remaining - 1) * (1 if first == second else 2)
+            if probability > 0 and total_filter(first, second):
+                yield first, second, probability
+
+
+def generate_strategy(num_decks=6, hit_on_soft_17=True, resplit_till=4, composition_dependent=False,
+                      cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Compute basic strategy for a rule set, in the PAIR/SOFT/HARD format of strategies.standard_basic.
+
+    With composition_dependent, each two card decision removes the player's own
+    cards from the shoe and the EVs of every hand making up a total are weighted
+    by how likely that hand is; otherwise only the upcard is removed.
+    Like the hand written tables, 'D' means "double if allowed, otherwise hit" (stand for soft 18 and up).
+
+    The blackjack payout is settled before any decision, so it does not change the
+    tables and is not a parameter.
+
+    Generated tables are cached in cache_dir keyed by a hash of the rules;
+    pass cache_dir=None to always recompute.
+    """
+    rules = {
+        "num_decks": num_decks,
+        "hit_on_soft_17": hit_on_soft_17,
+        "resplit_till": resplit_till,
+        "composition_dependent": composition_dependent,
+        "version": GENERATOR_VERSION,
+    }
+    path = None
+    if cache_dir is not None:
+        key = hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"{key}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return _from_json(json.load(f))
+
+    shoe = full_composition(num_decks)
+    pair_actions, soft_actions, hard_actions = {}, {}, {}
+    for up in VALUES:
+        composition = _remove(shoe, up)
+        if composition_dependent:
+            decisions = _composition_dependent_decisions(up, composition, hit_on_soft_17, resplit_till)
+        else:
+            decisions = _total_dependent_decisions(up, composition, hit_on_soft_17, resplit_till)
+        for (kind, key), code in decisions.items():
+            table = {"PAIR": pair_actions, "SOFT": soft_actions, "HARD": hard_actions}[kind]
+            table.setdefault(key, {})
+            if code is not None:
+                table[key][up] = code
+
+    strategy = {"PAIR": pair_actions, "SOFT": soft_actions, "HARD": hard_actions}
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_to_json(strategy), f)
+        os.replace(tmp_path, path)
+    return strategy
+
+
+def _pair_key(value):
+    rank = {10: 'T', 11: 'A'}.get(value, str(value))
+    return (rank, rank)
+
+
+def _total_dependent_decisions(up, composition, hit_on_soft_17, resplit_till):
+    player_ev = _PlayerEV(dealer_probabilities(up, composition, hit_on_soft_17), composition, resplit_till)
+    decisions = {}
+    for total in range(5, 18):
+        decisions["HARD", total] = _decide(player_ev, total, False)
+    for total in range(13, 22):
+        decisions["SOFT", total] = _decide(player_ev, total, True)
+    for value in VALUES:
+        total, soft = add_card(*add_card(0, False, value), value)
+        split = resplit_till > 1 and player_ev.split(value) > player_ev.best(total, soft)
+        decisions["PAIR", _pair_key(value)] = 'P' if split else None
+    return decisions
+
+
+def _composition_dependent_decisions(up, composition, hit_on_soft_17, resplit_till):
+    # EV of each option summed over the two card hands making up each total, weighted by probability
+    sums = {}
+    decisions = {}
+    for first, second, probability in _weighted_hands(composition, lambda a, b: True):
+        remaining = _remove(_remove(composition, first), second)
+        player_ev = _PlayerEV(dealer_probabilities(up, remaining, hit_on_soft_17), remaining, resplit_till)
+        total, soft = add_card(*add_card(0, False, first), second)
+        if first == second:
+            split = resplit_till > 1 and player_ev.split(first) > player_ev.best(total, soft)
+            decisions["PAIR", _pair_key(first)] = 'P' if split else None
+            # Pairs are left to the totals only when they are not split; they count towards them either way
+        if total == 21:
+            continue
+        kind = "SOFT" if soft else "HARD"
+        option_sums = sums.setdefault((kind, total), [0.0, 0.0, 0.0])
+        option_sums[0] += probability * player_ev.stand(total)
+        option_sums[1] += probability * player_ev.hit(total, soft)
+        option_sums[2] += probability * player_ev.double(total, soft)
+
+    # Totals that two cards can't make (hard 4, soft 21 besides blackjack) fall back to total-dependent play
+    fallback = _total_dependent_decisions(up, composition, hit_on_soft_17, resplit_till)
+    for key, code in fallback.items():
+        kind, total = key
+        if kind == "PAIR":
+            continue
+        if key in sums:
+            stand, hit, double = sums[key]
+            if double > max(stand, hit):
+                code = 'D'
+            else:
+                code = 'H' if hit > stand else 'S'
+        decisions[key] = code
+    return decisions
+
+
+def _to_json(strategy):
+    return {
+        "PAIR": [[list(pair), {str(up): code for up, code in rule.items()}] for pair, rule in strategy["PAIR"].items()],
+        "SOFT": {str(total): {str(up): code for up, code in rule.items()} for total, rule in strategy["SOFT"].items()},
+        "HARD": {str(total): {str(up): code for up, code in rule.items()} for total, rule in strategy["HARD"].items()},
+    }
+
+
+def _from_json(data):
+    return {
+        "PAIR": {tuple(pair): {int(up): code for up, code in rule.items()} for pair, rule in data["PAIR"]},
+        "SOFT": {int(total): {int(up): code for up, code in rule.items()} for total, rule in data["SOFT"].items()},
+        "HARD": {int(total): {int(up): code for up, code in rule.items()} for total, rule in data["HARD"].items()},
+    }
@@ -0,0 +1,21 @@
+# Basic strategy surrender for 4-8 decks, by dealer upcard value (2..11).
+# HARD: hard totals to surrender; PAIR: pairs (by card value) to surrender instead of
+# splitting. Soft hands never surrender.
+
+# Late surrender, dealer stands on soft 17
+LATE_SURRENDER_S17 = {
+    "HARD": {9: {16}, 10: {15, 16}, 11: {16}},
+    "PAIR": {},
+}
+
+# Late surrender, dealer hits soft 17
+LATE_SURRENDER_H17 = {
+    "HARD": {9: {16}, 10: {15, 16}, 11: {15, 16, 17}},
+    "PAIR": {11: {8}},
+}
+
+# Early surrender (before the dealer checks for blackjack)
+EARLY_SURRENDER = {
+    "HARD": {9: {16}, 10: {14, 15, 16}, 11: {5, 6, 7, 12, 13, 14, 15, 16, 17}},
+    "PAIR": {10: {7, 8}, 11: {3, 6, 7, 8}},
+}
@@ -0,0 +1,198 @@
+import copy
+import math
+import random
+from collections import defaultdict
+
+from counter import Counter
+from deck import create_single_deck
+from stats import RunningStats
+
+# High-low classes: low cards (2-6) count +1, neutral (7-9) 0, high (10-A) -1
+LOW_RANKS = ["2", "3", "4", "5", "6"]
+HIGH_RANKS = ["10", "J", "Q", "K", "A"]
+
+
+def _log_choose(n, k):
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+
+def _class_sizes(num_decks):
+    return 20 * num_decks, 12 * num_decks, 20 * num_decks
+
+
+def _dealt_splits(num_decks, dealt):
+    """Every (low, high) split of dealt cards with its hypergeometric log probability."""
+    low_size, neutral_size, high_size = _class_sizes(num_decks)
+    log_total = _log_choose(52 * num_decks, dealt)
+    for low in range(min(low_size, dealt) + 1):
+        for high in range(min(high_size, dealt - low) + 1):
+            neutral = dealt - low - high
+            if neutral > neutral_size:
+                continue
+            yield low, high, (_log_choose(low_size, low) + _log_choose(high_size, high)
+                              + _log_choose(neutral_size, neutral) - log_total)
+
+
+def running_count_distribution(num_decks, dealt):
+    """
+    Exact distribution of the high-low running count after dealt cards of a shuffled shoe.
+
+    :return: Dict of running count -> probability.
+    """
+    distribution = defaultdict(float)
+    for low, high, log_probability in _dealt_splits(num_decks, dealt):
+        distribution[low - high] += math.exp(log_probability)
+    return dict(distribution)
+
+
+class StratifiedSampler:
+    """
+    Estimates the house profit per round at chosen true counts by playing rounds
+    from shoes built to be at those counts, instead of waiting for the counts to
+    come up in natural play.
+
+    A state is a depth (cards dealt) and a high-low running count. For each state
+    the dealt cards are drawn from their exact conditional distribution (how many
+    low, neutral and high cards, then which ones), the rest of the shoe is shuffled
+    and one round is played from it at the game's table. States are weighted by how
+    often natural play starts a round in them: the running count's hypergeometric
+    probability at that depth times the chance the cut card has not come out yet.
+    """
+    def __init__(self, game, depth_step=13):
+        """
+        :param game: Game whose players, rules and table play the rounds.
+        :param depth_step: Cards between the depths considered.
+        """
+        if game.side_bets is not None:
+            raise ValueError("Stratified sampling does not support side bets")
+        self.game = game
+        self.num_decks = game.num_decks
+        self.depth_step = depth_step
+        self._template = copy.copy(game.shoe)
+        cards = [card for _ in range(self.num_decks) for card in create_single_deck()]
+        self._low = [card for card in cards if card.rank in LOW_RANKS]
+        self._high = [card for card in cards if card.rank in HIGH_RANKS]
+        self._neutral = [card for card in cards if card.rank not in LOW_RANKS and card.rank not in HIGH_RANKS]
+        # (dealt, running count) -> the possible (low, high) splits and their relative weights
+        self._splits = {}
+
+    def depth_weight(self, dealt):
+        """
+        Relative frequency of rounds starting dealt cards into the shoe: the chance
+        that the cut card (1.2 to 2 decks from the end, as in BlackjackShoe) is deeper.
+        """
+        total_cards = 52 * self.num_decks
+        earliest_cut = total_cards - 104
+        latest_cut = total_cards - 62
+        if dealt < earliest_cut:
+            return 1.0
+        return max(latest_cut - dealt, 0) / (latest_cut - earliest_cut)
+
+    def true_count(self, dealt, running_count):
+        """The high-low true count the game would compute before the deal in this state."""
+        shoe = self._template
+        shoe.deal_index = dealt
+        return running_count / shoe.decks_left()
+
+    def depths(self):
+        """Depths (cards dealt) at which rounds can start, every depth_step cards."""
+        return range(0, 52 * self.num_decks - 62, self.depth_step)
+
+    def states(self, true_counts):
+        """
+        The states whose rounded true count is in true_counts.
+
+        :return: List of (dealt, running count, rounded true count, natural weight).
+        """
+        targets = set(true_counts)
+        states = []
+        for dealt in self.depths():
+            depth_weight = self.depth_weight(dealt) * self.depth_step
+            for running_count, probability in running_count_distribution(self.num_decks, dealt).items():
+                true_count = round(self.true_count(dealt, running_count))
+                if true_count in targets and probability > 0:
+                    states.append((dealt, running_count, true_count, depth_weight * probability))
+        return states
+
+    def sample_shoe(self, dealt, running_count):
+        """
+        A shoe with dealt cards already out and the given high-low running count,
+        and the game counter for it.
+        """
+        if (dealt, running_count) not in self._splits:
+            splits = [(low, high, log_probability) for low, high, log_probability in _dealt_splits(self.num_decks, dealt)
+                      if low - high == running_count]
+            if not splits:
+                raise ValueError(f"Running count {running_count} is impossible after {dealt} cards")
+            largest = max(log_probability for _, _, log_probability in splits)
+            weights = [math.exp(log_probability - largest) for _, _, log_probability in splits]
+            self._splits[dealt, running_count] = (splits, weights)
+        splits, weights = self._splits[dealt, running_count]
+        low, high, _ = random.choices(splits, weights=weights)[0]
+        neutral = dealt - low - high
+
+        dealt_cards = []
+        remaining = []
+        for pool, count in ((self._low, low), (self._high, high), (self._neutral, neutral)):
+            chosen = set(random.sample(range(len(pool)), count))
+            for i, card in enumerate(pool):
+                (dealt_cards if i in chosen else remaining).append(card)
+        # The order of the dealt cards doesn't matter, only the rest of the shoe is shuffled
+        random.shuffle(remaining)
+
+        shoe = copy.copy(self._template)
+        shoe.cards = dealt_cards + remaining
+        shoe.deal_index = dealt
+        shoe.reshuffle_needed = False
+        counter = Counter()
+        counter.high_low_count = low - high
+        counter.five_aces_count = sum(card.rank == "5" for card in dealt_cards) - sum(card.rank == "A" for card in dealt_cards)
+        return shoe, counter
+
+    def estimate(self, true_counts, rounds_per_count=10000):
+        """
+        Estimate the house profit per round at each true count.
+
+        Each true count's rounds are shared between its states in proportion to their
+        natural weights (at least two rounds each, so every state has a variance), and the state means are combined with
+        those weights, so the estimate is for the natural mix of states at that count.
+        The game's shoe and counter are restored afterwards; its bankrolls and collected
+        data include the sampled rounds.
+
+        :return: Dict of true count -> {"ev", "standard_error", "frequency", "rounds"}, where
+            frequency is the natural share of rounds played at that count.
+        """
+        game = self.game
+        shoe, counter = game.shoe, game.counter
+        by_count = defaultdict(list)
+        for state in self.states(true_counts):
+            by_count[state[2]].append(state)
+
+        all_weight = sum(self.depth_weight(dealt) * self.depth_step for dealt in self.depths())
+        results = {}
+        for true_count, states in sorted(by_count.items()):
+            total_weight = sum(weight for _, _, _, weight in states)
+            ev = 0.0
+            variance = 0.0
+            rounds = 0
+            for dealt, running_count, _, weight in states:
+                state_stats = RunningStats()
+                profits = []
+                for _ in range(max(2, round(rounds_per_count * weight / total_weight))):
+                    game.shoe, game.counter = self.sample_shoe(dealt, running_count)
+                    game_round, _ = game.play_round()
+                    profits.append(game_round.dealer_profit)
+                state_stats.update(profits)
+                share = weight / total_weight
+                ev += share * state_stats.mean
+                if state_stats.n > 1:
+                    variance += share * share * state_stats.variance() / state_stats.n
+                rounds += state_stats.n
+            results[true_count] = {
+                "ev": ev,
+                "standard_error": math.sqrt(variance),
+                "frequency": total_weight / all_weight,
+                "rounds": rounds,
+            }
+        game.shoe, game.counter = shoe, counter
+        return results
@@ -0,0 +1,143 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+
+def memory_use():
+    """Resident memory of this process in bytes (peak resident memory where the current is not available), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Telemetry:
+    """
+    Progress records of a long simulation as JSON lines, appended to a file and/or
+    sent to a Unix stream socket (e.g. one opened with `nc -lU`).
+
+    A record has the time, event ("progress" or "done"), rounds played, total_rounds
+    and eta_seconds when the run's length is known, rounds_per_second, the running
+    house profit per round with its confidence interval half width (over
+    estimate_rounds rounds, which can lag rounds by up to every_rounds), the number
+    of reshuffles and the process's memory use in bytes.
+
+    The simulation keeps its own round counter and calls report every every_rounds
+    rounds; with an interval a background thread also reports every interval seconds
+    from the snapshot function given to start. Records that cannot be delivered are
+    dropped, so telemetry never stops a run.
+    """
+    def __init__(self, path=None, socket_path=None, every_rounds=100000, interval=None, confidence=0.95):
+        """
+        :param path: File to append records to.
+        :param socket_path: Unix socket to send records to.
+        :param every_rounds: Rounds between records.
+        :param interval: Seconds between records from the timer thread, or None for no timer.
+        """
+        if path is None and socket_path is None:
+            raise ValueError("Telemetry needs a path or a socket_path")
+        self.path = path
+        self.socket_path = socket_path
+        self.every_rounds = every_rounds
+        self.interval = interval
+        self.confidence = confidence
+        self.total_rounds = None
+        self._file = None
+        self._socket = None
+        self._snapshot = None
+        self._start_time = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, snapshot, total_rounds=None):
+        """
+        Start timing a run.
+        :param snapshot: Function returning the current (rounds, RunningStats of the house profit, reshuffles),
+            called by the timer thread.
+        :param total_rounds: Rounds the run plays from now on, for the ETA, or None if not known.
+        """
+        self._snapshot = snapshot
+        self.total_rounds = total_rounds
+        self._start_time = time.monotonic()
+        if self.path is not None and self._file is None:
+            self._file = open(self.path, "a", buffering=1)
+        if self.interval is not None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run_timer, name="telemetry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the timer, write a final "done" record and close the outputs."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        if self._snapshot is not None:
+            self.report(*self._snapshot(), event="done")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _run_timer(self):
+        while not self._stopped.wait(self.interval):
+            self.report(*self._snapshot())
+
+    def record(self, rounds, stats, reshuffles, event="progress"):
+        """The record for a run that has played rounds rounds (see the class docstring)."""
+        elapsed = time.monotonic() - self._start_time if self._start_time is not None else 0.0
+        rate = rounds / elapsed if elapsed > 0 else None
+        eta = None
+        if rate and self.total_rounds is not None:
+            eta = max(self.total_rounds - rounds, 0) / rate
+        half_width = stats.half_width(self.confidence) if stats.n > 1 else None
+        return {
+            "time": time.time(),
+            "event": event,
+            "rounds": rounds,
+            "total_rounds": self.total_rounds,
+            "rounds_per_second": rate,
+            "eta_seconds": eta,
+            "estimate_rounds": stats.n,
+            "house_profit": stats.mean if stats.n else None,
+            "half_width": half_width,
+            "confidence": self.confidence,
+            "reshuffles": reshuffles,
+            "memory_bytes": memory_use(),
+        }
+
+    def report(self, rounds, stats, reshuffles, event="progress"):
+        line = json.dumps(self.record(rounds, stats, reshuffles, event)) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+            if self.socket_path is not None:
+                self._send(line.encode())
+
+    def _send(self, data):
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.settimeout(1.0)
+                self._socket.connect(self.socket_path)
+            self._socket.sendall(data)
+        except OSError:
+            # Nobody listening (yet): drop the record and reconnect on the next one
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
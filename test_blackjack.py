@@ -5,8 +5,49 @@ from hand import Hand
 from player import Player
 from strategies.strategy import StrategyTable
 from round import BlackjackRound
-from game import Game
+from game import Game, HAND_RESULTS, checkpoint_rounds
 from counter import Counter
+import asyncio
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+from unittest import mock
+import main
+from config import load_config, build_players, config_hash
+from outcomes import OutcomeAccumulator
+from strategies.compiled import CompiledStrategy, HIT, STAND, DOUBLE, SPLIT
+from strategies.generator import generate_strategy
+from trainer import TrainerService
+from deck import ranks
+from player import dealer_upcard_value
+import itertools
+import numpy as np
+import random
+import statistics
+from stats import RunningStats, quantile_bands
+from stratified import StratifiedSampler, running_count_distribution
+from variance_reduction import VarianceReducedRun, antithetic_shoes, true_count_frequencies
+from results_store import ResultsStore
+from wonging import TableScanner
+import count_analysis
+from bet_ramp import CountDistribution
+from shuffle_tracking import CasinoShuffle, TrackedShoe, TrackingRun
+from verification import DifferentialHarness, kernel_engine
+from telemetry import Telemetry
+import json
+import socket
+import sharding
+from rules import Rules
+from batched_env import BatchedTables, strategy_actions
+from kernel import card_values
+from rollout import Spot, rollout
+import hand_states
+import shoe_replay
+from shoe_bank import BankShoe, ShoeBank, build_shoe_bank
+from strategies.generator import dealer_probabilities
+from side_bets import SideBetEngine, perfect_pairs, twenty_one_plus_three, sevens
 
 class TestBlackjackGame(unittest.TestCase):
 
@@ -171,5 +212,970 @@ class TestBlackjackGame(unittest.TestCase):
 
         self.assertEqual(counter.get_high_low_count(), 0)
 
+class TestOutcomeAccumulator(unittest.TestCase):
+
+    def play_rigged_round(self, cards):
+        shoe = BlackjackShoe(num_decks=2)
+        shoe.cards = cards + shoe.cards
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        player.hands[0].put_initial_bet(10)
+        outcomes = OutcomeAccumulator()
+        game_round = BlackjackRound(shoe=shoe, players=[player], dealer=Dealer(hit_on_soft_17=True, hand=Hand()), blackjack_payout=1.5, counter=Counter(), outcomes=outcomes)
+        game_round.play_round()
+        outcomes.flush()
+        return outcomes
+
+    def test_records_first_decision(self):
+        # Player 10, 7 stands against a dealer 10 up and 9 in the hole
+        outcomes = self.play_rigged_round([Card("10", "Hearts"), Card("9", "Clubs"), Card("7", "Spades"), Card("10", "Diamonds")])
+        stand = outcomes.counts(action="STAND")
+        self.assertEqual(outcomes.count.sum(), 1)
+        self.assertEqual(stand[8, 17 - 5], 1)
+        self.assertEqual(outcomes.ev(action="STAND")[8, 17 - 5], -1)
+        self.assertEqual(outcomes.win_rate()[8, 17 - 5], 0)
+
+    def test_split_scored_on_all_hands(self):
+        # Player 8, 8 splits against a dealer 6, drawing 10s to both hands; dealer 6, 10 then busts with a 10
+        outcomes = self.play_rigged_round([Card("8", "Hearts"), Card("10", "Clubs"), Card("8", "Spades"), Card("6", "Diamonds"),
+                                           Card("10", "Hearts"), Card("10", "Spades"), Card("10", "Diamonds")])
+        split = outcomes.counts(action="SPLIT")
+        self.assertEqual(split.sum(), 1)
+        self.assertEqual(outcomes.ev(action="SPLIT")[4, 23 + 8], 2)
+        self.assertEqual(outcomes.counts(action="STAND")[4, 18 - 5], 2)
+
+class TestSideBets(unittest.TestCase):
+
+    def settle(self, first, second, upcard, side_bet):
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand([first, second])])
+        engine = SideBetEngine([side_bet])
+        house_profit = engine.settle([player], upcard, decks_left=6)
+        self.assertEqual(player.bankroll, -house_profit)
+        return player.bankroll
+
+    def test_payout_tables(self):
+        self.assertEqual(self.settle(Card("7", "Hearts"), Card("7", "Hearts"), Card("7", "Hearts"), sevens(stake=1)), 500)
+        self.assertEqual(self.settle(Card("7", "Hearts"), Card("2", "Clubs"), Card("K", "Spades"), sevens(stake=1)), 2)
+        self.assertEqual(self.settle(Card("Q", "Hearts"), Card("K", "Hearts"), Card("A", "Hearts"), twenty_one_plus_three(stake=1)), 40)
+        self.assertEqual(self.settle(Card("Q", "Hearts"), Card("K", "Clubs"), Card("2", "Hearts"), twenty_one_plus_three(stake=1)), -1)
+        self.assertEqual(self.settle(Card("8", "Hearts"), Card("8", "Diamonds"), Card("2", "Clubs"), perfect_pairs(stake=1)), 12)
+        self.assertEqual(self.settle(Card("8", "Hearts"), Card("8", "Spades"), Card("2", "Clubs"), perfect_pairs(stake=1)), 6)
+
+    def test_side_count(self):
+        engine = SideBetEngine([sevens()])
+        engine.update_count(create_single_deck())
+        self.assertEqual(engine.running_counts[0], 0)
+        engine.update_count([Card("7", "Clubs"), Card("2", "Clubs")])
+        self.assertEqual(engine.running_counts[0], -11)
+
+class TestCompiledStrategy(unittest.TestCase):
+
+    def test_matches_player_actions(self):
+        """
+        The compiled tables should give the same action as Player.get_action for every two card hand.
+        """
+        compiled = CompiledStrategy(StrategyTable["MULTIDECK"])
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], high_low_counting=True, playing_deviations=True)
+        values = {"A": 11, "K": 10, "Q": 10, "J": 10, "10": 10}
+        for first, second, up in itertools.product(ranks, ranks, ranks):
+            hand = Hand([Card(first, "Clubs"), Card(second, "Hearts")])
+            pair_value = (values.get(first) or int(first)) if hand.is_pair() else 0
+            upcard = Card(up, "Spades")
+            for true_count in (-3, -0.5, 0, 1, 3.5, 6):
+                expected = player.get_action(hand, upcard, 4, true_count)
+                actual = compiled.action(hand.value, hand.soft, pair_value, 2, dealer_upcard_value(upcard), true_count, can_split=True, use_deviations=True)
+                self.assertEqual(expected, actual, (first, second, up, true_count))
+
+class TestStrategyGenerator(unittest.TestCase):
+
+    def test_generated_strategy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            strategy = generate_strategy(num_decks=6, hit_on_soft_17=True, resplit_till=4, cache_dir=tmp)
+            self.assertEqual(len(os.listdir(tmp)), 1)
+            cached = generate_strategy(num_decks=6, hit_on_soft_17=True, resplit_till=4, cache_dir=tmp)
+        self.assertEqual(strategy, cached)
+        # A few plays every multi-deck basic strategy agrees on
+        self.assertEqual(strategy["HARD"][16][10], 'H')
+        self.assertEqual(strategy["HARD"][12][4], 'S')
+        self.assertEqual(strategy["HARD"][11][6], 'D')
+        self.assertEqual(strategy["SOFT"][18][9], 'H')
+        self.assertEqual(strategy["PAIR"][('8', '8')][10], 'P')
+        self.assertNotIn(10, strategy["PAIR"][('T', 'T')])
+        # The generated table plugs straight into a Player
+        player = Player(name="Test Player", strategy=strategy, bankroll=0, hands=[Hand()])
+        hand = Hand([Card("10", "Clubs"), Card("6", "Hearts")])
+        self.assertEqual(player.get_action(hand, Card("K", "Spades"), 4, 0), "HIT")
+
+class TestTrainer(unittest.TestCase):
+
+    def test_session_flow(self):
+        service = TrainerService()
+        status, response = service.handle("POST", "/sessions", {"num_decks": 2})
+        self.assertEqual(status, 200)
+        session = f"/sessions/{response['session']}"
+        self.assertEqual(service.handle("GET", f"{session}/advice")[0], 400)
+        status, spot = service.handle("POST", f"{session}/deal")
+        self.assertEqual(len(spot["player"]), 2)
+        status, advice = service.handle("GET", f"{session}/advice")
+        status, feedback = service.handle("POST", f"{session}/answer", {"action": advice["action"], "running_count": advice["running_count"]})
+        self.assertTrue(feedback["action_correct"])
+        self.assertTrue(feedback["count_correct"])
+        self.assertEqual(service.handle("DELETE", session)[0], 200)
+        self.assertEqual(service.handle("POST", f"{session}/deal")[0], 404)
+        self.assertEqual(service.handle("POST", "/sessions", [1, 2])[0], 400)
+
+    def test_invalid_fields(self):
+        """Fields of the wrong type or out of range get a 400 instead of failing in the session."""
+        service = TrainerService()
+        for body in ({"num_decks": "6"}, {"num_decks": 0}, {"num_decks": True}, {"resplit_till": -1},
+                     {"resplit_till": 2.5}, {"deviations": "yes"}):
+            self.assertEqual(service.handle("POST", "/sessions", body)[0], 400, body)
+        self.assertEqual(service.sessions, {})
+        _, response = service.handle("POST", "/sessions")
+        session = f"/sessions/{response['session']}"
+        service.handle("POST", f"{session}/deal")
+        for body in ({"action": 5}, {"running_count": "3"}, {"running_count": 1.5}):
+            self.assertEqual(service.handle("POST", f"{session}/answer", body)[0], 400, body)
+        # A rejected answer leaves the spot open
+        self.assertEqual(service.handle("POST", f"{session}/answer", {"action": "hit"})[0], 200)
+
+    def test_malformed_requests(self):
+        """Requests that can't be parsed get a 400 instead of a dropped connection."""
+        async def exchange(request):
+            server = await asyncio.start_server(TrainerService().handle_connection, "127.0.0.1", 0)
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                writer.write(request)
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                return response
+        for request in (b"GARBAGE\r\n\r\n",
+                        b"POST /sessions HTTP/1.1\r\nContent-Length: ten\r\n\r\n",
+                        b"POST /sessions HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n[]"):
+            self.assertTrue(asyncio.run(exchange(request)).startswith(b"HTTP/1.1 400"), request)
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_resume_matches_uninterrupted_run(self):
+        """
+        A run resumed from a mid-game checkpoint should end in the same state as one that was never interrupted.
+        """
+        config = load_config()
+        config.update(rounds=70, games=2, seed=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.ckpt")
+            saved = []
+            def save(path, state):
+                saved.append(pickle.dumps(state))
+            with contextlib.redirect_stdout(io.StringIO()):
+                with mock.patch("main.save_checkpoint", side_effect=save):
+                    full = main.run(main.new_state(config), checkpoint_path=path, checkpoint_every=30)
+                with open(path, "wb") as f:
+                    f.write(saved[0])
+                resumed = main.run(main.resume(path))
+
+        self.assertEqual(vars(full["totals"]), vars(resumed["totals"]))
+        self.assertEqual(full["game_results"], resumed["game_results"])
+
+    def test_resumed_progress_counts_new_rounds(self):
+        """Telemetry of a resumed run should count only the rounds it plays itself."""
+        config = load_config()
+        config.update(rounds=70, games=2, seed=7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.ckpt")
+            saved = []
+            def save(path, state):
+                saved.append(pickle.dumps(state))
+            with contextlib.redirect_stdout(io.StringIO()):
+                with mock.patch("main.save_checkpoint", side_effect=save):
+                    main.run(main.new_state(config), checkpoint_path=path, checkpoint_every=30)
+                progress = os.path.join(tmp, "progress.jsonl")
+                resumed = main.run(pickle.loads(saved[0]), telemetry=Telemetry(progress, every_rounds=50))
+            with open(progress) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual([record["rounds"] for record in records], [50, 100, 110])
+        self.assertEqual(records[-1]["total_rounds"], 110)
+        self.assertEqual(records[-1]["estimate_rounds"], resumed["totals"].n)
+
+class TestJitEngine(unittest.TestCase):
+
+    def test_matches_object_engine(self):
+        """
+        With the same seed the jit engine should play the same shoes to the same bankrolls as the object engine.
+        """
+        results = []
+        for engine in ("object", "jit"):
+            random.seed(3)
+            players = [
+                Player(name="High-Low", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], min_bet=25, denominations=100, high_low_counting=True, playing_deviations=True),
+                Player(name="Ace-Five", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], ace_five_counting=True),
+            ]
+            game = Game(6, players, hit_on_soft_17=False, resplit_till=3, engine=engine)
+            profits, count_data = game.play(2000, print_summary=False)
+            results.append((profits, dict(count_data), game.house_bankroll, [player.bankroll for player in game.players], game.shoe.deal_index))
+        self.assertEqual(results[0], results[1])
+
+class TestAdaptiveStopping(unittest.TestCase):
+
+    def test_running_stats_merge(self):
+        """
+        Merging chunked running statistics should match the statistics of the whole series.
+        """
+        values = [random.gauss(0, 10) for _ in range(1000)]
+        stats = RunningStats()
+        for i in range(0, 1000, 300):
+            stats.update(values[i:i + 300])
+        self.assertEqual(stats.n, 1000)
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.variance(), statistics.variance(values))
+
+    def test_stops_at_target_precision(self):
+        """
+        With a target precision the game should stop at the first chunk that reaches it.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        game = Game(6, [player])
+        profits, _ = game.play(None, print_summary=False, precision=1.5, chunk_size=100)
+        self.assertEqual(len(profits) % 100, 0)
+        self.assertEqual(game.round_stats.n, len(profits))
+        self.assertLessEqual(game.round_stats.half_width(), 1.5)
+        game.round_stats = RunningStats().update(profits[:-100])
+        self.assertGreater(game.round_stats.half_width(), 1.5)
+
+class TestStratifiedSampler(unittest.TestCase):
+
+    def test_running_count_distribution(self):
+        """
+        The running count distribution should sum to one and be symmetric around zero.
+        """
+        distribution = running_count_distribution(2, 40)
+        self.assertAlmostEqual(sum(distribution.values()), 1.0)
+        self.assertAlmostEqual(distribution[5], distribution[-5])
+
+    def test_sampled_shoe_is_at_count(self):
+        """
+        A sampled shoe should have the requested cards dealt, the requested running count and a full shoe of cards.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        sampler = StratifiedSampler(Game(6, [player]))
+        shoe, counter = sampler.sample_shoe(104, 12)
+        recount = Counter()
+        for card in shoe.cards[:shoe.deal_index]:
+            recount.update_count(card)
+        self.assertEqual(shoe.deal_index, 104)
+        self.assertEqual(recount.get_high_low_count(), 12)
+        self.assertEqual(counter.get_five_aces_count(), recount.get_five_aces_count())
+        self.assertEqual(sorted(card.code for card in shoe.cards), sorted(card.code for card in create_shoe(6)))
+
+        results = sampler.estimate([5], rounds_per_count=200)
+        self.assertEqual(list(results), [5])
+        self.assertGreaterEqual(results[5]["rounds"], 200)
+
+    def test_standard_error_covers_spread(self):
+        """
+        Repeated estimates should scatter around their mean as the reported standard errors say,
+        with states too light for a round in proportion still getting enough rounds for a variance.
+        """
+        random.seed(11)
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        sampler = StratifiedSampler(Game(6, [player]))
+        results = [sampler.estimate([0], rounds_per_count=50)[0] for _ in range(12)]
+        evs = np.array([result["ev"] for result in results])
+        errors = np.array([result["standard_error"] for result in results])
+        truth = evs.mean()
+        self.assertGreaterEqual(np.sum(np.abs(evs - truth) <= 1.96 * errors), 10)
+        self.assertGreater(np.sqrt(np.mean(errors ** 2)) / evs.std(ddof=1), 0.75)
+
+class TestVarianceReduction(unittest.TestCase):
+
+    def test_estimates(self):
+        """
+        Antithetic runs should play whole shoe pairs, and the control variates should not widen the interval.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        run = VarianceReducedRun(Game(6, [player]), antithetic=True).play(2000)
+        self.assertEqual(sum(rounds for _, rounds in run.pairs), len(run.profits))
+        estimates = run.estimates()
+        self.assertEqual(set(estimates), {"raw", "antithetic", "control_variates", "post_stratified"})
+        self.assertAlmostEqual(estimates["raw"][0], estimates["antithetic"][0])
+        self.assertLessEqual(estimates["control_variates"][1], estimates["raw"][1])
+
+    def test_single_round_counts_are_pooled(self):
+        """
+        A true count with a single round should be pooled with the nearest count that has more,
+        so it adds to the standard error as well as to the estimate.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        run = VarianceReducedRun(Game(6, [player]))
+        rng = np.random.default_rng(0)
+        run.profits = rng.normal(0, 10, 100).tolist() + [400.0]
+        run.true_counts = [0.0] * 50 + [1.0] * 50 + [4.0]
+        run.controls = rng.normal(0, 1, (101, 3)).tolist()
+        frequencies = true_count_frequencies(run.game, run.depth_step)
+        profits = np.array(run.profits)
+        zero, pooled = profits[:50], profits[50:]
+        weights = (frequencies[0], frequencies[1] + frequencies[4])
+        mean, standard_error = run.estimates()["post_stratified"]
+        self.assertAlmostEqual(mean, (weights[0] * zero.mean() + weights[1] * pooled.mean()) / sum(weights))
+        variance = weights[0] ** 2 * zero.var(ddof=1) / zero.size + weights[1] ** 2 * pooled.var(ddof=1) / pooled.size
+        self.assertAlmostEqual(standard_error, np.sqrt(variance) / sum(weights))
+
+    def test_antithetic_shoes_are_full(self):
+        """
+        An antithetic pair should be two different orders of the same cards with one cut card position.
+        """
+        first, second = antithetic_shoes(2)
+        self.assertEqual(first.cut_index, second.cut_index)
+        self.assertEqual(sorted(card.code for card in first.cards), sorted(card.code for card in second.cards))
+        self.assertNotEqual([card.code for card in first.cards], [card.code for card in second.cards])
+
+class TestResultsStore(unittest.TestCase):
+
+    def test_round_trip(self):
+        """
+        A stored run should load back with the same totals, per count totals and outcome tensor.
+        """
+        config = load_config()
+        config.update(rounds=200, games=1, seed=5)
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = main.run(main.new_state(config))
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ResultsStore(os.path.join(tmp, "results.db"))
+            self.assertFalse(store.has_run(config))
+            store.save_run(state)
+            self.assertTrue(store.has_run(config))
+            loaded = store.load_run(config)
+            store.close()
+
+        self.assertEqual(loaded["game_results"], state["game_results"])
+        self.assertEqual(sorted(loaded["count_totals"]), sorted(state["count_totals"]))
+        # The store keeps sums, so statistics come back to within rounding
+        for count in state["count_totals"]:
+            for loaded_stats, stats in ((loaded["totals"], state["totals"]), (loaded["count_totals"][count], state["count_totals"][count])):
+                self.assertEqual(loaded_stats.n, stats.n)
+                self.assertAlmostEqual(loaded_stats.mean, stats.mean)
+                self.assertAlmostEqual(loaded_stats.m2, stats.m2, delta=1e-9 * max(stats.m2, 1.0))
+        self.assertTrue((loaded["outcomes"].count == state["outcomes"].count).all())
+        self.assertTrue((loaded["outcomes"].ev() == state["outcomes"].ev()).all())
+
+    def test_hash_ignores_later_defaults_and_output_options(self):
+        """Adding options at their defaults, or output-only ones, keeps the hashes of stored runs."""
+        config = load_config()
+        older = {key: value for key, value in config.items() if key not in ("bankroll_checkpoints", "shoe_bank")}
+        older["rules"] = {key: config["rules"][key] for key in ("num_decks", "hit_on_soft_17", "resplit_till", "blackjack_payout")}
+        self.assertEqual(config_hash(config), config_hash(older))
+        self.assertEqual(config_hash(dict(config, bankroll_checkpoints={"points": 50})), config_hash(config))
+        self.assertNotEqual(config_hash(dict(config, shoe_bank={"path": "shoes.npy"})), config_hash(config))
+        self.assertNotEqual(config_hash(dict(config, rules=dict(config["rules"], surrender="late"))), config_hash(config))
+
+class TestWonging(unittest.TestCase):
+
+    def test_fast_forward_counts_every_card(self):
+        """
+        Fast forwarded rounds should only deal cards and keep the count of everything dealt.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        game = Game(6, [player])
+        for _ in range(20):
+            game.fast_forward_round(seats=3)
+        recount = Counter()
+        for card in game.shoe.cards[:game.shoe.deal_index]:
+            recount.update_count(card)
+        self.assertEqual(game.counter.get_high_low_count(), recount.get_high_low_count())
+        self.assertEqual(game.house_bankroll, 0)
+        self.assertEqual(player.bankroll, 0)
+
+    def test_scanner_plays_only_at_good_counts(self):
+        """
+        The scanner should play at most one table per round, and only at true counts of at least wong_out.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], high_low_counting=True)
+        games = [Game(6, [player]) for _ in range(3)]
+        scanner = TableScanner(games, wong_in=2, wong_out=0)
+        profits = scanner.run(1000)
+        self.assertEqual(len(profits), sum(scanner.rounds_played))
+        self.assertLessEqual(len(profits), 1000)
+        for played, watched in zip(scanner.rounds_played, scanner.rounds_watched):
+            self.assertEqual(played + watched, 1000)
+        self.assertTrue(all(true_count >= 0 for true_count in scanner.true_counts))
+        self.assertEqual(sum(profits), sum(game.house_bankroll for game in games))
+
+class TestCountAnalysis(unittest.TestCase):
+
+    def test_game_decks_left_policy(self):
+        """
+        The game policy should divide by the same decks left as BlackjackShoe.
+        """
+        shoe = BlackjackShoe(6)
+        for deal_index in range(0, 312, 7):
+            shoe.deal_index = deal_index
+            self.assertEqual(count_analysis.decks_left(deal_index, 6), shoe.decks_left())
+
+    def test_deeper_penetration_reaches_higher_counts(self):
+        """
+        Frequencies should sum to one and high counts should be more common with deeper penetration.
+        """
+        frequencies = count_analysis.true_count_frequencies(6, penetrations=(0.5, 0.9), num_shoes=2000, seed=1)
+        for penetration in (0.5, 0.9):
+            self.assertAlmostEqual(sum(frequencies[penetration].values()), 1.0)
+        self.assertGreater(count_analysis.frequency_at_least(frequencies[0.9], 3), count_analysis.frequency_at_least(frequencies[0.5], 3))
+
+class TestBetRamp(unittest.TestCase):
+
+    def test_flat_ramp_matches_run(self):
+        """
+        Evaluating the run's own flat bet should give back its mean and standard deviation, and a
+        doubled flat bet twice both.
+        """
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], min_bet=10)
+        profits, count_data = Game(6, [player]).play(3000, print_summary=False)
+        distribution = CountDistribution.from_count_data(count_data, 10)
+        flat = distribution.evaluate({0: 10})
+        self.assertAlmostEqual(flat["ev"], -statistics.mean(profits))
+        self.assertAlmostEqual(flat["sd"], statistics.pstdev(profits))
+        doubled = distribution.evaluate({0: 20}, bankroll=1000)
+        self.assertAlmostEqual(doubled["ev"], 2 * flat["ev"])
+        self.assertAlmostEqual(doubled["sd"], 2 * flat["sd"])
+
+        ramps = [{0: 10, 2: 40}, {-1: 0, 1: 10, 3: 80}]
+        many = distribution.evaluate_many([distribution.bets(ramp) for ramp in ramps], bankroll=1000)
+        for i, ramp in enumerate(ramps):
+            single = distribution.evaluate(ramp, bankroll=1000)
+            for name, value in single.items():
+                self.assertAlmostEqual(many[name][i], value)
+
+class TestShuffleTracking(unittest.TestCase):
+
+    def test_casino_shuffle_keeps_cards(self):
+        """The modeled shuffle should only reorder the tray, and its nominal order should be a permutation."""
+        shoe = TrackedShoe(6)
+        shoe.deal_index = 230
+        next_shoe = shoe.next_shoe()
+        self.assertIsInstance(next_shoe, TrackedShoe)
+        self.assertEqual(sorted(card.code for card in next_shoe.cards), sorted(card.code for card in shoe.cards))
+        self.assertEqual(sorted(CasinoShuffle().nominal_order(312, 100)), list(range(312)))
+
+    def test_tracker_counts(self):
+        """Prefix sum lookups should match summing the expected tags."""
+        shoe = TrackedShoe(6)
+        shoe.deal_index = 250
+        tracker = shoe.next_shoe().tracker
+        self.assertAlmostEqual(tracker.expected_count(40, 52), tracker.expected_tags[40:92].sum())
+        self.assertEqual(tracker.tracked_true_count(312), 0.0)
+
+    def test_game_reshuffles_tracked_shoes(self):
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        game = Game(6, [player], shoe=TrackedShoe(6))
+        run = TrackingRun(game).play(300)
+        self.assertIsInstance(game.shoe, TrackedShoe)
+        self.assertIsNotNone(game.shoe.tracker)
+        self.assertGreater(sum(totals.n for totals in run.count_totals.values()), 0)
+        with self.assertRaises(ValueError):
+            TrackingRun(Game(6, [player]))
+
+class TestDifferentialHarness(unittest.TestCase):
+
+    @staticmethod
+    def make_players():
+        return [
+            Player(name="High-Low", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], min_bet=25, denominations=100, high_low_counting=True, playing_deviations=True),
+            Player(name="Ace-Five", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], ace_five_counting=True),
+        ]
+
+    def test_kernel_matches_reference(self):
+        """Payouts, actions, cards and counts of every round should be identical for the same shoes."""
+        for rules in ({}, {"hit_on_soft_17": False, "resplit_till": 2, "blackjack_payout": 1.2}):
+            harness = DifferentialHarness(self.make_players, 6, **rules)
+            self.assertEqual(harness.compare_exact(range(5)), [])
+
+    def test_detects_drift(self):
+        """An engine paying 3:2 at a 6:5 table should be caught by both comparisons."""
+        def wrong_payout(players, shoe, rules):
+            return kernel_engine(players, shoe, dict(rules, blackjack_payout=1.5))
+        harness = DifferentialHarness(self.make_players, 6, engine=wrong_payout, blackjack_payout=1.2)
+        mismatches = harness.compare_exact(range(5))
+        self.assertIn("profit", [mismatch.field for mismatch in mismatches])
+        self.assertLess(harness.compare_statistics(5000)["distribution_p_value"], 0.01)
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_progress_records(self):
+        """A record every every_rounds rounds and a final one, sent to the file and the socket alike."""
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        game = Game(6, [player])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "progress.jsonl")
+            socket_path = os.path.join(tmp, "progress.sock")
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(socket_path)
+            server.listen(1)
+            game.play(2500, print_summary=False, telemetry=Telemetry(path, socket_path, every_rounds=1000))
+            connection, _ = server.accept()
+            received = b""
+            while True:
+                data = connection.recv(65536)
+                if not data:
+                    break
+                received += data
+            connection.close()
+            server.close()
+            with open(path) as f:
+                lines = f.read()
+
+        self.assertEqual(received.decode(), lines)
+        records = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual([record["rounds"] for record in records], [1000, 2000, 2500, 2500])
+        self.assertEqual(records[-1]["event"], "done")
+        self.assertEqual(records[-1]["reshuffles"], game.reshuffles)
+        self.assertAlmostEqual(records[-1]["house_profit"], game.round_stats.mean)
+        self.assertEqual(records[-1]["eta_seconds"], 0)
+
+class TestRules(unittest.TestCase):
+
+    @staticmethod
+    def play(rules, player_cards, hole, upcard, draws, bet=10):
+        """Play one round with a rigged shoe and return the player and the finished round."""
+        cards = [Card(rank, "Spades") for rank in [player_cards[0], hole, player_cards[1], upcard] + draws + ["2"] * 20]
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand(bet=bet)])
+        player.rules = rules
+        game_round = BlackjackRound(BlackjackShoe(1, cards=cards), [player], Dealer(hit_on_soft_17=rules.hit_on_soft_17, hand=Hand()),
+                                    rules.blackjack_payout, resplit_till=rules.resplit_till, counter=Counter(), rules=rules)
+        game_round.play_round()
+        return player, game_round
+
+    def test_late_surrender(self):
+        player, game_round = self.play(Rules(surrender="late"), ["10", "6"], "7", "10", [])
+        self.assertEqual(player.hands[0].hand_status, "SURRENDER")
+        self.assertEqual(game_round.dealer_profit, 5)
+        player, game_round = self.play(Rules(), ["10", "6"], "7", "10", ["10"])
+        self.assertEqual(game_round.dealer_profit, 10)
+
+    def test_no_hole_card_blackjack(self):
+        """Without peek a doubled 11 loses both bets to a dealer blackjack, or only the original bet with OBO."""
+        player, game_round = self.play(Rules(dealer_peek=False), ["5", "6"], "A", "10", ["9"])
+        self.assertTrue(player.hands[0].double)
+        self.assertEqual(game_round.dealer_profit, 20)
+        player, game_round = self.play(Rules(dealer_peek=False, original_bets_only=True), ["5", "6"], "A", "10", ["9"])
+        self.assertEqual(game_round.dealer_profit, 10)
+        self.assertIsInstance(player.hands[0].bet, int)
+        with self.assertRaises(ValueError):
+            Rules(surrender="late", dealer_peek=False)
+        player, game_round = self.play(Rules(), ["5", "6"], "A", "10", [])
+        self.assertEqual(len(player.hands[0].cards), 2)
+        self.assertEqual(game_round.dealer_profit, 10)
+
+    def test_split_aces(self):
+        """Split aces that cannot draw stand on two cards."""
+        player, _ = self.play(Rules(hit_split_aces=False), ["A", "A"], "10", "6", ["4", "3"])
+        self.assertEqual([len(hand.cards) for hand in player.hands], [2, 2])
+        player, _ = self.play(Rules(), ["A", "A"], "10", "6", ["4", "3"])
+        self.assertGreater(len(player.hands[0].cards), 2)
+
+    def test_double_restrictions(self):
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        nine = Hand([Card("5", "Spades"), Card("4", "Spades")])
+        soft_seventeen = Hand([Card("A", "Spades"), Card("6", "Spades")])
+        self.assertEqual(player.get_action(nine, Card("4", "Hearts"), 4, 0), "DOUBLE")
+        player.rules = Rules(double_on="10-11")
+        self.assertEqual(player.get_action(nine, Card("4", "Hearts"), 4, 0), "HIT")
+        player.rules = Rules(double_on="9-11")
+        self.assertEqual(player.get_action(nine, Card("4", "Hearts"), 4, 0), "DOUBLE")
+        self.assertEqual(player.get_action(soft_seventeen, Card("4", "Hearts"), 4, 0), "HIT")
+        player.rules = Rules(double_after_split=False)
+        nine.was_split = True
+        self.assertEqual(player.get_action(nine, Card("4", "Hearts"), 4, 0), "HIT")
+
+        # An index play to double soft 19 or 20 the table doesn't allow stands instead
+        counter = Player(name="Counter", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], high_low_counting=True, playing_deviations=True)
+        soft_nineteen = Hand([Card("A", "Spades"), Card("8", "Spades")])
+        soft_twenty = Hand([Card("A", "Spades"), Card("9", "Spades")])
+        self.assertEqual(counter.get_action(soft_twenty, Card("6", "Hearts"), 4, 5), "DOUBLE")
+        for rules in (Rules(double_on="10-11"), Rules(double_after_split=False)):
+            counter.rules = rules
+            for hand in (soft_nineteen, soft_twenty):
+                hand.was_split = not rules.double_after_split
+                self.assertEqual(counter.get_action(hand, Card("6", "Hearts"), 4, 5), "STAND")
+        counter.rules = Rules()
+        three_card_nineteen = Hand([Card("A", "Spades"), Card("4", "Spades"), Card("4", "Hearts")])
+        self.assertEqual(counter.get_action(three_card_nineteen, Card("6", "Hearts"), 4, 5), "STAND")
+
+    def test_game_rules(self):
+        rules = Rules(surrender="early", hit_on_soft_17=False, resplit_till=2)
+        player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+        game = Game(6, [player], rules=rules)
+        self.assertIs(player.rules, rules)
+        self.assertFalse(game.dealer.hit_on_soft_17)
+        self.assertEqual(game.resplit_till, 2)
+        game.play(200, print_summary=False)
+        with self.assertRaises(ValueError):
+            Game(6, [player], rules=rules, engine="jit")
+
+    def test_generated_strategy_rules(self):
+        config = load_config()
+        config["players"][0]["strategy"] = "GENERATED"
+        config["rules"].update(surrender="late", double_on="10-11")
+        with self.assertRaisesRegex(ValueError, "double_on"):
+            build_players(config)
+
+class TestIterRounds(unittest.TestCase):
+
+    def make_game(self, seed):
+        random.seed(seed)
+        players = [Player(name=f"Player {i}", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], high_low_counting=True) for i in range(2)]
+        return Game(6, players)
+
+    def test_records_match_play(self):
+        game = self.make_game(7)
+        profits, _ = game.play(500, print_summary=False)
+        streamed = self.make_game(7)
+        records = np.concatenate(list(streamed.iter_rounds(500, batch_size=128)))
+        self.assertEqual([len(batch) for batch in self.make_game(7).iter_rounds(500, batch_size=128)], [128, 128, 128, 116])
+        self.assertEqual(records["profit"].tolist(), profits)
+        self.assertEqual(records["round"].tolist(), list(range(500)))
+        self.assertEqual(streamed.house_bankroll, game.house_bankroll)
+        self.assertEqual(streamed.round_stats.n, 500)
+        self.assertEqual(int(records["reshuffled"].sum()), streamed.reshuffles)
+        # Without insurance the house wins what the hands lose
+        no_insurance = records["dealer_upcard"] != 11
+        np.testing.assert_allclose(records["profit"][no_insurance], -records["payout"].sum(axis=1)[no_insurance])
+        for record in records[:50]:
+            hands = record["hands"]
+            self.assertTrue((record["seat"][:hands] >= 0).all())
+            self.assertTrue((record["result"][hands:] == -1).all())
+            self.assertTrue(all(HAND_RESULTS[result] for result in record["result"][:hands]))
+
+    def test_extra_hand_at_high_count(self):
+        random.seed(11)
+        player = Player(name="P", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()],
+                        high_low_counting=True, playing_two_hands_with_high_true_count=True)
+        game = Game(6, [player])
+        records = np.concatenate(list(game.iter_rounds(20000, batch_size=1000)))
+        # The extra spot is played at high counts only, and never more than once per round
+        self.assertTrue((records["seat"][records["high_low_true_count"] > 1] == 1).any(axis=1).any())
+        self.assertTrue((records["seat"] <= 1).all())
+        self.assertTrue((records["seat"][records["high_low_true_count"] <= 1] != 1).all())
+
+    def test_single_records(self):
+        game = self.make_game(3)
+        rounds = game.iter_rounds(100)
+        first = next(rounds)
+        self.assertEqual(first["round"], 0)
+        rounds.close()
+        # Stopping early only plays the rounds consumed
+        self.assertEqual(game.rounds_played, 1)
+        self.assertEqual(game.round_stats.n, 1)
+        with self.assertRaises(ValueError):
+            next(Game(6, [Player(name="P", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])], engine="jit").iter_rounds(1))
+
+class TestBankrollCheckpoints(unittest.TestCase):
+
+    def test_checkpoint_rounds(self):
+        checkpoints = checkpoint_rounds(100000, points=30)
+        self.assertEqual(checkpoints[0], 1)
+        self.assertEqual(checkpoints[-1], 100000)
+        self.assertTrue((np.diff(checkpoints) > 0).all())
+        self.assertLessEqual(len(checkpoints), 30)
+        self.assertEqual(checkpoint_rounds(10, stride=4).tolist(), [4, 8, 10])
+        with self.assertRaises(ValueError):
+            Game(6, [Player(name="P", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])], bankroll_checkpoints=[0, 5])
+
+    def test_engines_record_the_same_bankrolls(self):
+        histories = []
+        for engine in ("object", "jit"):
+            random.seed(11)
+            players = [Player(name=f"Player {i}", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()], high_low_counting=True) for i in range(2)]
+            game = Game(6, players, engine=engine, bankroll_checkpoints=checkpoint_rounds(300, points=12))
+            game.play(300, print_summary=False)
+            self.assertEqual(game.bankroll_history[-1].tolist(), [players[0].bankroll, players[1].bankroll, game.house_bankroll])
+            histories.append(game.bankroll_history)
+        np.testing.assert_array_equal(histories[0], histories[1])
+
+    def test_bands_across_games(self):
+        config = load_config()
+        config.update(games=6, rounds=200, seed=5, bankroll_checkpoints={"points": 10})
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = main.run(main.new_state(config))
+        self.assertEqual(len(state["bankroll_histories"]), 6)
+        self.assertEqual([history[-1, -1] for history in state["bankroll_histories"]], state["game_results"])
+        bands = quantile_bands(state["bankroll_histories"])
+        self.assertEqual(bands.shape, (5, len(main.bankroll_checkpoints(config)), 2))
+        self.assertTrue((np.diff(bands[:, -1, -1]) >= 0).all())
+        self.assertEqual(bands[2, -1, -1], np.median(state["game_results"]))
+
+class TestBatchedTables(unittest.TestCase):
+
+    def test_matches_object_model(self):
+        """Basic strategy on batched tables wins what Game's players win on the same shoes."""
+        strategy = CompiledStrategy(StrategyTable["MULTIDECK"])
+        for rules in (Rules(insurance=False), Rules(insurance=False, hit_split_aces=False, resplit_aces=False, double_on="10-11", resplit_till=3)):
+            random.seed(5)
+            shoes = [BlackjackShoe(6) for _ in range(20)]
+            tables = BatchedTables(20, 6, rules=rules, shoes=np.stack([card_values(shoe.cards) for shoe in shoes]),
+                                   cut_indices=[shoe.cut_index for shoe in shoes])
+            expected = []
+            for shoe in shoes:
+                player = Player(name="Test Player", strategy=StrategyTable["MULTIDECK"], bankroll=0, hands=[Hand()])
+                game = Game(6, [player], shoe=shoe, rules=rules)
+                winnings = []
+                while game.shoe is shoe:
+                    bankroll = player.bankroll
+                    game.play_round()
+                    winnings.append((player.bankroll - bankroll, shoe.deal_index))
+                expected.append(winnings)
+            for round_index in range(min(len(winnings) for winnings in expected)):
+                observation, rewards, done = tables.deal(10)
+                while not done.all():
+                    observation, step_rewards, done = tables.step(strategy_actions(strategy, observation))
+                    rewards += step_rewards
+                self.assertEqual(list(zip(rewards.tolist(), tables.deal_index.tolist())), [winnings[round_index] for winnings in expected])
+
+    def test_observation_and_legal_actions(self):
+        tables = BatchedTables(500, 6, seed=3)
+        observation, _, done = tables.deal(10)
+        playing = ~done
+        legal = observation["legal"]
+        self.assertFalse(legal[done].any())
+        self.assertTrue(legal[playing, STAND].all())
+        np.testing.assert_array_equal(legal[playing, DOUBLE], observation["num_cards"][playing] == 2)
+        np.testing.assert_array_equal(legal[playing, SPLIT], observation["pair"][playing] > 0)
+        # The hole card is the only card dealt that the seat has not seen
+        np.testing.assert_array_equal(observation["remaining"].sum(axis=1), 6 * 52 - tables.deal_index + np.where(done, 0, 1))
+        with self.assertRaises(ValueError):
+            tables.step(np.where(legal[:, SPLIT], HIT, SPLIT))
+        observation, _, _ = tables.step(np.full(500, HIT))
+        self.assertFalse(observation["legal"][~observation["done"], DOUBLE].any())
+
+class TestRollout(unittest.TestCase):
+
+    def test_stand_ev_matches_dealer_probabilities(self):
+        spot = Spot(["10", "10"], "6")
+        estimates = rollout(spot, actions=["STAND"], max_rollouts=4000, seed=2)
+        finish = dealer_probabilities(6, spot.composition, True)
+        # Win on a dealer bust, 17, 18 or 19, push on 20, lose on 21
+        exact = finish[5] + sum(finish[:3]) - finish[4]
+        self.assertEqual(estimates["STAND"].rollouts, 4000)
+        self.assertLess(abs(estimates["STAND"].ev - exact), 4 * estimates["STAND"].standard_error)
+
+    def test_common_seeds_and_early_stop(self):
+        spot = Spot(["10", "10"], "6", other_hands=[["9", "7"]])
+        estimates = rollout(spot, max_rollouts=20000, batch_size=500, seed=4)
+        self.assertEqual(set(estimates), {"HIT", "STAND", "DOUBLE", "SPLIT"})
+        self.assertEqual(max(estimates, key=lambda action: estimates[action].ev), "STAND")
+        self.assertLess(estimates["STAND"].rollouts, 20000)
+        self.assertEqual(rollout(spot, actions=["STAND", "SPLIT"], max_rollouts=400, batch_size=200, seed=4, processes=2),
+                         rollout(spot, actions=["STAND", "SPLIT"], max_rollouts=400, batch_size=200, seed=4))
+
+    def test_legal_actions(self):
+        self.assertEqual(Spot(["10", "6"], "10", rules=Rules(surrender="late")).legal_actions(), ["HIT", "STAND", "DOUBLE", "SURRENDER"])
+        self.assertEqual(Spot(["10", "2", "4"], "10").legal_actions(), ["HIT", "STAND"])
+        with self.assertRaises(ValueError):
+            rollout(Spot(["10", "6"], "10"), actions=["SPLIT"])
+        with self.assertRaises(ValueError):
+            Spot(["A", "10"], "6")
+
+class TestHandStates(unittest.TestCase):
+
+    def test_states_match_cards(self):
+        """Every hand of up to four cards has the total, softness, pair and state index its cards give."""
+        for length in range(1, 5):
+            for hand_ranks in itertools.product(["A", "2", "5", "6", "9", "10", "K"], repeat=length):
+                hand = Hand()
+                for rank in hand_ranks:
+                    hand.add_card(Card(rank, "Clubs"))
+                values = [hand_states.RANK_VALUES[rank] for rank in hand_ranks]
+                total = sum(values)
+                aces = values.count(11)
+                while total > 21 and aces:
+                    total -= 10
+                    aces -= 1
+                # Totals are only kept exactly up to MAX_HARD, which no hand that stops drawing at 21 passes
+                self.assertEqual((hand.value, hand.soft), (min(total, hand_states.MAX_HARD), aces > 0), hand_ranks)
+                pair = length == 2 and values[0] == values[1]
+                self.assertEqual(hand.is_pair(), pair, hand_ranks)
+                if 5 <= total <= 21:
+                    expected_index = 23 + values[0] if pair else 15 + total - 12 if aces else total - 5
+                    self.assertEqual(hand.get_state_index(), expected_index, hand_ranks)
+                self.assertEqual(hand.state, hand_states.hand_state(hand.cards))
+
+    def test_split_and_dealer_walk(self):
+        hand = Hand([Card("8", "Clubs"), Card("8", "Hearts")])
+        second = hand.split()
+        self.assertEqual((hand.value, second.value, hand.is_pair()), (8, 8, False))
+        hand.add_card(Card("8", "Spades"))
+        self.assertTrue(hand.is_pair())
+        stands = hand_states.DEALER_STANDS
+        soft_17 = hand_states.hand_state([Card("A", "Clubs"), Card("6", "Clubs")])
+        self.assertFalse(stands[True][soft_17])
+        self.assertTrue(stands[False][soft_17])
+        dealer = Dealer(hit_on_soft_17=True, hand=Hand([Card("A", "Clubs"), Card("6", "Clubs")]))
+        dealer.dealer_turn(BlackjackShoe(1, cards=[Card("2", "Clubs"), Card("K", "Clubs"), Card("9", "Clubs")]), Counter())
+        self.assertEqual((dealer.hand.value, len(dealer.hand.cards)), (19, 3))
+
+class TestShoeReplay(unittest.TestCase):
+
+    def test_read_text_shoes(self):
+        deck = create_single_deck()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shoes.csv")
+            with open(path, "w") as f:
+                f.write("# recorded at table 4\n\n")
+                f.write(",".join(card.rank + card.suit[0] for card in deck) + "\n")
+                f.write(" ".join("T" if card.rank == "10" else card.rank for card in reversed(deck)) + "\n")
+                f.write("A, K\n")
+            shoes = list(shoe_replay.read_shoes(path, num_decks=1, allow_partial=True))
+            self.assertEqual([card.code for card in shoes[0]], [card.code for card in deck])
+            self.assertEqual([card.rank for card in shoes[1]], [card.rank for card in reversed(deck)])
+            self.assertEqual(sorted(card.code for card in shoes[1]), list(range(52)))
+            self.assertEqual([card.rank for card in shoes[2][:2]], ["A", "K"])
+            self.assertEqual(sorted(card.code for card in shoes[2]), list(range(52)))
+            with self.assertRaisesRegex(ValueError, ":5: 2 cards"):
+                list(shoe_replay.read_shoes(path, num_decks=1))
+
+            with open(path, "w") as f:
+                f.write("AS AS\n")
+            with self.assertRaisesRegex(ValueError, ":1: More than 1 cards of A of Spades"):
+                list(shoe_replay.read_shoes(path, num_decks=1, allow_partial=True))
+            with open(path, "w") as f:
+                f.write("A A A A A\n")
+            with self.assertRaisesRegex(ValueError, "rank A"):
+                list(shoe_replay.read_shoes(path, num_decks=1, allow_partial=True))
+
+    def test_binary_round_trip(self):
+        shoes = [create_shoe(2) for _ in range(5)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shoes.bin")
+            shoe_replay.write_binary_shoes(path, shoes)
+            read = list(shoe_replay.read_shoes(path, num_decks=2, chunk_shoes=2))
+            self.assertEqual([[card.code for card in shoe] for shoe in read], [[card.code for card in shoe] for shoe in shoes])
+            with open(path, "r+b") as f:
+                f.write(bytes([0]))
+            with self.assertRaisesRegex(ValueError, "shoe 0"):
+                list(shoe_replay.read_shoes(path, num_decks=2))
+
+    def test_replay_games_over_the_same_shoes(self):
+        random.seed(3)
+        shoes = [create_shoe(6) for _ in range(4)]
+        read = []
+
+        def source():
+            for shoe in shoes:
+                read.append(shoe)
+                yield shoe
+        games = [Game(6, [Player(name="Player", strategy=StrategyTable["MULTIDECK"], bankroll=0)], hit_on_soft_17=hit)
+                 for hit in (False, True)]
+        random.seed(5)
+        self.assertEqual(shoe_replay.replay(games, source(), max_shoes=3), 3)
+        self.assertEqual(len(read), 3)
+        for game in games:
+            self.assertGreater(game.rounds_played, 3 * 30)
+            self.assertEqual(game.round_stats.n, game.rounds_played)
+            self.assertFalse(isinstance(game.shoe, shoe_replay.ReplayShoe))
+        # Replaying the same shoes with the same cut cards plays the same rounds
+        replayed = Game(6, [Player(name="Player", strategy=StrategyTable["MULTIDECK"], bankroll=0)], hit_on_soft_17=False)
+        random.seed(5)
+        shoe_replay.replay([replayed], iter(shoes[:3]))
+        self.assertEqual(replayed.rounds_played, games[0].rounds_played)
+        self.assertEqual(replayed.house_bankroll, games[0].house_bankroll)
+
+class TestShoeBank(unittest.TestCase):
+
+    def test_build_and_partition(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shoes.npy")
+            build_shoe_bank(path, 10, num_decks=2, seed=7, chunk_shoes=4)
+            bank = ShoeBank(path)
+            self.assertEqual((len(bank), bank.num_decks), (10, 2))
+            for codes, cut_index in zip(bank.cards, bank.cut_indices):
+                self.assertEqual(np.bincount(codes, minlength=52).tolist(), [2] * 52)
+                self.assertTrue(0 <= cut_index <= 104 - 62, cut_index)
+            other = os.path.join(directory, "other.npy")
+            build_shoe_bank(other, 10, num_decks=2, seed=7)
+            self.assertTrue(np.array_equal(np.load(other), np.load(path)))
+
+            parts = [bank.partition(i, 3) for i in range(3)]
+            self.assertEqual([(part.start, part.stop) for part in parts], [(0, 4), (4, 7), (7, 10)])
+            self.assertTrue(np.array_equal(parts[1].cards[0], bank.cards[4]))
+            with self.assertRaises(ValueError):
+                bank.partition(3, 3)
+
+            shoe = parts[2].shoe(2)
+            self.assertEqual([card.code for card in shoe.cards[:5]], bank.cards[9][:5].tolist())
+            self.assertEqual((parts[2].shoe(1).next_shoe().index, parts[2].shoe(1).next_shoe().cut_index), (2, bank.cut_indices[9]))
+            # A used up bank is never dealt again
+            with self.assertRaises(IndexError):
+                shoe.next_shoe()
+            copied = pickle.loads(pickle.dumps(shoe))
+            self.assertLess(len(pickle.dumps(shoe)), 1000)
+            self.assertEqual([card.code for card in copied.cards[:104]], bank.cards[9].tolist())
+
+    def test_runs_share_shoes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shoes.npy")
+            build_shoe_bank(path, 50, seed=1)
+            results = []
+            for engine in ("object", "object", "jit"):
+                game = Game(6, [Player(name="Player", strategy=StrategyTable["MULTIDECK"], bankroll=0)], engine=engine,
+                            shoe=ShoeBank(path).shoe())
+                game.play(500, print_summary=False)
+                self.assertIsInstance(game.shoe, BankShoe)
+                results.append((game.house_bankroll, game.shoe.index, game.shoe.deal_index))
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(results[0], results[2])
+
+            config = load_config()
+            config.update(games=2, rounds=200, shoe_bank={"path": path, "partition": [1, 2]})
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = main.run(main.new_state(config))
+            # Each game takes at least four shoes and the second carries on after the first
+            self.assertGreater(state["bank_index"], 7)
+
+class TestSharding(unittest.TestCase):
+
+    def test_shards_merge_exactly(self):
+        """The merged campaign should hold the merged statistics of its shards' own runs."""
+        config = load_config()
+        config.update(rounds=200, games=3, seed=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(sharding.plan_shards(config, tmp, 2), 2)
+            self.assertEqual(sorted(sharding.Worker(tmp, "a").run()), [0, 1])
+            merged = sharding.merge_results(tmp)
+            jobs = []
+            for index in range(2):
+                shard_config = dict(config, games=2 - index, seed=sharding.shard_seed(5, index))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    jobs.append(main.run(main.new_state(shard_config)))
+
+        self.assertEqual(merged["game_results"], jobs[0]["game_results"] + jobs[1]["game_results"])
+        expected = RunningStats().merge(jobs[0]["totals"]).merge(jobs[1]["totals"])
+        self.assertEqual(vars(merged["totals"]), vars(expected))
+        self.assertEqual(merged["totals"].n, 600)
+        jobs[0]["outcomes"].merge(jobs[1]["outcomes"])
+        self.assertTrue((merged["outcomes"].count == jobs[0]["outcomes"].count).all())
+
+    def test_abandoned_and_failed_shards_are_reclaimed(self):
+        config = load_config()
+        config.update(rounds=10, games=1, seed=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            sharding.plan_shards(config, tmp, 1)
+            claimed = sharding.Worker(tmp, "dead").claim()
+            self.assertIsNone(sharding.Worker(tmp, "b").claim())
+            os.utime(claimed, (0, 0))
+            worker = sharding.Worker(tmp, "b", lease=60)
+            claimed = worker.claim()
+            self.assertTrue(claimed.endswith("@b"))
+            with mock.patch("main.run", side_effect=RuntimeError("killed")):
+                with self.assertRaises(RuntimeError):
+                    worker.run_shard(claimed)
+            self.assertEqual(os.listdir(os.path.join(tmp, sharding.JOBS)), ["shard-0000.json"])
+            self.assertEqual(worker.run(), [0])
+            self.assertEqual(sharding.merge_results(tmp)["totals"].n, 10)
+
+            other = os.path.join(tmp, "other")
+            sharding.plan_shards(config, other, 1)
+            with self.assertRaises(RuntimeError):
+                sharding.merge_results(other)
+            self.assertEqual(sharding.merge_results(other, allow_missing=True)["missing_shards"], [0])
+
 if __name__ == "__main__":
     unittest.main()
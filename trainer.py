@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import itertools
+import json
+
+from deck import BlackjackShoe
+from counter import Counter
+from hand import Hand
+from player import dealer_upcard_value
+from strategies.strategy import StrategyTable
+from strategies.compiled import CompiledStrategy
+
+VALUE_MAP = {"A": 11, "K": 10, "Q": 10, "J": 10, "10": 10}
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+class TrainingSession:
+    """
+    One trainee at one table: a shoe, the count of every card shown so far and
+    the current spot. The hole card is only counted once it is revealed.
+    """
+    def __init__(self, strategy, num_decks=6, resplit_till=4, deviations=True):
+        for name, value in (("num_decks", num_decks), ("resplit_till", resplit_till)):
+            if not _is_int(value) or value < 1:
+                raise ValueError(f"{name} must be a positive integer, not {value!r}")
+        if not isinstance(deviations, bool):
+            raise ValueError(f"deviations must be true or false, not {deviations!r}")
+        self.strategy = strategy
+        self.num_decks = num_decks
+        self.resplit_till = resplit_till
+        self.deviations = deviations
+        self.counter = Counter()
+        # The shoe counts every card it deals, including the hole card, so it gets its own counter
+        self.shoe = BlackjackShoe(num_decks, counter=Counter())
+        self.hand = None
+        self.dealer_upcard = None
+        self.hole_card = None
+
+    def true_count(self):
+        return self.counter.get_high_low_count() / self.shoe.decks_left()
+
+    def deal(self):
+        """Deal a new spot: two player cards and the dealer upcard."""
+        if self.shoe.reshuffle_needed:
+            self.counter = Counter()
+            self.shoe = BlackjackShoe(self.num_decks, counter=Counter())
+        first = self.shoe.deal_card()
+        self.hole_card = self.shoe.deal_card()
+        second = self.shoe.deal_card()
+        self.dealer_upcard = self.shoe.deal_card()
+        self.hand = Hand([first, second])
+        for card in (first, second, self.dealer_upcard):
+            self.counter.update_count(card)
+        return {
+            "player": [_card_json(card) for card in self.hand.cards],
+            "dealer_upcard": _card_json(self.dealer_upcard),
+            "decks_left": self.shoe.decks_left(),
+        }
+
+    def advice(self):
+        """The correct action for the current spot and the current counts."""
+        if self.hand is None:
+            raise ValueError("No spot dealt")
+        true_count = self.true_count()
+        pair_value = 0
+        if self.hand.is_pair():
+            rank = self.hand.cards[0].rank
+            pair_value = VALUE_MAP.get(rank) or int(rank)
+        action = self.strategy.action(self.hand.value, self.hand.soft, pair_value, len(self.hand.cards),
+                                      dealer_upcard_value(self.dealer_upcard), true_count,
+                                      can_split=self.resplit_till > 1, use_deviations=self.deviations)
+        return {
+            "action": action,
+            "running_count": self.counter.get_high_low_count(),
+            "true_count": true_count,
+        }
+
+    def answer(self, action=None, running_count=None):
+        """
+        Grade the trainee's action and running count for the current spot,
+        then reveal the hole card and finish the spot.
+        """
+        if action is not None and not isinstance(action, str):
+            raise ValueError(f"action must be a string, not {action!r}")
+        if running_count is not None and not _is_int(running_count):
+            raise ValueError(f"running_count must be an integer, not {running_count!r}")
+        feedback = self.advice()
+        if action is not None:
+            feedback["action_correct"] = action.upper() == feedback["action"]
+        if running_count is not None:
+            feedback["count_correct"] = running_count == feedback["running_count"]
+        self.counter.update_count(self.hole_card)
+        feedback["hole_card"] = _card_json(self.hole_card)
+        self.hand = None
+        return feedback
+
+
+def _is_int(value):
+    # JSON true and false arrive as bools, which are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _card_json(card):
+    return {"rank": card.rank, "suit": card.suit}
+
+
+class TrainerService:
+    """
+    Routes requests to training sessions. Every session shares one compiled
+    strategy, so a request is a few table lookups.
+
+    POST   /sessions                 {"num_decks": 6, "deviations": true} -> {"session": id}
+    POST   /sessions/<id>/deal       -> the new spot
+    GET    /sessions/<id>/advice     -> correct action and counts
+    POST   /sessions/<id>/answer     {"action": "HIT", "running_count": 3} -> feedback
+    DELETE /sessions/<id>
+    """
+    def __init__(self, strategy=StrategyTable["MULTIDECK"]):
+        self.strategy = CompiledStrategy(strategy)
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    def handle(self, method, path, body=None):
+        """Return (status, response dict) for one request."""
+        body = {} if body is None else body
+        if not isinstance(body, dict):
+            return 400, {"error": "The request body must be a JSON object"}
+        parts = [part for part in path.split("/") if part]
+        if not parts or parts[0] != "sessions":
+            return 404, {"error": "Not found"}
+        try:
+            if len(parts) == 1:
+                if method != "POST":
+                    return 404, {"error": "Not found"}
+                session_id = next(self._ids)
+                self.sessions[session_id] = TrainingSession(self.strategy, num_decks=body.get("num_decks", 6),
+                                                            resplit_till=body.get("resplit_till", 4),
+                                                            deviations=body.get("deviations", True))
+                return 200, {"session": session_id}
+            session_id = int(parts[1])
+            if session_id not in self.sessions:
+                return 404, {"error": f"Unknown session {session_id}"}
+            session = self.sessions[session_id]
+            command = parts[2] if len(parts) > 2 else None
+            if command is None and method == "DELETE":
+                del self.sessions[session_id]
+                return 200, {}
+            elif command == "deal" and method == "POST":
+                return 200, session.deal()
+            elif command == "advice" and method == "GET":
+                return 200, session.advice()
+            elif command == "answer" and method == "POST":
+                return 200, session.answer(body.get("action"), body.get("running_count"))
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        return 404, {"error": "Not found"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it alive between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                try:
+                    method, path, _ = request_line.decode().split(" ", 2)
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode().partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # The rest of the stream can't be framed, so the connection ends here
+                    await self._respond(writer, 400, {"error": "Malformed request"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, response = self.handle(method, path, json.loads(body) if body else None)
+                except ValueError:
+                    # Invalid JSON or UTF-8
+                    status, response = 400, {"error": "Invalid JSON"}
+                await self._respond(writer, status, response)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, response):
+        payload = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local blackjack trainer giving the correct action and count.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(TrainerService().serve(args.host, args.port))
@@ -0,0 +1,185 @@
+import copy
+import math
+import random
+from collections import defaultdict
+
+import numpy as np
+
+from counter import Counter
+from deck import BlackjackShoe, create_single_deck
+from player import dealer_upcard_value
+from stratified import StratifiedSampler
+from strategies.generator import VALUES, full_composition, dealer_probabilities
+
+# Columns of the per round control variates
+CONTROLS = ["player_blackjacks", "dealer_blackjack", "dealer_bust"]
+
+
+def antithetic_shoes(num_decks):
+    """
+    Two shoes shuffled from the same uniforms u and 1 - u, sharing one cut card position.
+    Each is a correctly shuffled shoe on its own; the pair's results are only as
+    anticorrelated as the mirrored card orders make them, so compare the estimates.
+    """
+    shoe = BlackjackShoe(num_decks)
+    template = [card for _ in range(num_decks) for card in create_single_deck()]
+    first, second = list(template), list(template)
+    for i in range(len(template) - 1, 0, -1):
+        u = random.random()
+        j = int(u * (i + 1))
+        first[i], first[j] = first[j], first[i]
+        j = min(int((1 - u) * (i + 1)), i)
+        second[i], second[j] = second[j], second[i]
+    shoe.cards = first
+    other = copy.copy(shoe)
+    other.cards = second
+    return shoe, other
+
+
+def dealer_bust_probabilities(num_decks, hit_on_soft_17):
+    """Chance the dealer busts for each upcard value 2..11 from a full shoe, given no dealer blackjack."""
+    shoe = full_composition(num_decks)
+    probabilities = {}
+    for up in VALUES:
+        composition = tuple(count - (value == up) for value, count in zip(VALUES, shoe))
+        probabilities[up] = dealer_probabilities(up, composition, hit_on_soft_17)[-1]
+    return probabilities
+
+
+def true_count_frequencies(game, depth_step=13):
+    """Natural share of rounds at each rounded high-low true count for the game's shoe."""
+    sampler = StratifiedSampler(game, depth_step=depth_step)
+    frequencies = defaultdict(float)
+    for _, _, true_count, weight in sampler.states(range(-60, 61)):
+        frequencies[true_count] += weight
+    total = sum(frequencies.values())
+    return {true_count: weight / total for true_count, weight in frequencies.items()}
+
+
+class VarianceReducedRun:
+    """
+    Plays rounds at a game's table while recording what the variance reduced
+    estimators need, then reports the house profit per round with and without them:
+
+    raw: plain mean of the round profits.
+    antithetic: with antithetic=True shoes are played in u / 1 - u pairs and each pair is
+        one sample of a ratio estimator.
+    control_variates: profit regressed on mean zero controls: player and dealer naturals
+        minus their probability given the cards left at the deal (exactly mean zero), and
+        dealer busts minus the full shoe bust rate for the upcard (mean zero up to the cut
+        card effect).
+    post_stratified: mean profit per rounded true count weighted by each count's natural
+        frequency (see true_count_frequencies) instead of the frequency in the sample.
+        Counts with a single round are pooled with the nearest count that has more.
+    """
+    def __init__(self, game, antithetic=False, depth_step=13):
+        if game.engine != "object":
+            raise ValueError("Variance reduced runs need the object engine")
+        self.game = game
+        self.antithetic = antithetic
+        self.depth_step = depth_step
+        self.bust_probabilities = dealer_bust_probabilities(game.num_decks, game.dealer.hit_on_soft_17)
+        self.profits = []
+        self.true_counts = []
+        self.controls = []
+        # (profit, rounds) of each antithetic shoe pair
+        self.pairs = []
+
+    def play(self, rounds):
+        """Play at least rounds rounds; antithetic runs play whole shoe pairs."""
+        if not self.antithetic:
+            for _ in range(rounds):
+                self._play_round()
+            return self
+        played = 0
+        while played < rounds:
+            pair_profit = 0
+            pair_rounds = 0
+            for shoe in antithetic_shoes(self.game.num_decks):
+                self.game.shoe = shoe
+                self.game.counter = Counter()
+                while self.game.shoe is shoe:
+                    pair_profit += self._play_round()
+                    pair_rounds += 1
+            self.pairs.append((pair_profit, pair_rounds))
+            played += pair_rounds
+        return self
+
+    def _play_round(self):
+        game = self.game
+        shoe = game.shoe
+        first_card_index = shoe.deal_index
+        remaining = len(shoe.cards) - first_card_index
+        unseen = shoe.cards[first_card_index:]
+        aces = sum(card.rank == "A" for card in unseen)
+        tens = sum(card.rank in ("10", "J", "Q", "K") for card in unseen)
+        natural_probability = 2 * aces * tens / (remaining * (remaining - 1))
+
+        game_round, true_count = game.play_round()
+        num_seats = len(game_round.players)
+        naturals = 0
+        for seat in range(num_seats):
+            first, second = shoe.cards[first_card_index + seat], shoe.cards[first_card_index + num_seats + 1 + seat]
+            naturals += dealer_upcard_value(first) + dealer_upcard_value(second) == 21
+        dealer_hand = game_round.dealer.hand
+        dealer_blackjack = len(dealer_hand.cards) == 2 and dealer_hand.value == 21
+        dealer_bust = 0.0
+        if not dealer_blackjack:
+            dealer_bust = (dealer_hand.value > 21) - self.bust_probabilities[dealer_upcard_value(dealer_hand.cards[1])]
+
+        self.profits.append(game_round.dealer_profit)
+        self.true_counts.append(true_count)
+        self.controls.append((naturals - num_seats * natural_probability, dealer_blackjack - natural_probability, dealer_bust))
+        return game_round.dealer_profit
+
+    def estimates(self):
+        """
+        :return: Dict of estimator name -> (house profit per round, standard error).
+        """
+        profits = np.asarray(self.profits, dtype=np.float64)
+        n = profits.size
+        if n < 3:
+            raise ValueError("Need at least 3 rounds")
+        results = {"raw": (float(profits.mean()), float(profits.std(ddof=1)) / math.sqrt(n))}
+
+        if self.pairs:
+            pair_profits = np.array([profit for profit, _ in self.pairs], dtype=np.float64)
+            pair_rounds = np.array([rounds for _, rounds in self.pairs], dtype=np.float64)
+            ratio = float(pair_profits.sum() / pair_rounds.sum())
+            standard_error = math.inf
+            if len(self.pairs) > 1:
+                residuals = pair_profits - ratio * pair_rounds
+                standard_error = math.sqrt(float((residuals ** 2).sum()) / (len(self.pairs) * (len(self.pairs) - 1))) / float(pair_rounds.mean())
+            results["antithetic"] = (ratio, standard_error)
+
+        controls = np.asarray(self.controls, dtype=np.float64)
+        design = np.column_stack([np.ones(n), controls])
+        coefficients, _, _, _ = np.linalg.lstsq(design, profits, rcond=None)
+        residuals = profits - design @ coefficients
+        # The controls have mean zero, so the intercept is the adjusted mean
+        results["control_variates"] = (float(coefficients[0]), math.sqrt(float((residuals ** 2).sum()) / (n - design.shape[1]) / n))
+
+        frequencies = true_count_frequencies(self.game, self.depth_step)
+        count_keys = np.rint(self.true_counts).astype(np.int64)
+        # Counts never reached in the sample are left out and the rest reweighted
+        strata = {count: [profits[count_keys == count], frequencies[count]]
+                  for count in np.unique(count_keys).tolist() if frequencies.get(count, 0.0) > 0.0}
+        # A count with a single round has no variance of its own, so it is pooled with
+        # the nearest count that has more rounds (or, if none has, with the most frequent count)
+        targets = [count for count, (stratum, _) in strata.items() if stratum.size > 1]
+        if not targets:
+            targets = [max(strata, key=lambda count: strata[count][1])]
+        for count in [count for count, (stratum, _) in strata.items() if count not in targets and stratum.size == 1]:
+            stratum, frequency = strata.pop(count)
+            target = min(targets, key=lambda other: (abs(other - count), abs(other)))
+            strata[target][0] = np.concatenate([strata[target][0], stratum])
+            strata[target][1] += frequency
+        mean = 0.0
+        variance = 0.0
+        weight = 0.0
+        for stratum, frequency in strata.values():
+            weight += frequency
+            mean += frequency * float(stratum.mean())
+            variance += frequency * frequency * (float(stratum.var(ddof=1)) / stratum.size if stratum.size > 1 else math.inf)
+        results["post_stratified"] = (mean / weight, math.sqrt(variance) / weight)
+        return results
@@ -0,0 +1,191 @@
+import copy
+import math
+import random
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from deck import BlackjackShoe
+from game import Game, BLACKJACKTHREETOTWOPAYOUT
+from stats import RunningStats, z_score
+
+# One played round as an engine reports it:
+# profit: house profit, earnings: each seat's winnings, actions: (seat, hand, action) of every
+# player decision in order, cards_dealt: deal index after the round, true_count: high-low before the deal
+RoundRecord = namedtuple("RoundRecord", ["profit", "earnings", "actions", "cards_dealt", "true_count"])
+Mismatch = namedtuple("Mismatch", ["seed", "round", "field", "reference", "alternative"])
+
+
+def reference_engine(players, shoe, rules):
+    """
+    Play one shoe to the cut card with the object model (Game.play_round and BlackjackRound).
+    The players' get_action is wrapped to record their decisions, so pass players used nowhere else.
+    :return: A RoundRecord per round.
+    """
+    game = Game(shoe.num_decks, players, shoe=shoe, **rules)
+    actions = []
+    for seat, player in enumerate(players):
+        player.get_action = _recording_action(player, seat, actions)
+    records = []
+    while game.shoe is shoe:
+        bankrolls = [player.bankroll for player in players]
+        del actions[:]
+        game_round, true_count = game.play_round()
+        earnings = tuple(player.bankroll - bankroll for player, bankroll in zip(players, bankrolls))
+        records.append(RoundRecord(game_round.dealer_profit, earnings, tuple(actions), shoe.deal_index, true_count))
+    return records
+
+
+def _recording_action(player, seat, actions):
+    get_action = player.get_action
+
+    def recorded(hand, dealer_card, resplit_till, true_count):
+        action = get_action(hand, dealer_card, resplit_till, true_count)
+        hand_index = next(i for i, player_hand in enumerate(player.hands) if player_hand is hand)
+        actions.append((seat, hand_index, action))
+        return action
+    return recorded
+
+
+def kernel_engine(players, shoe, rules):
+    """Play one shoe to the cut card with the compiled kernel, a round per call so each seat's winnings can be read back."""
+    from kernel import KernelTables, TRACE_ACTIONS, card_values, play_shoe
+
+    tables = KernelTables(players)
+    cards = card_values(shoe.cards)
+    counts = np.zeros(2, dtype=np.int64)
+    position = np.array([shoe.deal_index, 0], dtype=np.int64)
+    profit = np.zeros(1)
+    true_count = np.zeros(1)
+    trace = np.zeros((64 * len(players), 4), dtype=np.int64)
+    trace_length = np.zeros(1, dtype=np.int64)
+    records = []
+    while position[1] == 0:
+        earnings = np.zeros(len(players))
+        trace_length[0] = 0
+        play_shoe(cards, shoe.cut_index, shoe.num_decks, counts, position, 1, tables,
+                  rules.get("hit_on_soft_17", True), rules.get("resplit_till", 4),
+                  rules.get("blackjack_payout", BLACKJACKTHREETOTWOPAYOUT), profit, true_count, earnings, trace, trace_length)
+        actions = tuple((seat, hand, TRACE_ACTIONS[action]) for _, seat, hand, action in trace[:trace_length[0]].tolist())
+        records.append(RoundRecord(float(profit[0]), tuple(earnings.tolist()), actions, int(position[0]), float(true_count[0])))
+    return records
+
+
+class DifferentialHarness:
+    """
+    Checks an alternative engine against the reference object model.
+
+    An engine is a function engine(players, shoe, rules) that plays one shoe to the cut card
+    and returns a RoundRecord per round; see reference_engine and kernel_engine. rules are
+    Game's rule keywords (hit_on_soft_17, resplit_till, blackjack_payout).
+
+    compare_exact deals both engines the same seeded shoes and reports every field of every
+    round that differs. compare_statistics plays independent shoes on each engine and tests
+    whether the house profit per round is equivalent, for engines that do not deal the same
+    cards (or to catch drift too small to show up in a few exact shoes).
+    """
+    def __init__(self, make_players, num_decks=6, engine=kernel_engine, reference=reference_engine, **rules):
+        """
+        :param make_players: Returns a fresh list of Players; each engine gets its own.
+        """
+        self.make_players = make_players
+        self.num_decks = num_decks
+        self.engine = engine
+        self.reference = reference
+        self.rules = rules
+
+    def seeded_shoe(self, seed):
+        random.seed(seed)
+        return BlackjackShoe(self.num_decks)
+
+    def compare_shoe(self, seed):
+        """Play the shoe of seed on both engines. Returns the Mismatches, empty when they agree."""
+        shoe = self.seeded_shoe(seed)
+        reference = self.reference(self.make_players(), copy.copy(shoe), self.rules)
+        alternative = self.engine(self.make_players(), copy.copy(shoe), self.rules)
+        mismatches = []
+        if len(reference) != len(alternative):
+            mismatches.append(Mismatch(seed, None, "rounds", len(reference), len(alternative)))
+        for i, (expected, actual) in enumerate(zip(reference, alternative)):
+            for field in RoundRecord._fields:
+                if getattr(expected, field) != getattr(actual, field):
+                    mismatches.append(Mismatch(seed, i, field, getattr(expected, field), getattr(actual, field)))
+            if mismatches:
+                # Everything after the first diverging round differs anyway
+                break
+        return mismatches
+
+    def compare_exact(self, seeds):
+        """Mismatches over the shoes of all seeds."""
+        mismatches = []
+        for seed in seeds:
+            mismatches.extend(self.compare_shoe(seed))
+        return mismatches
+
+    def play_rounds(self, engine, rounds, seed):
+        """House profit of at least rounds rounds on engine, over shoes drawn from seed."""
+        random.seed(seed)
+        profits = []
+        while len(profits) < rounds:
+            shoe = BlackjackShoe(self.num_decks)
+            state = random.getstate()
+            profits.extend(record.profit for record in engine(self.make_players(), shoe, self.rules))
+            # Shoes depend only on the seed, not on what the engine draws while playing
+            random.setstate(state)
+        return profits
+
+    def compare_statistics(self, rounds=100000, margin=0.1, confidence=0.95, seeds=(1, 2)):
+        """
+        Equivalence test of the mean house profit per round on independent shoes.
+
+        Two one-sided tests (TOST): the engines count as equivalent when the confidence
+        interval of the difference in means lies within +/- margin. The ordinary two-sided
+        test of a difference and a chi-square test on the distribution of round results are
+        reported alongside.
+        :param margin: Largest difference in mean house profit per round (in chips) still equivalent.
+        :param seeds: Seeds of the reference's and the engine's shoes.
+        :return: Dict with the means, difference, interval, p-values and equivalent.
+        """
+        reference = np.asarray(self.play_rounds(self.reference, rounds, seeds[0]))
+        alternative = np.asarray(self.play_rounds(self.engine, rounds, seeds[1]))
+        reference_stats = RunningStats().update(reference)
+        alternative_stats = RunningStats().update(alternative)
+        difference = alternative_stats.mean - reference_stats.mean
+        standard_error = math.hypot(reference_stats.standard_error(), alternative_stats.standard_error())
+        # A 1 - 2 alpha interval inside the margin is the same as both one-sided tests rejecting at alpha
+        half_width = z_score(1 - 2 * (1 - confidence)) * standard_error
+        normal = NormalDist()
+        return {
+            "reference_mean": reference_stats.mean,
+            "alternative_mean": alternative_stats.mean,
+            "difference": difference,
+            "interval": (difference - half_width, difference + half_width),
+            "difference_p_value": 2 * normal.cdf(-abs(difference) / standard_error) if standard_error > 0 else 1.0,
+            "distribution_p_value": results_distribution_p_value(reference, alternative),
+            "equivalent": abs(difference) + half_width <= margin,
+        }
+
+
+def results_distribution_p_value(first, second, min_expected=5):
+    """
+    p-value of a chi-square test that two samples of round results come from the same
+    distribution. Results too rare to test (expected count below min_expected) are pooled,
+    and the chi-square tail uses the Wilson-Hilferty normal approximation.
+    """
+    values, inverse = np.unique(np.concatenate([first, second]), return_inverse=True)
+    table = np.zeros((2, values.size))
+    np.add.at(table[0], inverse[:len(first)], 1)
+    np.add.at(table[1], inverse[len(first):], 1)
+    expected = table.sum(axis=0) * table.sum(axis=1, keepdims=True) / table.sum()
+    common = expected.min(axis=0) >= min_expected
+    table = np.column_stack([table[:, common], table[:, ~common].sum(axis=1)])
+    if table[:, -1].sum() == 0:
+        table = table[:, :-1]
+    degrees = table.shape[1] - 1
+    if degrees < 1:
+        return 1.0
+    expected = table.sum(axis=0) * table.sum(axis=1, keepdims=True) / table.sum()
+    statistic = float(((table - expected) ** 2 / expected).sum())
+    z = ((statistic / degrees) ** (1 / 3) - (1 - 2 / (9 * degrees))) / math.sqrt(2 / (9 * degrees))
+    return 1 - NormalDist().cdf(z)
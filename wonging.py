@@ -0,0 +1,71 @@
+from stats import RunningStats
+
+
+class TableScanner:
+    """
+    A back-counter watching one or more tables and playing at most one of them.
+
+    Every step each table deals one round. While not seated the player only counts:
+    the tables advance with Game.fast_forward_round. When a table's high-low true
+    count before the deal reaches wong_in, the player sits at the best such table and
+    plays full rounds there until its true count drops below wong_out (or, with
+    wong_out=None, until the shoe is reshuffled), then goes back to watching.
+
+    Each table is a Game; the tables can share the same Player objects, since the
+    player only ever plays at one of them at a time.
+    """
+    def __init__(self, games, wong_in=2, wong_out=0, seats=None):
+        """
+        :param games: The tables, one Game each.
+        :param wong_in: True count at which the player sits down.
+        :param wong_out: True count below which the player leaves, or None to stay until the shuffle.
+        :param seats: Hands dealt at a table while the player watches (default: its number of players).
+        """
+        self.games = list(games)
+        self.wong_in = wong_in
+        self.wong_out = wong_out
+        self.seats = seats
+        # Index of the table the player is seated at, or None while watching
+        self.seated = None
+        self.rounds_played = [0] * len(self.games)
+        self.rounds_watched = [0] * len(self.games)
+        # House profit of the rounds the player played
+        self.profits = []
+        self.true_counts = []
+        self.round_stats = RunningStats()
+
+    def step(self):
+        """Deal one round at every table. Returns the house profit of the played round, or None."""
+        true_counts = [game.get_estimated_high_low_true_count() for game in self.games]
+        if self.seated is not None and self.wong_out is not None and true_counts[self.seated] < self.wong_out:
+            self.seated = None
+        if self.seated is None:
+            best = max(range(len(self.games)), key=lambda table: true_counts[table])
+            if true_counts[best] >= self.wong_in:
+                self.seated = best
+
+        profit = None
+        for table, game in enumerate(self.games):
+            if table == self.seated:
+                shoe = game.shoe
+                game_round, true_count = game.play_round()
+                profit = game_round.dealer_profit
+                self.profits.append(profit)
+                self.true_counts.append(true_count)
+                self.rounds_played[table] += 1
+                if game.shoe is not shoe:
+                    # Nobody waits through a shuffle
+                    self.seated = None
+            else:
+                game.fast_forward_round(self.seats)
+                self.rounds_watched[table] += 1
+        return profit
+
+    def run(self, steps):
+        """Deal steps rounds at every table and return the house profits of the rounds played."""
+        start = len(self.profits)
+        for _ in range(steps):
+            self.step()
+        profits = self.profits[start:]
+        self.round_stats.update(profits)
+        return profits